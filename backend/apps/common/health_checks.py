@@ -235,6 +235,8 @@ class HealthCheckService:
         """Verifica el estado de los modelos de ML."""
         try:
             from apps.predictions.services import PredictionService
+            from ml_models.registry import model_registry
+            from ml_models.warmup import warmup_state
             
             service = PredictionService()
             
@@ -267,7 +269,9 @@ class HealthCheckService:
                 'details': {
                     'model_loaded': model_loaded,
                     'scaler_loaded': scaler_loaded,
-                    'service_class': service.__class__.__name__
+                    'service_class': service.__class__.__name__,
+                    'registry': model_registry.stats(),
+                    'warmup': warmup_state.as_dict()
                 }
             }
             
@@ -459,8 +463,17 @@ def ready_check_view(request):
     """
     Endpoint simplificado para verificar si el sistema está listo.
     Usado por load balancers y orchestrators.
+
+    El worker no está listo hasta completar el calentamiento de modelos; si
+    no se lanzó al arrancar (ML_WARMUP_ON_STARTUP), la primera sonda lo
+    inicia en segundo plano.
     """
     try:
+        from ml_models.warmup import start_warm_up, warmup_state
+
+        if not warmup_state.completed:
+            start_warm_up()
+
         # Verificar solo componentes críticos
         critical_checks = ['database']
         results = {}
@@ -469,25 +482,26 @@ def ready_check_view(request):
             if check_name in health_service.checks:
                 results[check_name] = health_service.checks[check_name]()
         
-        # Si todos los checks críticos pasan, sistema está listo
-        all_critical_healthy = all(
-            result.get('score', 0) >= 70 
-            for result in results.values()
-        )
+        critical_issues = [
+            name for name, result in results.items()
+            if result.get('score', 0) < 70
+        ]
+        if not warmup_state.completed:
+            critical_issues.append('ml_warmup')
         
-        if all_critical_healthy:
+        # Si todos los checks críticos pasan y los modelos están calientes, sistema está listo
+        if not critical_issues:
             return JsonResponse({
                 'status': 'ready',
-                'timestamp': timezone.now().isoformat()
+                'timestamp': timezone.now().isoformat(),
+                'warmup': warmup_state.as_dict()
             })
         else:
             return JsonResponse({
                 'status': 'not_ready',
                 'timestamp': timezone.now().isoformat(),
-                'critical_issues': [
-                    name for name, result in results.items()
-                    if result.get('score', 0) < 70
-                ]
+                'critical_issues': critical_issues,
+                'warmup': warmup_state.as_dict()
             }, status=503)
             
     except Exception as e:
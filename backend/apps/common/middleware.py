@@ -336,3 +336,19 @@ class RequestLoggingMiddleware(MiddlewareMixin):
             )
         
         return response
+
+
+class ModelReloadMiddleware(MiddlewareMixin):
+    """
+    Comprueba periódicamente si hay versiones nuevas de los modelos de ML
+    (ver ml_models/hot_reload.py). La recarga corre en segundo plano y se
+    sustituye de forma atómica: ninguna petición espera ni se descarta.
+    """
+
+    def process_request(self, request):
+        from ml_models.hot_reload import model_reload_watcher
+
+        try:
+            model_reload_watcher.schedule()
+        except Exception as e:
+            logger.error(f"Error programando la recarga de modelos: {e}")
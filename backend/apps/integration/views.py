@@ -159,6 +159,7 @@ class IntegrationViewSet(viewsets.ViewSet):
         
         results = []
         errors = []
+        pending = []
         
         for external_id in external_patient_ids:
             try:
@@ -179,9 +180,18 @@ class IntegrationViewSet(viewsets.ViewSet):
                     errors.append(f"Paciente {external_id} sin registros médicos")
                     continue
                 
-                # Realizar predicción
-                prediction_result = cardiovascular_predictor.predict_cardiovascular_risk(latest_record)
+                pending.append((external_id, patient, latest_record))
                 
+            except Exception as e:
+                errors.append(f"Error procesando paciente {external_id}: {str(e)}")
+        
+        # Realizar todas las predicciones en una única inferencia vectorizada
+        prediction_results = cardiovascular_predictor.predict_many(
+            [latest_record for _, _, latest_record in pending]
+        )
+        
+        for (external_id, patient, latest_record), prediction_result in zip(pending, prediction_results):
+            try:
                 # Guardar predicción
                 prediction = Prediction.objects.create(
                     patient=patient,
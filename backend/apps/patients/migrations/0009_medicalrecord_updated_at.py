@@ -0,0 +1,18 @@
+# Generated by Django 3.2.24 on 2026-10-17 07:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0008_alter_medicalrecord_frecuencia_cardiaca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -82,9 +82,13 @@ class Patient(models.Model):
             if not (100 <= self.altura <= 250):
                 raise ValidationError({'altura': 'La altura debe estar entre 100 y 250 cm'})
     
-    def save(self, *args, **kwargs):
-        """Override save para ejecutar validaciones"""
-        self.full_clean()
+    def save(self, *args, clean=True, **kwargs):
+        """
+        Override save para ejecutar validaciones. `clean=False` cuando el
+        llamador ya validó la instancia (escritura de /predict/)
+        """
+        if clean:
+            self.full_clean()
         super().save(*args, **kwargs)
     
     @property
@@ -164,6 +168,7 @@ class MedicalRecord(models.Model):
     # Metadatos
     fecha_registro = models.DateTimeField(default=timezone.now)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-fecha_registro']
@@ -217,13 +222,17 @@ class MedicalRecord(models.Model):
         if errors:
             raise ValidationError(errors)
     
-    def save(self, *args, **kwargs):
-        """Override save para ejecutar validaciones"""
+    def save(self, *args, clean=True, **kwargs):
+        """
+        Override save para ejecutar validaciones. `clean=False` cuando el
+        llamador ya validó la instancia (escritura de /predict/)
+        """
         # Auto-calcular edad si no se proporciona
         if not self.edad and self.patient and self.patient.fecha_nacimiento:
             self.edad = self.patient.age
         
-        self.full_clean()
+        if clean:
+            self.full_clean()
         super().save(*args, **kwargs)
         
         # Log de alertas médicas críticas
@@ -55,6 +55,9 @@ class PatientSerializer(serializers.ModelSerializer):
         return None
 
 class PatientListSerializer(serializers.ModelSerializer):
+    # Forma parte de la clave del listado cacheado: incrementar al cambiar los campos
+    cache_version = 1
+
     nombre_completo = serializers.ReadOnlyField()
     imc = serializers.ReadOnlyField()
     ultimo_registro = serializers.SerializerMethodField()
@@ -69,14 +72,22 @@ class PatientListSerializer(serializers.ModelSerializer):
             'telefono', 'email', 'direccion'
         ]
 
+    # `latest_records` y `latest_predictions` los prepara el queryset del
+    # listado (PatientViewSet.get_queryset); sin ellos se consulta por paciente
+
     def get_ultimo_registro(self, obj):
+        if hasattr(obj, 'latest_records'):
+            return obj.latest_records[0].fecha_registro if obj.latest_records else None
         latest_record = obj.medical_records.order_by('-fecha_registro').first()
         return latest_record.fecha_registro if latest_record else None
 
     def get_riesgo_actual(self, obj):
         try:
-            from apps.predictions.models import Prediction
-            latest_prediction = Prediction.objects.filter(patient=obj).order_by('-created_at').first()
+            if hasattr(obj, 'latest_predictions'):
+                latest_prediction = obj.latest_predictions[0] if obj.latest_predictions else None
+            else:
+                from apps.predictions.models import Prediction
+                latest_prediction = Prediction.objects.filter(patient=obj).order_by('-created_at').first()
             if latest_prediction:
                 from apps.predictions.serializers import PredictionSerializer
                 return PredictionSerializer(latest_prediction).data
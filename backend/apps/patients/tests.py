@@ -0,0 +1,128 @@
+import datetime
+import json
+
+from django.core.cache import caches
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.patients.models import MedicalRecord, Patient
+from apps.patients.serializers import PatientListSerializer
+from apps.patients.views import PatientViewSet
+from apps.predictions.models import Prediction
+
+# Consultas de una página del listado, sea cual sea su tamaño: COUNT de la
+# paginación, página, prefetch del último registro y de la última predicción
+PATIENT_LIST_MAX_QUERIES = 4
+
+LOCMEM_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': alias}
+    for alias in ('default', 'sessions', 'predictions')
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PatientListQueryTests(TestCase):
+    """El listado de pacientes ejecuta un número constante de consultas (sin N+1)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='medico', password='x')
+
+    def _create_cohort(self, tag, size):
+        """Pacientes con dos registros y dos predicciones; la más reciente es la de riesgo Alto"""
+        now = timezone.now()
+        patients = [
+            Patient(
+                dni=f'{tag}{index:03d}', numero_historia=f'HC-{tag}{index:03d}',
+                nombre=f'Paciente {index}', apellidos=f'{tag} Consultas',
+                fecha_nacimiento=datetime.date(1960 + index, 1 + index % 12, 1 + index % 28),
+                sexo='M' if index % 2 else 'F', peso=70 + index, altura=165, medico_tratante=self.user,
+            )
+            for index in range(size)
+        ]
+        Patient.objects.bulk_create(patients)
+
+        records = [
+            MedicalRecord(
+                patient=patient, edad=50, presion_sistolica=130 + index, presion_diastolica=85,
+                colesterol=210, glucosa=100, fecha_registro=now - datetime.timedelta(days=days_ago, minutes=index),
+            )
+            for index, patient in enumerate(patients)
+            for days_ago in (30, 2)
+        ]
+        MedicalRecord.objects.bulk_create(records)
+
+        predictions = [
+            Prediction(
+                patient=record.patient, medical_record=record,
+                riesgo_nivel='Alto' if position % 2 else 'Bajo', probabilidad=70.0 if position % 2 else 20.0,
+            )
+            for position, record in enumerate(records)
+        ]
+        Prediction.objects.bulk_create(predictions)
+        # created_at es auto_now_add: se fija después para que el orden sea el de los registros
+        for prediction in predictions:
+            Prediction.objects.filter(pk=prediction.pk).update(created_at=prediction.medical_record.fecha_registro)
+
+    def _list(self, tag):
+        request = APIRequestFactory().get('/api/patients/', {'search': tag, 'refresh': '1'})
+        force_authenticate(request, user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = PatientViewSet.as_view({'get': 'list'})(request)
+            response.render()
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['results'], len(queries)
+
+    def test_constant_queries_and_latest_prediction(self):
+        for tag, size in (('QRYS', 2), ('QRYL', 10)):
+            with self.subTest(size=size):
+                self._create_cohort(tag, size)
+                rows, queries = self._list(tag)
+                self.assertEqual(queries, PATIENT_LIST_MAX_QUERIES)
+                self.assertEqual(len(rows), size)
+                self.assertTrue(all(row['riesgo_actual']['riesgo_nivel'] == 'Alto' for row in rows))
+
+                # Referencia: el serializador sin el queryset optimizado (consultas por paciente)
+                reference = PatientListSerializer(
+                    Patient.objects.filter(apellidos__icontains=tag).order_by('-created_at'), many=True,
+                ).data
+                self.assertEqual(rows, json.loads(JSONRenderer().render(reference)))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PatientListResponseCacheTests(TestCase):
+    """IntelligentCacheMiddleware sirve el listado desde cache para clientes con JWT"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='medico', email='medico@example.com', password='x')
+        cls.other_user = get_user_model().objects.create_user(username='otro', email='otro@example.com', password='x')
+
+    def setUp(self):
+        for alias in LOCMEM_CACHES:
+            caches[alias].clear()
+
+    def _client(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def test_second_get_is_a_hit(self):
+        client = self._client(self.user)
+        first = client.get('/api/patients/')
+        second = client.get('/api/patients/')
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertNotEqual(first.get('X-Cache-Status'), 'HIT')
+        self.assertEqual(second['X-Cache-Status'], 'HIT')
+
+    def test_cached_list_is_per_user_and_needs_authentication(self):
+        self._client(self.user).get('/api/patients/')
+        self.assertNotEqual(self._client(self.other_user).get('/api/patients/').get('X-Cache-Status'), 'HIT')
+        self.assertEqual(self._client().get('/api/patients/').status_code, 401)
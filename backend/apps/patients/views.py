@@ -14,10 +14,14 @@ from .serializers import (
     PatientSerializer, PatientCreateSerializer, PatientListSerializer,
     MedicalRecordSerializer, PatientDNISearchSerializer, PatientForPredictionSerializer
 )
-from apps.predictions.cache_service import cache_service
+from apps.predictions.cache_service import PATIENTS_TAG, build_cache_key, cache_service, user_patients_tag
 
 logger = logging.getLogger('cardiovascular.patients')
 
+# Espacio de claves del listado cacheado y parámetros con valor por defecto
+PATIENT_LIST_CACHE_NAMESPACE = 'patients_list'
+PATIENT_LIST_DEFAULT_PARAMS = {'page': '1'}
+
 class PatientViewSet(viewsets.ModelViewSet):
     queryset = Patient.objects.filter(is_active=True)  # Queryset base requerido por DRF
     permission_classes = [IsAuthenticated]
@@ -47,11 +51,31 @@ class PatientViewSet(viewsets.ModelViewSet):
             base_queryset = base_queryset.filter(medico_tratante=medico_tratante)
         
         if self.action == 'list':
-            # Para listado, optimizar con select_related para medico_tratante y prefetch de predicciones
+            # Para listado, un número constante de consultas sea cual sea el tamaño
+            # de página: solo el último registro y la última predicción (con su
+            # registro) de cada paciente, en un prefetch cada uno. Sin anotaciones:
+            # el COUNT de la paginación sigue siendo un COUNT simple
+            latest_record_id = MedicalRecord.objects.filter(
+                patient_id=OuterRef('patient_id')
+            ).order_by('-fecha_registro').values('id')[:1]
+            latest_prediction_id = Prediction.objects.filter(
+                patient_id=OuterRef('patient_id')
+            ).order_by('-created_at').values('id')[:1]
+
             return base_queryset.select_related('medico_tratante').prefetch_related(
+                Prefetch(
+                    'medical_records',
+                    queryset=MedicalRecord.objects.filter(
+                        id=Subquery(latest_record_id)
+                    ).only('id', 'patient_id', 'fecha_registro'),
+                    to_attr='latest_records'
+                ),
                 Prefetch(
                     'predictions',
-                    queryset=Prediction.objects.order_by('-created_at')
+                    queryset=Prediction.objects.filter(
+                        id=Subquery(latest_prediction_id)
+                    ).select_related('medical_record'),
+                    to_attr='latest_predictions'
                 )
             ).order_by('-created_at')
         
@@ -82,18 +106,31 @@ class PatientViewSet(viewsets.ModelViewSet):
         """
         # Verificar si se solicita forzar refresh del cache
         force_refresh = request.GET.get('refresh') == '1'
-        
-        if not force_refresh:
-            cache_key = 'patients_list_{}'.format(hash(str(request.query_params)))
+
+        # Clave estable entre workers (parámetros canónicos, usuario y versión
+        # del serializador) con la generación de las etiquetas: cualquier cambio
+        # de pacientes la deja obsoleta (ver CacheTags); None si la caché no responde
+        base_key = build_cache_key(
+            PATIENT_LIST_CACHE_NAMESPACE,
+            request.query_params,
+            user_id=request.user.id,
+            version=PatientListSerializer.cache_version,
+            defaults=PATIENT_LIST_DEFAULT_PARAMS,
+        )
+        cache_key = cache_service.tags.versioned_key(
+            base_key, [PATIENTS_TAG, user_patients_tag(request.user.id)],
+        )
+
+        if cache_key and not force_refresh:
             cached_data = cache.get(cache_key)
+            cache_service.response_stats.record(PATIENT_LIST_CACHE_NAMESPACE, cached_data is not None)
             
             if cached_data:
                 return Response(cached_data)
         
         response = super().list(request, *args, **kwargs)
         
-        if response.status_code == 200 and not force_refresh:
-            cache_key = 'patients_list_{}'.format(hash(str(request.query_params)))
+        if cache_key and response.status_code == 200 and not force_refresh:
             cache.set(cache_key, response.data, timeout=300)  # Cache por 5 minutos
         
         return response
@@ -115,13 +152,8 @@ class PatientViewSet(viewsets.ModelViewSet):
             
             patient = serializer.save()
             
-            # Invalidar cache - corregir para Redis
-            try:
-                # Para Redis, intentar limpiar claves específicas
-                cache.delete_pattern('patients_list*')
-            except AttributeError:
-                # Si no es Redis, usar método alternativo
-                cache.clear()
+            # Invalidar listados y estadísticas de pacientes
+            cache_service.invalidate_patient_lists(request.user.id)
             
             logger.info(f"Paciente creado exitosamente: ID {patient.id}")
             return Response(
@@ -139,13 +171,8 @@ class PatientViewSet(viewsets.ModelViewSet):
         response = super().update(request, *args, **kwargs)
         
         if response.status_code == 200:
-            # Invalidar cache - corregir para Redis
-            try:
-                # Para Redis, intentar limpiar claves específicas
-                cache.delete_pattern('patients_list*')
-            except AttributeError:
-                # Si no es Redis, usar método alternativo
-                cache.clear()
+            # Invalidar listados y estadísticas de pacientes
+            cache_service.invalidate_patient_lists(request.user.id)
             logger.info(f"Paciente actualizado: ID {kwargs.get('pk')}")
         
         return response
@@ -158,13 +185,8 @@ class PatientViewSet(viewsets.ModelViewSet):
         patient.is_active = False
         patient.save()
         
-        # Invalidar cache - corregir para Redis
-        try:
-            # Para Redis, intentar limpiar claves específicas
-            cache.delete_pattern('patients_list*')
-        except AttributeError:
-            # Si no es Redis, usar método alternativo
-            cache.clear()
+        # Invalidar listados y estadísticas de pacientes
+        cache_service.invalidate_patient_lists(request.user.id)
         
         logger.info(f"Paciente desactivado: ID {patient.id}")
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -229,8 +251,8 @@ class PatientViewSet(viewsets.ModelViewSet):
         """
         Estadísticas generales de pacientes
         """
-        cache_key = 'patients_stats'
-        cached_stats = cache.get(cache_key)
+        cache_key = cache_service.tags.versioned_key('patients_stats', [PATIENTS_TAG])
+        cached_stats = cache.get(cache_key) if cache_key else None
         
         if cached_stats:
             return Response(cached_stats)
@@ -269,7 +291,8 @@ class PatientViewSet(viewsets.ModelViewSet):
         }
         
         # Cache por 1 hora
-        cache.set(cache_key, stats, timeout=3600)
+        if cache_key:
+            cache.set(cache_key, stats, timeout=3600)
         
         return Response(stats)
 
@@ -298,6 +321,7 @@ class PatientViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             medical_record = serializer.save()
             logger.info(f"Registro médico creado para paciente {patient.id}: {medical_record.id}")
+            cache_service.invalidate_patient_lists(request.user.id)
             
             return Response(
                 MedicalRecordSerializer(medical_record).data,
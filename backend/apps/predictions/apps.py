@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class PredictionsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.predictions'
+
+    def ready(self):
+        # Invalidación del caché de features (ml_models.features); si falla, que se vea al arrancar
+        from ml_models.features import connect_invalidation_signals
+        connect_invalidation_signals()
@@ -1,17 +1,384 @@
 # 🔄 Sistema de Cache Avanzado para Predicciones
 # Optimización NIVEL 2: Cache inteligente con invalidación automática
 
+import copy
 import hashlib
 import json
 import logging
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Any, Dict, Optional, List
 from django.core.cache import cache, caches
 from django.conf import settings
 from django.utils import timezone
 
+from ml_models.scoring_cache import scoring_cache
+
 logger = logging.getLogger(__name__)
 
+# Contador de generación de cada etiqueta de invalidación (ver CacheTags;
+# también los espacios y claves del L1 de TwoTierCache)
+TAG_GENERATION_KEY = 'cache_tag:{tag}'
+
+# Etiquetas: datos de pacientes (listados y estadísticas, comunes a todos los
+# usuarios), entradas propias de un usuario y estadísticas de predicciones
+PATIENTS_TAG = 'patients'
+USER_PATIENTS_TAG = 'patients:user:{user_id}'
+PREDICTION_STATS_TAG = 'predictions:stats'
+
+
+def user_patients_tag(user_id) -> str:
+    return USER_PATIENTS_TAG.format(user_id=user_id if user_id is not None else 'anonymous')
+
+
+# Parámetros que no cambian la respuesta (refresco forzado, anti-caché del cliente)
+IGNORED_QUERY_PARAMS = frozenset({'refresh', 'force_refresh', 'timestamp', '_'})
+
+
+def canonical_query(params, defaults: Optional[Dict[str, str]] = None) -> List[tuple]:
+    """
+    Parámetros de consulta en forma canónica: claves ordenadas, valores
+    múltiples ordenados, sin IGNORED_QUERY_PARAMS, sin valores vacíos y sin
+    los que coinciden con su valor por defecto (`page=1` equivale a no
+    indicar página).
+    """
+    defaults = defaults or {}
+    canonical = []
+    for key in sorted(params.keys()):
+        if key in IGNORED_QUERY_PARAMS:
+            continue
+        values = params.getlist(key) if hasattr(params, 'getlist') else [params[key]]
+        values = sorted(str(value) for value in values if value not in (None, ''))
+        if not values or values == [defaults.get(key)]:
+            continue
+        canonical.append((key, values))
+    return canonical
+
+
+def build_cache_key(namespace: str, params=None, user_id=None, version=None,
+                    extra: Optional[Dict[str, Any]] = None,
+                    defaults: Optional[Dict[str, str]] = None) -> str:
+    """
+    Clave estable entre procesos para una respuesta cacheada:
+    `<namespace>:v<version>:u<usuario>:<sha1>` con el hash sobre los
+    parámetros canónicos y `extra` (ruta, cabeceras...). No usa `hash()`, que
+    cambia en cada proceso (PYTHONHASHSEED) y separaría la caché compartida
+    en un espacio de claves por worker.
+    """
+    material = json.dumps(
+        {'query': canonical_query(params or {}, defaults), 'extra': extra or {}},
+        sort_keys=True, separators=(',', ':'), default=str,
+    )
+    digest = hashlib.sha1(material.encode()).hexdigest()[:20]
+    user = user_id if user_id is not None else 'all'
+    return f"{namespace}:v{version or 0}:u{user}:{digest}"
+
+
+class TwoTierCache:
+    """
+    Cache de dos niveles para un espacio de claves: L1 en memoria del proceso
+    (LRU acotado con TTL) delante del backend compartido (L2, Redis).
+
+    Invalidación entre workers con los contadores de CacheTags: cada entrada
+    L1 guarda la generación de su clave (etiqueta `l1:<espacio>:<clave>`),
+    leída en el mismo get_many que el valor, y cada proceso relee como mucho
+    una vez por CACHE_L1_SYNC_INTERVAL segundos, en un solo get_many, la
+    generación del espacio y las de sus entradas: descarta solo las que
+    cambiaron, o todo el L1 si cambió la del espacio (clear()).
+    delete() invalida su clave; con `invalidate_on_overwrite` sobrescribir
+    también (un INCR). Sin él (claves cuyo valor no cambia, como las
+    predicciones por contenido) un valor sobrescrito en otro worker se ve
+    aquí, como tarde, al expirar su entrada L1 (CACHE_L1_TIMEOUT).
+    """
+
+    def __init__(self, namespace: str, backend, invalidate_on_overwrite: bool = False):
+        self.namespace = namespace
+        self.backend = backend
+        self.invalidate_on_overwrite = invalidate_on_overwrite
+        self.tags = CacheTags(backend)
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._last_sync = 0.0
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def max_entries(self) -> int:
+        return getattr(settings, 'CACHE_L1_MAX_ENTRIES', 1024)
+
+    @property
+    def l1_timeout(self) -> float:
+        return getattr(settings, 'CACHE_L1_TIMEOUT', 60)
+
+    @property
+    def namespace_tag(self) -> str:
+        return f"l1:{self.namespace}"
+
+    def key_tag(self, key: str) -> str:
+        return f"l1:{self.namespace}:{key}"
+
+    def _sync(self):
+        """Descarta del L1 lo que otro worker invalidó desde la última consulta"""
+        interval = getattr(settings, 'CACHE_L1_SYNC_INTERVAL', 1.0)
+        now = time.monotonic()
+        if now - self._last_sync < interval:
+            return
+        self._last_sync = now
+        with self._lock:
+            keys = list(self._entries)
+        # Sin Redis no llegan invalidaciones: el L1 se limita a su TTL
+        generations = self.tags.current([self.namespace_tag] + [self.key_tag(key) for key in keys])
+        if generations is None:
+            return
+        with self._lock:
+            generation = generations[self.namespace_tag]
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+                return
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[2] != generations[self.key_tag(key)]:
+                    del self._entries[key]
+
+    def _local_get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, _ = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # Copia: los llamadores enriquecen los dicts devueltos
+        return copy.deepcopy(value)
+
+    def _local_set(self, key: str, value: Any, timeout: Optional[float], generation: Optional[int]):
+        ttl = min(timeout, self.l1_timeout) if timeout else self.l1_timeout
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl, generation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Valor de L1, o de L2 (y se copia a L1); None si no existe"""
+        self._sync()
+        value = self._local_get(key)
+        if value is not None:
+            with self._lock:
+                self.l1_hits += 1
+            return value
+
+        # Valor y generación de la clave en una sola ida a Redis
+        generation_key = self.tags.key(self.key_tag(key))
+        found = self.backend.get_many([key, generation_key])
+        value = found.get(key)
+        with self._lock:
+            if value is not None:
+                self.l2_hits += 1
+            else:
+                self.misses += 1
+        if value is not None:
+            self._local_set(key, value, self.l1_timeout, found.get(generation_key))
+        return value
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        """Escribe en ambos niveles; si Redis falla, el L1 sigue sirviendo el valor hasta su TTL"""
+        generation = None
+        result = None
+        try:
+            result = self.backend.set(key, value, timeout)
+            if self.invalidate_on_overwrite:
+                # Solo esta clave: las demás entradas L1 de otros workers siguen valiendo
+                generation = self._invalidate(self.key_tag(key))
+        finally:
+            self._local_set(key, value, timeout, generation)
+        # django-redis devuelve True; los backends de Django devuelven None
+        return result is None or bool(result)
+
+    def delete(self, key: str):
+        """Borra en ambos niveles y avisa al resto de workers"""
+        with self._lock:
+            self._entries.pop(key, None)
+        self.backend.delete(key)
+        self._invalidate(self.key_tag(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        generation = self._invalidate(self.namespace_tag)
+        with self._lock:
+            # La invalidación propia ya está aplicada en este proceso
+            self._generation = generation
+
+    def _invalidate(self, tag: str) -> Optional[int]:
+        with self._lock:
+            self.invalidations += 1
+        return self.tags.bump(tag)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.l1_hits + self.l2_hits + self.misses
+            l2_lookups = self.l2_hits + self.misses
+            return {
+                'l1_entries': len(self._entries),
+                'l1_max_entries': self.max_entries,
+                'lookups': lookups,
+                'l1_hits': self.l1_hits,
+                'l2_hits': self.l2_hits,
+                'misses': self.misses,
+                'l1_hit_ratio': round(self.l1_hits / lookups, 4) if lookups else 0.0,
+                'l2_hit_ratio': round(self.l2_hits / l2_lookups, 4) if l2_lookups else 0.0,
+                'hit_ratio': round((self.l1_hits + self.l2_hits) / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+            }
+
+
+class CacheTags:
+    """
+    Invalidación por etiquetas con contadores de generación.
+
+    Cada entrada cacheada incluye en su clave la generación actual de sus
+    etiquetas (`versioned_key`); invalidar una etiqueta es un único INCR de
+    su contador (`invalidate`) y las entradas anteriores dejan de
+    encontrarse hasta expirar por su TTL, sin borrar claves una a una.
+
+    Un contador ausente (Redis vaciado o desalojado) se inicializa con la
+    hora en milisegundos: nunca vuelve a una generación ya usada por
+    entradas que sigan vivas.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(tag: str) -> str:
+        return TAG_GENERATION_KEY.format(tag=tag)
+
+    @staticmethod
+    def _seed() -> int:
+        return int(time.time() * 1000)
+
+    def generations(self, tags: List[str]) -> Optional[Dict[str, int]]:
+        """Generación actual de cada etiqueta (None si la caché no responde)"""
+        keys = {self.key(tag): tag for tag in tags}
+        try:
+            found = self.backend.get_many(list(keys))
+            missing = [key for key in keys if key not in found]
+            if missing:
+                for key in missing:
+                    # add(): si otro worker la inicializó antes, se respeta la suya
+                    self.backend.add(key, self._seed(), timeout=None)
+                found.update(self.backend.get_many(missing))
+        except Exception as e:
+            logger.warning(f"Cache tag generations unavailable: {e}")
+            with self._lock:
+                self.errors += 1
+            return None
+
+        with self._lock:
+            self.lookups += 1
+        return {keys[key]: int(value) for key, value in found.items()}
+
+    def versioned_key(self, base_key: str, tags: List[str]) -> Optional[str]:
+        """
+        `base_key` con las generaciones de `tags`. None si no se pueden leer:
+        el llamador no debe leer ni escribir la entrada.
+        """
+        tags = sorted(set(tags))
+        generations = self.generations(tags)
+        if generations is None or len(generations) != len(tags):
+            return None
+        return f"{base_key}:g{'.'.join(str(generations[tag]) for tag in tags)}"
+
+    def current(self, tags: List[str]) -> Optional[Dict[str, Optional[int]]]:
+        """
+        Generación de cada etiqueta sin inicializar las ausentes (None), o
+        None si la caché no responde.
+        """
+        keys = {self.key(tag): tag for tag in tags}
+        try:
+            found = self.backend.get_many(list(keys))
+        except Exception as e:
+            logger.warning(f"Cache tag generations unavailable: {e}")
+            with self._lock:
+                self.errors += 1
+            return None
+        return {tag: found.get(key) for key, tag in keys.items()}
+
+    def bump(self, tag: str) -> Optional[int]:
+        """Un INCR del contador de `tag`; devuelve la nueva generación (None si falla)"""
+        key = self.key(tag)
+        try:
+            try:
+                generation = self.backend.incr(key)
+            except ValueError:
+                # Contador inexistente: nada cacheado con él que invalidar,
+                # pero se crea para que la siguiente lectura no reutilice claves
+                self.backend.add(key, self._seed(), timeout=None)
+                generation = self.backend.incr(key)
+        except Exception as e:
+            logger.error(f"Error invalidating cache tag {tag}: {e}")
+            with self._lock:
+                self.errors += 1
+            return None
+
+        with self._lock:
+            self.invalidations += 1
+        return generation
+
+    def invalidate(self, *tags: str) -> int:
+        """Invalida las entradas de `tags` (un INCR por etiqueta); devuelve cuántas se invalidaron"""
+        return sum(1 for tag in set(tags) if self.bump(tag) is not None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'lookups': self.lookups,
+                'invalidations': self.invalidations,
+                'errors': self.errors,
+            }
+
+
+class ResponseCacheStats:
+    """Aciertos y fallos de las respuestas cacheadas por espacio (listados, middleware) en este proceso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def record(self, namespace: str, hit: bool):
+        with self._lock:
+            counters = self._counters.setdefault(namespace, {'hits': 0, 'misses': 0})
+            counters['hits' if hit else 'misses'] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                namespace: {
+                    **counters,
+                    'hit_ratio': round(counters['hits'] / (counters['hits'] + counters['misses']), 4),
+                }
+                for namespace, counters in self._counters.items()
+            }
+
+
 class PredictionCacheService:
     """Servicio de cache inteligente para predicciones cardiovasculares."""
     
@@ -37,6 +404,16 @@ class PredictionCacheService:
             logger.warning(f"Cache initialization failed, using default: {e}")
             self.prediction_cache = cache
             self.default_cache = cache
+
+        # L1 en memoria del proceso delante de Redis, por espacio de claves
+        self.prediction_tier = TwoTierCache(self.PREDICTION_PREFIX, self.prediction_cache)
+        self.patient_tier = TwoTierCache(self.PATIENT_PREFIX, self.default_cache, invalidate_on_overwrite=True)
+        self.stats_tier = TwoTierCache(self.STATS_PREFIX, self.default_cache, invalidate_on_overwrite=True)
+
+        # Generaciones por etiqueta de las respuestas cacheadas (listados de
+        # pacientes, estadísticas; ver CacheTags)
+        self.tags = CacheTags(self.default_cache)
+        self.response_stats = ResponseCacheStats()
     
     def _generate_cache_key(self, prefix: str, data: Dict[str, Any]) -> str:
         """Genera una clave de cache única basada en los datos de entrada."""
@@ -57,20 +434,13 @@ class PredictionCacheService:
         """
         try:
             cache_key = self._generate_cache_key(self.PREDICTION_PREFIX, medical_data)
-            cached_result = self.prediction_cache.get(cache_key)
+            # La expiración la aplican los TTL de ambos niveles (ver set_prediction_cache)
+            cached_result = self.prediction_tier.get(cache_key)
             
             if cached_result:
-                # Verificar si el cache no ha expirado según criterios personalizados
-                cache_time = cached_result.get('cached_at')
-                if cache_time:
-                    cache_age = timezone.now() - datetime.fromisoformat(cache_time)
-                    if cache_age.total_seconds() < self.PREDICTION_TIMEOUT:
-                        logger.info(f"Cache hit for prediction: {cache_key[:8]}...")
-                        cached_result['from_cache'] = True
-                        return cached_result
-                    else:
-                        logger.info(f"Cache expired for prediction: {cache_key[:8]}...")
-                        self.prediction_cache.delete(cache_key)
+                logger.info(f"Cache hit for prediction: {cache_key[:8]}...")
+                cached_result['from_cache'] = True
+                return cached_result
             
             logger.info(f"Cache miss for prediction: {cache_key[:8]}...")
             return None
@@ -103,11 +473,12 @@ class PredictionCacheService:
                 ).hexdigest()[:8]
             }
             
-            # Guardar con timeout personalizado basado en el riesgo
+            # Guardar con timeout personalizado basado en el riesgo, sin superar
+            # PREDICTION_TIMEOUT (edad máxima de una predicción cacheada)
             risk_level = result.get('risk_level', 'medium')
-            timeout = self._get_dynamic_timeout(risk_level)
+            timeout = min(self._get_dynamic_timeout(risk_level), self.PREDICTION_TIMEOUT)
             
-            success = self.prediction_cache.set(cache_key, enriched_result, timeout)
+            success = self.prediction_tier.set(cache_key, enriched_result, timeout)
             
             if success:
                 logger.info(f"Prediction cached successfully: {cache_key[:8]}... (timeout: {timeout}s)")
@@ -124,7 +495,7 @@ class PredictionCacheService:
         """Obtiene datos de paciente del cache."""
         try:
             cache_key = f"{self.PATIENT_PREFIX}:{patient_id}"
-            cached_data = self.default_cache.get(cache_key)
+            cached_data = self.patient_tier.get(cache_key)
             
             if cached_data:
                 logger.info(f"Patient cache hit: {patient_id}")
@@ -149,7 +520,7 @@ class PredictionCacheService:
                 'patient_id': patient_id
             }
             
-            success = self.default_cache.set(cache_key, enriched_data, self.PATIENT_TIMEOUT)
+            success = self.patient_tier.set(cache_key, enriched_data, self.PATIENT_TIMEOUT)
             
             if success:
                 logger.info(f"Patient cached successfully: {patient_id}")
@@ -166,7 +537,7 @@ class PredictionCacheService:
             filter_key = self._generate_cache_key("filters", filters or {})
             cache_key = f"{self.STATS_PREFIX}:{stats_type}:{filter_key}"
             
-            cached_stats = self.default_cache.get(cache_key)
+            cached_stats = self.stats_tier.get(cache_key)
             
             if cached_stats:
                 logger.info(f"Statistics cache hit: {stats_type}")
@@ -192,7 +563,7 @@ class PredictionCacheService:
                 'applied_filters': filters
             }
             
-            success = self.default_cache.set(cache_key, enriched_stats, self.STATISTICS_TIMEOUT)
+            success = self.stats_tier.set(cache_key, enriched_stats, self.STATISTICS_TIMEOUT)
             
             if success:
                 logger.info(f"Statistics cached successfully: {stats_type}")
@@ -207,7 +578,7 @@ class PredictionCacheService:
         """Invalida el cache de un paciente específico."""
         try:
             cache_key = f"{self.PATIENT_PREFIX}:{patient_id}"
-            self.default_cache.delete(cache_key)
+            self.patient_tier.delete(cache_key)
             logger.info(f"Patient cache invalidated: {patient_id}")
             return True
             
@@ -215,11 +586,28 @@ class PredictionCacheService:
             logger.error(f"Error invalidating patient cache: {e}")
             return False
     
+    def invalidate_patient_lists(self, user_id=None) -> int:
+        """
+        Invalida los listados y estadísticas de pacientes de todos los
+        usuarios (y las entradas propias de `user_id`, si se indica).
+        Devuelve cuántas etiquetas se invalidaron.
+        """
+        tags = [PATIENTS_TAG]
+        if user_id is not None:
+            tags.append(user_patients_tag(user_id))
+        invalidated = self.tags.invalidate(*tags)
+        logger.info(f"Patient list cache invalidated: {tags}")
+        return invalidated
+
+    def invalidate_prediction_stats(self) -> int:
+        """Invalida las estadísticas de predicciones cacheadas"""
+        return self.tags.invalidate(PREDICTION_STATS_TAG)
+
     def invalidate_prediction_cache(self, medical_data: Dict[str, Any]) -> bool:
         """Invalida cache de predicción específica."""
         try:
             cache_key = self._generate_cache_key(self.PREDICTION_PREFIX, medical_data)
-            self.prediction_cache.delete(cache_key)
+            self.prediction_tier.delete(cache_key)
             logger.info(f"Prediction cache invalidated: {cache_key[:8]}...")
             return True
             
@@ -232,6 +620,8 @@ class PredictionCacheService:
         try:
             self.default_cache.clear()
             self.prediction_cache.clear()
+            for tier in (self.prediction_tier, self.patient_tier, self.stats_tier):
+                tier.clear()
             logger.warning("All caches cleared")
             return True
             
@@ -242,12 +632,20 @@ class PredictionCacheService:
     def get_cache_stats(self) -> Dict[str, Any]:
         """Obtiene estadísticas del cache."""
         try:
-            # Simulación de estadísticas (Redis real proporcionaría más detalles)
             return {
                 'cache_service_status': 'active',
                 'default_cache_backend': str(self.default_cache.__class__.__name__),
                 'prediction_cache_backend': str(self.prediction_cache.__class__.__name__),
                 'timestamp': timezone.now().isoformat(),
+                # Aciertos por nivel (L1 en proceso, L2 Redis) de este worker
+                'tiers': {
+                    'predictions': self.prediction_tier.stats(),
+                    'patients': self.patient_tier.stats(),
+                    'statistics': self.stats_tier.stats(),
+                },
+                'scoring_cache': scoring_cache.stats(),
+                'tags': self.tags.stats(),
+                'responses': self.response_stats.as_dict(),
                 'timeouts': {
                     'predictions': self.PREDICTION_TIMEOUT,
                     'patients': self.PATIENT_TIMEOUT,
@@ -0,0 +1,203 @@
+"""
+Benchmark de inferencia concurrente según el presupuesto de hilos
+
+Para cada implementación (ver bench_inference):
+  1. Reentrancia: las mismas entradas se predicen en secuencia y desde
+     varios hilos a la vez; todas las salidas deben coincidir (tolerancia de
+     las salidas de referencia).
+  2. Throughput: para cada número de hilos nativos por llamada
+     (ML_MODEL_THREADS, más OpenMP/BLAS vía threadpoolctl) y cada número de
+     llamadores concurrentes, registros/s y latencia p50/p99 por llamada.
+
+Sirve para elegir ML_MODEL_THREADS según la concurrencia del worker: con
+hilos de petición × hilos nativos por encima de los núcleos disponibles el
+throughput deja de crecer y la latencia de cola se dispara.
+"""
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from ml_models.batching import latency_percentiles
+from ml_models.features import feature_pipeline
+from ml_models.registry import model_registry
+from ml_models.thread_budget import configure_model_threads, threadpool_summary
+
+from .bench_inference import IMPLEMENTATIONS, _build_implementations, _same_output
+
+DEFAULT_IMPLEMENTATIONS = 'predictor,pipeline_sklearn'
+DEFAULT_CALLERS = '1,2,4,8'
+DEFAULT_MODEL_THREADS = '1,2,4'
+
+
+def _parse_ints(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Comprueba la reentrancia de la inferencia y mide throughput según hilos nativos y llamadores concurrentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--implementations',
+            default=DEFAULT_IMPLEMENTATIONS,
+            help=f'Implementaciones separadas por comas (default: {DEFAULT_IMPLEMENTATIONS})',
+        )
+        parser.add_argument(
+            '--callers',
+            default=DEFAULT_CALLERS,
+            help=f'Llamadores concurrentes a probar (default: {DEFAULT_CALLERS})',
+        )
+        parser.add_argument(
+            '--model-threads',
+            default=DEFAULT_MODEL_THREADS,
+            help=f'Hilos nativos por llamada a probar (default: {DEFAULT_MODEL_THREADS})',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=400,
+            help='Llamadas por medición (default: 400)',
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=1,
+            help='Registros por llamada; 1 reproduce /api/predictions/predict/ (default: 1)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Semilla de las cohortes sintéticas (default: 42)',
+        )
+        parser.add_argument(
+            '--output',
+            help='Archivo JSON donde guardar los resultados',
+        )
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['implementations'].split(',') if name.strip()]
+        unknown = set(names) - set(IMPLEMENTATIONS)
+        if unknown:
+            raise CommandError(f"Implementaciones desconocidas: {', '.join(sorted(unknown))}")
+        callers_list = _parse_ints(options['callers'])
+        threads_list = _parse_ints(options['model_threads'])
+        if not callers_list or not threads_list or min(callers_list + threads_list) < 1:
+            raise CommandError("--callers y --model-threads deben ser enteros positivos")
+
+        from threadpoolctl import threadpool_limits
+
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+        self.stdout.write(f"🖥️  Núcleos disponibles: {cores}")
+
+        logging.disable(logging.CRITICAL)
+        results = {}
+        try:
+            for name in names:
+                results[name] = {}
+                for model_threads in threads_list:
+                    # Las sesiones ONNX fijan sus hilos al crearse: se reconstruyen por presupuesto.
+                    # Se mide la inferencia, sin la caché de scoring
+                    with override_settings(ML_MODEL_THREADS=model_threads, ML_SCORING_CACHE_ENABLED=False), \
+                            threadpool_limits(limits=model_threads):
+                        implementation = _build_implementations([name]).get(name)
+                        if implementation is None:
+                            self.stdout.write(self.style.WARNING(f"⚠️  {name}: artefacto no disponible, se omite"))
+                            results[name] = {'skipped': True}
+                            break
+                        for handle in model_registry.current_handles():
+                            configure_model_threads(handle.obj, model_threads)
+
+                        if model_threads == threads_list[0]:
+                            results[name]['reentrancy'] = self._check_reentrancy(
+                                implementation, max(callers_list), options,
+                            )
+                            results[name]['threadpools'] = threadpool_summary()
+
+                        results[name][f'model_threads_{model_threads}'] = {
+                            f'callers_{callers}': self._measure(implementation, callers, options)
+                            for callers in callers_list
+                        }
+                        self._report(name, model_threads, results[name][f'model_threads_{model_threads}'])
+        finally:
+            logging.disable(logging.NOTSET)
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+            self.stdout.write(f"💾 Resultados en {options['output']}")
+
+        failed = [name for name, result in results.items()
+                  if result.get('reentrancy', {}).get('mismatches')]
+        if failed:
+            raise CommandError(f"Salidas concurrentes distintas de las secuenciales: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS("✅ Benchmark de concurrencia completado"))
+
+    def _calls(self, implementation, options):
+        """Entradas de cada llamada: registros individuales o bloques de --rows filas"""
+        rows = options['rows']
+        inputs = implementation.inputs(options['requests'] * rows, options['seed'])
+        if rows == 1:
+            return [implementation.item(inputs, index) for index in range(options['requests'])]
+        if implementation.kind == 'records':
+            return [inputs[start:start + rows] for start in range(0, len(inputs), rows)]
+        return [inputs.iloc[start:start + rows] for start in range(0, len(inputs), rows)]
+
+    def _check_reentrancy(self, implementation, callers, options):
+        calls = self._calls(implementation, options)
+        single_records = options['rows'] == 1 and implementation.kind == 'records'
+        as_batch = (lambda call: [call]) if single_records else (lambda call: call)
+
+        feature_pipeline.clear()
+        expected = [implementation.outputs(as_batch(call)) for call in calls]
+        feature_pipeline.clear()
+        with ThreadPoolExecutor(max_workers=callers) as executor:
+            obtained = list(executor.map(lambda call: implementation.outputs(as_batch(call)), calls))
+
+        mismatches = [
+            index for index, (got, want) in enumerate(zip(obtained, expected))
+            if not _same_output(got, want)
+        ]
+        icon = '❌' if mismatches else '🔬'
+        self.stdout.write(f"{icon} {implementation.name}: {len(calls) - len(mismatches)}/{len(calls)} "
+                          f"llamadas con {callers} hilos coinciden con la ejecución secuencial")
+        return {'callers': callers, 'calls': len(calls), 'mismatches': mismatches[:20]}
+
+    def _measure(self, implementation, callers, options):
+        calls = self._calls(implementation, options)
+        predict = implementation.single if options['rows'] == 1 else implementation.batch
+
+        # Calentamiento fuera del tiempo medido (carga perezosa, cachés de la primera llamada)
+        for call in calls[:callers]:
+            predict(call)
+        feature_pipeline.clear()
+
+        def timed(call):
+            start_time = time.perf_counter()
+            predict(call)
+            return (time.perf_counter() - start_time) * 1000
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=callers) as executor:
+            timings = list(executor.map(timed, calls))
+        elapsed = time.perf_counter() - start_time
+
+        return {
+            'rows_per_second': round(len(calls) * options['rows'] / elapsed, 1),
+            'calls_per_second': round(len(calls) / elapsed, 1),
+            **latency_percentiles(timings),
+        }
+
+    def _report(self, name, model_threads, measurements):
+        for key, measurement in measurements.items():
+            callers = key.split('_')[-1]
+            self.stdout.write(
+                f"⏱️  {name:<16} hilos nativos {model_threads:>2} | llamadores {callers:>2} | "
+                f"{measurement['rows_per_second']:>10,.0f} registros/s | "
+                f"p50 {measurement['p50']:.3f}ms p99 {measurement['p99']:.3f}ms"
+            )
@@ -0,0 +1,438 @@
+"""
+Benchmark repetible de inferencia con cohortes sintéticas
+
+Genera registros Patient/MedicalRecord sin guardar (y matrices en el orden
+de pipeline.joblib) con una semilla fija, y mide cada implementación de
+predicción:
+  - predictor:        CardiovascularPredictor con el modelo configurado
+  - predictor_rules:  el mismo predictor forzado al sistema de reglas
+  - ml_service:       CardiovascularMLService (sin API de lotes: bucle)
+  - pipeline_sklearn: pipeline.joblib (ColumnTransformer + XGBoost)
+  - pipeline_flat:    evaluador de arrays planos (export_flat_artifacts)
+  - pipeline_onnx:    grafo ONNX en onnxruntime (export_onnx_pipeline)
+
+Para cada tamaño reporta p50/p95/p99 de la llamada, throughput y pico de
+memoria (tracemalloc: solo asignaciones de Python/NumPy). Los tamaños
+grandes se procesan en bloques de --chunk-size filas, generados fuera del
+tiempo medido. Las salidas de una muestra fija se comparan con
+trained_models/bench_golden_outputs.json y el resultado completo se
+escribe en JSON para comparar ejecuciones entre commits.
+"""
+import json
+import logging
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import date, datetime
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from ml_models.batching import latency_percentiles
+from ml_models.features import feature_pipeline
+from ml_models.registry import model_registry
+
+from .validate_flat_pipeline import synthetic_pipeline_inputs
+
+IMPLEMENTATIONS = ['predictor', 'predictor_rules', 'ml_service', 'pipeline_sklearn', 'pipeline_flat',
+                   'pipeline_onnx']
+DEFAULT_SIZES = '1,100,10000,1000000'
+
+# Muestra fija de las salidas de referencia
+GOLDEN_SEED = 20240101
+GOLDEN_ROWS = 64
+GOLDEN_TOLERANCE = 1e-6
+
+ACTIVIDADES = ['sedentario', 'ligero', 'moderado', 'intenso']
+ANTECEDENTES = ['si', 'no', 'desconoce']
+
+
+def synthetic_records(n_rows, seed=42):
+    """Registros médicos sin guardar con rangos clínicos realistas y edades estables en el tiempo"""
+    from apps.patients.models import MedicalRecord, Patient
+
+    rng = np.random.default_rng(seed)
+    today = date.today()
+    ages = rng.integers(25, 85, n_rows)
+    sexes = rng.choice(['M', 'F'], n_rows)
+    weights = np.round(rng.uniform(45, 130, n_rows), 1)
+    heights = np.round(rng.uniform(150, 195, n_rows), 1)
+    systolic = rng.integers(95, 200, n_rows)
+    diastolic = rng.integers(55, 120, n_rows)
+    cholesterol = np.round(rng.uniform(120, 330, n_rows), 1)
+    glucose = np.round(rng.uniform(60, 250, n_rows), 1)
+    hdl = np.where(rng.random(n_rows) < 0.5, np.nan, np.round(rng.uniform(25, 80, n_rows), 1))
+    triglycerides = np.where(rng.random(n_rows) < 0.5, np.nan, np.round(rng.uniform(60, 400, n_rows), 1))
+    cigarettes = rng.choice([0, 0, 0, 5, 10, 20], n_rows)
+    smoking_years = np.where(cigarettes > 0, rng.integers(1, 40, n_rows), 0)
+    activity = rng.integers(0, len(ACTIVIDADES), n_rows)
+    history = rng.integers(0, len(ANTECEDENTES), n_rows)
+    diabetes = rng.random(n_rows) < 0.2
+
+    records = []
+    for i in range(n_rows):
+        # Nacimiento en el mismo mes del año actual (día ≤ 28): la edad no cambia con la fecha
+        patient = Patient(
+            sexo=sexes[i],
+            fecha_nacimiento=date(today.year - int(ages[i]), today.month, min(today.day, 28)),
+            peso=float(weights[i]),
+            altura=float(heights[i]),
+        )
+        records.append(MedicalRecord(
+            patient=patient,
+            edad=int(ages[i]),
+            presion_sistolica=int(systolic[i]),
+            presion_diastolica=int(diastolic[i]),
+            colesterol=float(cholesterol[i]),
+            colesterol_hdl=None if np.isnan(hdl[i]) else float(hdl[i]),
+            trigliceridos=None if np.isnan(triglycerides[i]) else float(triglycerides[i]),
+            glucosa=float(glucose[i]),
+            cigarrillos_dia=int(cigarettes[i]),
+            anos_tabaquismo=int(smoking_years[i]),
+            actividad_fisica=ACTIVIDADES[activity[i]],
+            antecedentes_cardiacos=ANTECEDENTES[history[i]],
+            diabetes=bool(diabetes[i]),
+        ))
+    return records
+
+
+class Implementation:
+    """Implementación de predicción a medir: entradas de registros o de matriz"""
+
+    def __init__(self, name, kind, single, batch, outputs):
+        self.name = name
+        self.kind = kind          # 'records' o 'matrix'
+        self.single = single      # un elemento
+        self.batch = batch        # lista de registros o matriz
+        self.outputs = outputs    # salidas comparables con las de referencia
+
+    def inputs(self, n_rows, seed):
+        if self.kind == 'records':
+            return synthetic_records(n_rows, seed)
+        import pandas as pd
+        return pd.DataFrame(synthetic_pipeline_inputs(n_rows, seed), columns=self.feature_names)
+
+    def item(self, inputs, index):
+        """Entrada de una sola predicción: un registro o una matriz de una fila"""
+        return inputs[index] if self.kind == 'records' else inputs.iloc[index:index + 1]
+
+
+def _record_outputs(results):
+    return [[result['riesgo_nivel'], result['probabilidad']] for result in results]
+
+
+def _build_implementations(names):
+    implementations = {}
+
+    if {'predictor', 'predictor_rules'} & set(names):
+        from ml_models.cardiovascular_predictor_clean import CardiovascularPredictor, cardiovascular_predictor
+
+        rules_predictor = CardiovascularPredictor()
+        rules_predictor.model = None
+        for name, predictor in (('predictor', cardiovascular_predictor), ('predictor_rules', rules_predictor)):
+            implementations[name] = Implementation(
+                name, 'records',
+                single=predictor.predict_cardiovascular_risk,
+                batch=predictor.predict_many,
+                outputs=lambda records, predictor=predictor: _record_outputs(predictor.predict_many(records)),
+            )
+
+    if 'ml_service' in names:
+        from ml_models.inference.cardiovascular_ml import CardiovascularMLService
+
+        service = CardiovascularMLService()
+        implementations['ml_service'] = Implementation(
+            'ml_service', 'records',
+            single=service.predict,
+            batch=lambda records: [service.predict(record) for record in records],
+            outputs=lambda records: _record_outputs(service.predict(record) for record in records),
+        )
+
+    pipeline_models = {}
+    if 'pipeline_sklearn' in names:
+        pipeline_models['pipeline_sklearn'] = model_registry.get_object(
+            os.path.join(settings.ML_MODELS_PATH, 'pipeline.joblib')
+        )
+    if 'pipeline_flat' in names:
+        from ml_models.inference.flat_evaluator import FlatPipelineModel
+
+        artifact = model_registry.get_object(settings.ML_FLAT_PIPELINE_PATH)
+        pipeline_models['pipeline_flat'] = FlatPipelineModel(artifact) if artifact is not None else None
+    if 'pipeline_onnx' in names:
+        try:
+            from ml_models.inference.onnx_model import OnnxPipelineModel
+        except ImportError:
+            OnnxPipelineModel = None
+        artifact = model_registry.get_object(settings.ML_ONNX_PIPELINE_PATH)
+        pipeline_models['pipeline_onnx'] = (
+            OnnxPipelineModel(artifact) if artifact is not None and OnnxPipelineModel is not None else None
+        )
+
+    for name, model in pipeline_models.items():
+        if model is None:
+            implementations[name] = None
+            continue
+        implementation = Implementation(
+            name, 'matrix',
+            single=model.predict_proba,
+            batch=model.predict_proba,
+            outputs=lambda X, model=model: np.round(model.predict_proba(X)[:, 1], 6).tolist(),
+        )
+        implementation.feature_names = _pipeline_feature_names(model)
+        implementations[name] = implementation
+
+    return implementations
+
+
+def _pipeline_feature_names(model):
+    names = getattr(model, 'feature_names', None)
+    if names is None:
+        names = getattr(model, 'feature_names_in_', None)
+    if names is None:
+        raise CommandError("No se pudieron obtener los nombres de features del pipeline")
+    return list(names)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark de inferencia con cohortes sintéticas: latencias, throughput, memoria y salidas de referencia'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default=DEFAULT_SIZES,
+            help=f'Tamaños de lote separados por comas (default: {DEFAULT_SIZES})',
+        )
+        parser.add_argument(
+            '--implementations',
+            default=','.join(IMPLEMENTATIONS),
+            help=f'Implementaciones a medir separadas por comas (default: todas: {",".join(IMPLEMENTATIONS)})',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Llamadas de un solo registro para la latencia individual (default: 200)',
+        )
+        parser.add_argument(
+            '--repeats',
+            type=int,
+            default=5,
+            help='Repeticiones de cada lote de hasta --chunk-size filas; los mayores se miden una vez (default: 5)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Filas por bloque en los lotes grandes (default: 10000)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Semilla de las cohortes sintéticas (default: 42)',
+        )
+        parser.add_argument(
+            '--output',
+            default='bench_inference.json',
+            help='Archivo JSON de resultados (default: bench_inference.json)',
+        )
+        parser.add_argument(
+            '--golden',
+            default=os.path.join(settings.ML_MODELS_PATH, 'bench_golden_outputs.json'),
+            help='Archivo de salidas de referencia (default: trained_models/bench_golden_outputs.json)',
+        )
+        parser.add_argument(
+            '--update-golden',
+            action='store_true',
+            help='Regenerar las salidas de referencia en lugar de compararlas',
+        )
+        parser.add_argument(
+            '--skip-memory',
+            action='store_true',
+            help='No medir el pico de memoria (evita una pasada extra con tracemalloc)',
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        names = [name.strip() for name in options['implementations'].split(',') if name.strip()]
+        unknown = set(names) - set(IMPLEMENTATIONS)
+        if unknown:
+            raise CommandError(f"Implementaciones desconocidas: {', '.join(sorted(unknown))}")
+
+        # El predictor registra cada predicción (y cada fallback); a este volumen
+        # los logs dominarían el tiempo medido. Se mide la inferencia, sin la
+        # caché de scoring (ver ml_models/scoring_cache.py)
+        logging.disable(logging.CRITICAL)
+        try:
+            with override_settings(ML_SCORING_CACHE_ENABLED=False):
+                implementations = _build_implementations(names)
+                results = {}
+                for name in names:
+                    implementation = implementations.get(name)
+                    if implementation is None:
+                        self.stdout.write(self.style.WARNING(f"⚠️  {name}: artefacto no disponible, se omite"))
+                        results[name] = {'skipped': True}
+                        continue
+                    self.stdout.write(f"🏁 {name}")
+                    results[name] = self._bench(implementation, sizes, options)
+                golden = self._check_golden(implementations, names, options)
+        finally:
+            logging.disable(logging.NOTSET)
+
+        report = {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'environment': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'ML_INFERENCE_BACKEND': getattr(settings, 'ML_INFERENCE_BACKEND', None),
+                'ML_MICROBATCH_ENABLED': getattr(settings, 'ML_MICROBATCH_ENABLED', False),
+                'ML_INFERENCE_POOL_SIZE': getattr(settings, 'ML_INFERENCE_POOL_SIZE', 0),
+            },
+            'options': {key: options[key] for key in ('sizes', 'iterations', 'repeats', 'chunk_size', 'seed')},
+            'implementations': results,
+            'golden': golden,
+        }
+        with open(options['output'], 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+        self.stdout.write(f"💾 Resultados en {options['output']}")
+
+        failed = [name for name, check in golden.items() if check.get('status') == 'mismatch']
+        if failed:
+            raise CommandError(f"Salidas distintas de las de referencia: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS("✅ Benchmark completado"))
+
+    def _bench(self, implementation, sizes, options):
+        seed = options['seed']
+
+        # 1. Latencia de un solo registro
+        inputs = implementation.inputs(options['iterations'], seed)
+        feature_pipeline.clear()
+        implementation.single(implementation.item(inputs, 0))  # calentamiento (carga del modelo)
+        timings = []
+        for i in range(options['iterations']):
+            item = implementation.item(inputs, i)
+            start_time = time.perf_counter()
+            implementation.single(item)
+            timings.append((time.perf_counter() - start_time) * 1000)
+        single = latency_percentiles(timings)
+        self.stdout.write(f"   ⏱️  1 registro: p50 {single['p50']:.3f}ms p99 {single['p99']:.3f}ms")
+
+        # 2. Lotes
+        batches = {}
+        chunk_size = max(1, options['chunk_size'])
+        for size in sizes:
+            repeats = max(1, options['repeats']) if size <= chunk_size else 1
+            timings = []
+            for _ in range(repeats):
+                timings.append(self._timed_batch(implementation, size, chunk_size, seed))
+            latency = latency_percentiles(timings)
+            median_s = float(np.median(timings)) / 1000
+            batch = {
+                'repeats': repeats,
+                'latency_ms': latency,
+                'throughput_rows_per_s': round(size / median_s, 1) if median_s > 0 else None,
+            }
+            if not options['skip_memory']:
+                memory_rows = min(size, chunk_size)
+                batch['peak_memory_mb'] = self._peak_memory_mb(implementation, memory_rows, seed)
+                batch['peak_memory_rows'] = memory_rows
+            batches[str(size)] = batch
+            self.stdout.write(
+                f"   📦 {size:>8} registros: p50 {latency['p50']:.1f}ms "
+                f"| {batch['throughput_rows_per_s'] or 0:,.0f} registros/s"
+                + (f" | pico {batch['peak_memory_mb']:.1f} MB" if 'peak_memory_mb' in batch else '')
+            )
+
+        return {'kind': implementation.kind, 'single_latency_ms': single, 'batches': batches}
+
+    def _timed_batch(self, implementation, size, chunk_size, seed):
+        """Milisegundos de puntuar `size` filas en bloques; la generación no se mide"""
+        elapsed = 0.0
+        for start in range(0, size, chunk_size):
+            inputs = implementation.inputs(min(chunk_size, size - start), seed + start)
+            # Registros nuevos en cada petición: sin aciertos del caché de features
+            feature_pipeline.clear()
+            start_time = time.perf_counter()
+            implementation.batch(inputs)
+            elapsed += time.perf_counter() - start_time
+        return elapsed * 1000
+
+    def _peak_memory_mb(self, implementation, n_rows, seed):
+        inputs = implementation.inputs(n_rows, seed)
+        feature_pipeline.clear()
+        tracemalloc.start()
+        try:
+            implementation.batch(inputs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return round(peak / 1024 / 1024, 2)
+
+    def _check_golden(self, implementations, names, options):
+        outputs = {}
+        for name in names:
+            implementation = implementations.get(name)
+            if implementation is not None:
+                outputs[name] = implementation.outputs(implementation.inputs(GOLDEN_ROWS, GOLDEN_SEED))
+
+        golden_path = options['golden']
+        if options['update_golden']:
+            stored = {}
+            if os.path.exists(golden_path):
+                with open(golden_path) as golden_file:
+                    stored = json.load(golden_file).get('outputs', {})
+            stored.update(outputs)
+            with open(golden_path, 'w') as golden_file:
+                json.dump({'seed': GOLDEN_SEED, 'rows': GOLDEN_ROWS, 'outputs': stored}, golden_file, indent=1)
+            self.stdout.write(f"📝 Salidas de referencia actualizadas en {golden_path}")
+            return {name: {'status': 'updated'} for name in outputs}
+
+        if not os.path.exists(golden_path):
+            self.stdout.write(self.style.WARNING("⚠️  No hay salidas de referencia; use --update-golden"))
+            return {name: {'status': 'missing'} for name in outputs}
+
+        with open(golden_path) as golden_file:
+            expected_outputs = json.load(golden_file).get('outputs', {})
+
+        checks = {}
+        for name, obtained in outputs.items():
+            expected = expected_outputs.get(name)
+            if expected is None:
+                checks[name] = {'status': 'missing'}
+                continue
+            mismatches = [
+                index for index, (got, want) in enumerate(zip(obtained, expected))
+                if not _same_output(got, want)
+            ]
+            if len(obtained) != len(expected):
+                mismatches.append(min(len(obtained), len(expected)))
+            checks[name] = {'status': 'mismatch' if mismatches else 'ok', 'mismatches': mismatches[:20]}
+            icon = '❌' if mismatches else '🔬'
+            self.stdout.write(f"{icon} {name}: {len(obtained) - len(mismatches)}/{len(obtained)} salidas coinciden")
+        return checks
+
+
+def _same_output(obtained, expected):
+    if isinstance(expected, list):
+        return (len(obtained) == len(expected)
+                and all(_same_output(got, want) for got, want in zip(obtained, expected)))
+    if isinstance(expected, (int, float)) and not isinstance(expected, bool):
+        return abs(float(obtained) - float(expected)) <= GOLDEN_TOLERANCE
+    return obtained == expected
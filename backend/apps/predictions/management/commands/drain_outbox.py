@@ -0,0 +1,61 @@
+"""
+Drena el outbox de efectos secundarios de /predict/ sin Celery
+
+Misma lógica que la tarea `drain_prediction_outbox` (ver
+apps/predictions/outbox.py): útil en desarrollo sin worker/beat, para
+vaciar atrasos o para inspeccionar eventos fallidos.
+"""
+from django.core.management.base import BaseCommand
+
+from apps.predictions.models import PredictionOutboxEvent
+from apps.predictions.outbox import drain, outbox_stats, purge_processed
+
+
+class Command(BaseCommand):
+    help = 'Aplica los eventos pendientes del outbox de predicciones (caché, invalidaciones, notificaciones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Eventos por lote (default: PREDICTION_OUTBOX_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=50,
+            help='Lotes máximos a procesar (default: 50)',
+        )
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Borra además los eventos procesados fuera del periodo de retención',
+        )
+        parser.add_argument(
+            '--show-failed',
+            action='store_true',
+            help='Lista los eventos pendientes con errores',
+        )
+
+    def handle(self, *args, **options):
+        before = outbox_stats()
+        self.stdout.write(f"📬 Pendientes: {before['pending']} (sin reintentos restantes: {before['dead']}, "
+                          f"más antiguo: {before['oldest_pending_age_s']}s)")
+
+        totals = drain(max_batches=options['max_batches'], batch_size=options['batch_size'])
+        self.stdout.write(f"✅ Procesados: {totals['processed']} en {totals['batches']} lotes")
+        if totals['failed']:
+            self.stdout.write(self.style.WARNING(f"⚠️ Fallidos (se reintentarán): {totals['failed']}"))
+
+        if options['purge']:
+            self.stdout.write(f"🧹 Eventos procesados purgados: {purge_processed()}")
+
+        if options['show_failed']:
+            failed = PredictionOutboxEvent.objects.filter(processed_at__isnull=True, attempts__gt=0)
+            for event in failed[:50]:
+                self.stdout.write(f"   #{event.id} {event.event_type} intentos={event.attempts} "
+                                  f"siguiente={event.available_at:%H:%M:%S} error={event.last_error[:120]}")
+
+        after = outbox_stats()
+        self.stdout.write(self.style.SUCCESS(f"📬 Pendientes tras drenar: {after['pending']}"))
@@ -0,0 +1,42 @@
+"""
+Comando para exportar pipeline.joblib al formato de arrays planos memory-mapped
+"""
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_models.flat_artifacts import export_pipeline, load_flat_artifact
+from ml_models.registry import model_registry
+
+
+class Command(BaseCommand):
+    help = 'Exporta el pipeline XGBoost a arrays planos (.npy) para compartirlos entre workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            default=os.path.join(settings.ML_MODELS_PATH, 'pipeline.joblib'),
+            help='Ruta del pipeline a exportar',
+        )
+        parser.add_argument(
+            '--output',
+            default=str(settings.ML_FLAT_PIPELINE_PATH),
+            help='Directorio de salida del artefacto plano',
+        )
+
+    def handle(self, *args, **options):
+        handle = model_registry.get(options['source'])
+        if handle is None:
+            raise CommandError(f"No se encontró el pipeline: {options['source']}")
+
+        self.stdout.write(f"📦 Exportando {os.path.basename(handle.path)} (versión {handle.version})...")
+        manifest = export_pipeline(handle.obj, options['output'], source_version=handle.version)
+
+        artifact = load_flat_artifact(options['output'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Exportado a {options['output']}: {manifest['n_trees']} árboles, "
+                f"{manifest['n_nodes']} nodos, {artifact.nbytes / 1024:.1f} KiB en arrays"
+            )
+        )
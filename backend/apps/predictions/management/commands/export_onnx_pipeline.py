@@ -0,0 +1,46 @@
+"""
+Comando para exportar pipeline.joblib (scaler + clasificador) a ONNX
+"""
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_models.onnx_artifacts import export_pipeline_onnx, load_onnx_artifact
+from ml_models.registry import model_registry
+
+
+class Command(BaseCommand):
+    help = 'Exporta el pipeline XGBoost a ONNX para servirlo con ONNX Runtime (ML_INFERENCE_BACKEND=onnx)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            default=os.path.join(settings.ML_MODELS_PATH, 'pipeline.joblib'),
+            help='Ruta del pipeline a exportar',
+        )
+        parser.add_argument(
+            '--output',
+            default=str(settings.ML_ONNX_PIPELINE_PATH),
+            help='Directorio de salida del artefacto ONNX',
+        )
+
+    def handle(self, *args, **options):
+        handle = model_registry.get(options['source'])
+        if handle is None:
+            raise CommandError(f"No se encontró el pipeline: {options['source']}")
+
+        self.stdout.write(f"📦 Exportando {os.path.basename(handle.path)} (versión {handle.version}) a ONNX...")
+        try:
+            manifest = export_pipeline_onnx(handle.obj, options['output'], source_version=handle.version)
+        except ImportError as e:
+            raise CommandError(f"Se requieren skl2onnx y onnxmltools para exportar: {e}")
+
+        artifact = load_onnx_artifact(options['output'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Exportado a {options['output']}: {len(manifest['feature_names'])} features, "
+                f"opset {manifest['opset']['']}/ml {manifest['opset']['ai.onnx.ml']}, "
+                f"{artifact.nbytes / 1024:.1f} KiB"
+            )
+        )
@@ -0,0 +1,139 @@
+"""
+Comando para medir la memoria por worker según el formato de carga del modelo
+
+Simula N workers de gunicorn creados con fork (como con preload_app) y
+reporta RSS, USS y PSS de cada uno antes y después de cargar el pipeline:
+  - flat:           cada worker mapea en memoria el artefacto de arrays planos
+  - joblib:         cada worker deserializa pipeline.joblib en su heap privado
+  - joblib-preload: el proceso maestro lo carga antes del fork (copy-on-write)
+
+Los modos se ejecutan en ese orden para que el maestro no haya importado
+scikit-learn/xgboost antes de medir los modos que no lo necesitan.
+"""
+import multiprocessing
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MODES = ['flat', 'joblib', 'joblib-preload']
+
+
+def _memory_snapshot():
+    import psutil
+
+    info = psutil.Process(os.getpid()).memory_full_info()
+    return {
+        'rss': info.rss,
+        'uss': getattr(info, 'uss', None),
+        'pss': getattr(info, 'pss', None),
+    }
+
+
+def _load_artifact(mode, pipeline_path, flat_path):
+    if mode == 'flat':
+        from ml_models.flat_artifacts import load_flat_artifact
+
+        artifact = load_flat_artifact(flat_path)
+        # Recorrer los arrays para forzar la lectura de todas las páginas
+        for array in artifact.arrays.values():
+            array.sum()
+        return artifact
+
+    import joblib
+    return joblib.load(pipeline_path)
+
+
+def _worker(mode, pipeline_path, flat_path, preloaded, ready_barrier, done_barrier, results):
+    before = _memory_snapshot()
+    if preloaded is None:
+        artifact = _load_artifact(mode, pipeline_path, flat_path)
+    else:
+        artifact = preloaded
+    # Esperar a que todos los workers hayan cargado para que el PSS
+    # refleje las páginas realmente compartidas
+    ready_barrier.wait()
+    after = _memory_snapshot()
+    results.put({'pid': os.getpid(), 'before': before, 'after': after})
+    done_barrier.wait()
+    del artifact
+
+
+class Command(BaseCommand):
+    help = 'Mide RSS/USS/PSS por worker con carga joblib privada, precargada o memory-mapped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número de workers simulados (default: 4)',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=MODES + ['all'],
+            default='all',
+            help='Formato de carga a medir (default: all)',
+        )
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError("La medición requiere procesos creados con fork (Linux/macOS)")
+
+        pipeline_path = os.path.join(settings.ML_MODELS_PATH, 'pipeline.joblib')
+        flat_path = str(settings.ML_FLAT_PIPELINE_PATH)
+        if not os.path.exists(pipeline_path):
+            raise CommandError(f"No se encontró el pipeline: {pipeline_path}")
+
+        modes = MODES if options['mode'] == 'all' else [options['mode']]
+        if 'flat' in modes and not os.path.isdir(flat_path):
+            raise CommandError("Artefacto plano no encontrado; ejecute primero export_flat_artifacts")
+
+        self.stdout.write(f"🧪 Midiendo memoria con {options['workers']} workers...")
+        for mode in modes:
+            self._measure(mode, options['workers'], pipeline_path, flat_path)
+
+    def _measure(self, mode, workers, pipeline_path, flat_path):
+        context = multiprocessing.get_context('fork')
+        ready_barrier = context.Barrier(workers)
+        done_barrier = context.Barrier(workers + 1)
+        results = context.Queue()
+
+        preloaded = _load_artifact(mode, pipeline_path, flat_path) if mode == 'joblib-preload' else None
+
+        processes = [
+            context.Process(
+                target=_worker,
+                args=(mode, pipeline_path, flat_path, preloaded, ready_barrier, done_barrier, results),
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        samples = [results.get(timeout=120) for _ in processes]
+        done_barrier.wait()
+        for process in processes:
+            process.join()
+
+        self.stdout.write(f"\n📊 Modo: {mode}")
+        self.stdout.write(f"{'PID':>8} {'RSS antes':>11} {'RSS después':>12} {'Δ RSS':>9} {'USS':>9} {'PSS':>9}")
+        for sample in sorted(samples, key=lambda s: s['pid']):
+            before, after = sample['before'], sample['after']
+            self.stdout.write(
+                f"{sample['pid']:>8} {self._mib(before['rss']):>11} {self._mib(after['rss']):>12} "
+                f"{self._mib(after['rss'] - before['rss']):>9} {self._mib(after['uss']):>9} "
+                f"{self._mib(after['pss']):>9}"
+            )
+
+        total_uss = sum(s['after']['uss'] or 0 for s in samples)
+        total_pss = sum(s['after']['pss'] or 0 for s in samples)
+        self.stdout.write(
+            self.style.SUCCESS(f"Total USS: {self._mib(total_uss)} | Total PSS: {self._mib(total_pss)}")
+        )
+
+    @staticmethod
+    def _mib(value):
+        if value is None:
+            return 'n/d'
+        return f"{value / (1024 * 1024):.1f}MiB"
@@ -0,0 +1,70 @@
+"""
+Comando para publicar una versión de un artefacto de ML y que todos los
+workers la recarguen en caliente (ver ml_models/hot_reload.py)
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_models.hot_reload import (
+    PUBLISHED_VERSION_KEY, get_published_versions, list_versions, publish_artifact, versions_dir,
+)
+
+
+class Command(BaseCommand):
+    help = 'Publica un artefacto de modelo (o una versión archivada) para recargarlo en caliente en todos los workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'source',
+            nargs='?',
+            help='Archivo del artefacto a publicar (p. ej. un pipeline.joblib reentrenado)',
+        )
+        parser.add_argument(
+            '--name',
+            help='Nombre del artefacto en ML_MODELS_PATH (default: nombre del archivo de origen)',
+        )
+        parser.add_argument(
+            '--version',
+            dest='artifact_version',
+            help='Volver a publicar una versión archivada de --name en lugar de un archivo',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Listar las versiones archivadas de --name y la publicada',
+        )
+
+    def handle(self, *args, **options):
+        name = options['name'] or (os.path.basename(options['source']) if options['source'] else None)
+        if not name:
+            raise CommandError("Indique el archivo a publicar o --name")
+
+        if options['list']:
+            published = (get_published_versions([name]) or {}).get(name)
+            versions = list_versions(name)
+            if not versions:
+                self.stdout.write(f"📭 No hay versiones archivadas de {name}")
+            for version in versions:
+                marker = '👉' if version == published else '  '
+                self.stdout.write(f"{marker} {version}")
+            return
+
+        if options['artifact_version']:
+            source = os.path.join(versions_dir(name), options['artifact_version'], name)
+            if not os.path.exists(source):
+                raise CommandError(f"No existe la versión {options['artifact_version']} de {name}")
+        else:
+            source = options['source']
+            if not source or not os.path.isfile(source):
+                raise CommandError(f"No se encontró el artefacto: {source}")
+
+        try:
+            target, version = publish_artifact(source, name=name)
+        except Exception as e:
+            raise CommandError(f"Error publicando {name}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {name} publicado en {target} (versión {version}, clave "
+            f"{PUBLISHED_VERSION_KEY.format(name=name)}); los workers lo recargarán en la próxima comprobación"
+        ))
@@ -0,0 +1,125 @@
+"""
+Comando para validar los backends alternativos (arrays planos, ONNX) contra
+pipeline.joblib y comparar su latencia por registro y por lote
+"""
+import json
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_models.registry import model_registry
+
+
+def synthetic_pipeline_inputs(n_rows, seed=42):
+    """Muestras sintéticas con rangos clínicos realistas en el orden del pipeline"""
+    rng = np.random.default_rng(seed)
+    ap_hi = rng.uniform(90, 200, n_rows)
+    ap_lo = rng.uniform(55, 120, n_rows)
+    return np.column_stack([
+        rng.uniform(29, 65, n_rows),          # age_years
+        rng.uniform(16, 45, n_rows),          # imc
+        ap_hi,                                # ap_hi
+        ap_lo,                                # ap_lo
+        ap_hi - ap_lo,                        # pulse_pressure
+        (ap_hi + 2 * ap_lo) / 3,              # map
+        rng.integers(1, 4, n_rows),           # cholesterol
+        rng.integers(1, 4, n_rows),           # gluc
+        rng.integers(0, 2, n_rows),           # smoke
+        rng.integers(0, 2, n_rows),           # alco
+        rng.integers(0, 2, n_rows),           # active
+    ]).astype(np.float64)
+
+
+class Command(BaseCommand):
+    help = 'Valida un backend alternativo (plano u ONNX) frente al pipeline XGBoost y mide latencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            choices=['flat', 'onnx'],
+            default='flat',
+            help='Backend a validar: flat (arrays planos) u onnx (ONNX Runtime) (default: flat)',
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=10000,
+            help='Número de registros sintéticos para la validación (default: 10000)',
+        )
+        parser.add_argument(
+            '--latency-iterations',
+            type=int,
+            default=500,
+            help='Iteraciones para medir latencia de un solo registro (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        import pandas as pd
+
+        backend = options['backend']
+        if backend == 'onnx':
+            try:
+                from ml_models.inference.onnx_model import OnnxPipelineModel as BackendModel, PARITY_TOLERANCE
+            except ImportError as e:
+                raise CommandError(f"onnxruntime no está instalado: {e}")
+            artifact_path, export_command = settings.ML_ONNX_PIPELINE_PATH, 'export_onnx_pipeline'
+        else:
+            from ml_models.inference.flat_evaluator import FlatPipelineModel as BackendModel, PARITY_TOLERANCE
+            artifact_path, export_command = settings.ML_FLAT_PIPELINE_PATH, 'export_flat_artifacts'
+
+        pipeline_path = os.path.join(settings.ML_MODELS_PATH, 'pipeline.joblib')
+        pipeline = model_registry.get_object(pipeline_path)
+        artifact = model_registry.get_object(artifact_path)
+        if pipeline is None or artifact is None:
+            raise CommandError(f"Se requieren pipeline.joblib y el artefacto {backend} ({export_command})")
+
+        if artifact.manifest.get('source_version') != model_registry.version_of(pipeline_path):
+            raise CommandError(f"El artefacto {backend} no corresponde a pipeline.joblib; vuelva a exportarlo")
+
+        backend_model = BackendModel(artifact)
+        feature_names = backend_model.feature_names
+
+        # 1. Muestra de referencia guardada junto al modelo
+        smoke_path = os.path.join(settings.ML_MODELS_PATH, 'smoke_test_output.json')
+        if os.path.exists(smoke_path):
+            with open(smoke_path) as smoke_file:
+                smoke = json.load(smoke_file)
+            sample = pd.DataFrame([smoke['input_sample']])[feature_names]
+            backend_proba = backend_model.predict_proba(sample)[0, 1]
+            diff = abs(backend_proba - smoke['proba_positive'])
+            self.stdout.write(f"🔬 Smoke test: esperado {smoke['proba_positive']:.10f}, "
+                              f"{backend} {backend_proba:.10f} (Δ {diff:.2e})")
+            if diff > PARITY_TOLERANCE:
+                raise CommandError(f"El backend {backend} no reproduce el smoke test")
+
+        # 2. Paridad sobre una muestra sintética grande
+        X = pd.DataFrame(synthetic_pipeline_inputs(options['samples']), columns=feature_names)
+        expected = pipeline.predict_proba(X)[:, 1]
+        obtained = backend_model.predict_proba(X)[:, 1]
+        max_diff = float(np.max(np.abs(expected - obtained)))
+        label_mismatches = int(np.sum((expected > 0.5) != (obtained > 0.5)))
+        self.stdout.write(f"🔬 Paridad en {len(X)} registros: Δ máx {max_diff:.2e}, "
+                          f"etiquetas distintas {label_mismatches}")
+        if max_diff > PARITY_TOLERANCE:
+            raise CommandError(f"Diferencia {max_diff:.2e} supera la tolerancia {PARITY_TOLERANCE:.0e}")
+
+        # 3. Latencia de un solo registro (camino /api/predictions/predict/) y del lote completo
+        single = X.iloc[[0]]
+        for name, model in (('sklearn', pipeline), (backend, backend_model)):
+            timings = []
+            for _ in range(options['latency_iterations']):
+                start_time = time.perf_counter()
+                model.predict_proba(single)
+                timings.append((time.perf_counter() - start_time) * 1000)
+            start_time = time.perf_counter()
+            model.predict_proba(X)
+            batch_ms = (time.perf_counter() - start_time) * 1000
+            self.stdout.write(
+                f"⏱️  {name:<8} 1 registro p50 {np.percentile(timings, 50):.3f}ms "
+                f"p99 {np.percentile(timings, 99):.3f}ms | {len(X)} registros {batch_ms:.1f}ms"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Backend {backend} validado (tolerancia {PARITY_TOLERANCE:.0e})"))
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.24 on 2026-10-17 06:55
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionOutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('cache_prediction', 'Cachear resultado de predicción'), ('invalidate_patient_lists', 'Invalidar listados de pacientes'), ('notify_high_risk', 'Notificar alto riesgo')], max_length=40)),
+                ('payload', models.JSONField(default=dict)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, help_text='No se procesa antes (reintentos con espera)')),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='predictionoutboxevent',
+            index=models.Index(fields=['processed_at', 'available_at'], name='predictions_process_d01264_idx'),
+        ),
+    ]
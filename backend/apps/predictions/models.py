@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from apps.patients.models import Patient, MedicalRecord
 import uuid
 
@@ -59,3 +60,32 @@ class ModelPerformance(models.Model):
 
     def __str__(self):
         return f"Performance {self.model_version} - Accuracy: {self.accuracy:.3f}"
+
+class PredictionOutboxEvent(models.Model):
+    """
+    Efecto secundario de una predicción pendiente de aplicar (patrón outbox).
+    Se inserta en la misma transacción que la predicción y lo aplica en lotes
+    la tarea `drain_prediction_outbox` (ver apps/predictions/outbox.py).
+    """
+    EVENT_TYPES = [
+        ('cache_prediction', 'Cachear resultado de predicción'),
+        ('invalidate_patient_lists', 'Invalidar listados de pacientes'),
+        ('notify_high_risk', 'Notificar alto riesgo'),
+    ]
+
+    event_type = models.CharField(max_length=40, choices=EVENT_TYPES)
+    payload = models.JSONField(default=dict)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now, help_text="No se procesa antes (reintentos con espera)")
+    processed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['processed_at', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.event_type} #{self.id} ({'procesado' if self.processed_at else 'pendiente'})"
@@ -0,0 +1,264 @@
+"""
+Outbox transaccional de los efectos secundarios de /predict/
+
+La escritura de la predicción (apps/predictions/write_path.py) inserta en la
+misma transacción, con un único INSERT, un PredictionOutboxEvent por efecto:
+
+  - cache_prediction:          resultado serializado en la caché de predicciones
+  - invalidate_patient_lists:  generación de listados de pacientes y estadísticas
+  - notify_high_risk:          email a HIGH_RISK_NOTIFICATION_EMAILS (solo riesgo alto)
+
+La respuesta HTTP sale en cuanto la transacción confirma. La tarea
+`drain_prediction_outbox` (Celery beat, cada PREDICTION_OUTBOX_DRAIN_INTERVAL
+segundos; también el comando `drain_outbox`) reclama lotes de eventos
+pendientes con `select_for_update(skip_locked=True)` en una transacción
+corta que solo los reserva (`available_at` + PREDICTION_OUTBOX_LEASE_SECONDS)
+— varios workers no se pisan — y los aplica después del commit, agrupados
+por tipo: una consulta para todas las predicciones del lote, una
+invalidación de listados por lote y un único envío de emails. Un error de
+base de datos en un efecto no aborta ninguna transacción que obligue a
+repetir el lote entero (y a reenviar sus emails).
+
+Entrega al menos una vez: un evento solo se marca procesado después de
+aplicar su efecto; si el worker cae antes, el lote vuelve a estar
+disponible al vencer la reserva (los efectos son idempotentes salvo el
+email, que puede duplicarse). Los fallos se reintentan con espera
+exponencial hasta PREDICTION_OUTBOX_MAX_ATTEMPTS.
+"""
+
+import logging
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Prediction, PredictionOutboxEvent
+
+logger = logging.getLogger('cardiovascular.predictions')
+
+HIGH_RISK_LEVELS = ('ALTO',)
+
+# Espera máxima entre reintentos de un evento (segundos)
+MAX_RETRY_DELAY = 3600
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def build_prediction_events(prediction: Prediction, medical_cache_data: Optional[Dict[str, Any]]) -> List[PredictionOutboxEvent]:
+    """Eventos (sin guardar) de los efectos secundarios de una predicción"""
+    events = []
+    if medical_cache_data is not None:
+        events.append(PredictionOutboxEvent(
+            event_type='cache_prediction',
+            payload={'prediction_id': str(prediction.id), 'medical_cache_data': medical_cache_data},
+        ))
+    events.append(PredictionOutboxEvent(
+        event_type='invalidate_patient_lists',
+        payload={'patient_id': str(prediction.patient_id)},
+    ))
+    if str(prediction.riesgo_nivel).upper() in HIGH_RISK_LEVELS:
+        events.append(PredictionOutboxEvent(
+            event_type='notify_high_risk',
+            payload={'prediction_id': str(prediction.id)},
+        ))
+    return events
+
+
+def record_prediction_events(prediction: Prediction, medical_cache_data: Optional[Dict[str, Any]] = None):
+    """Inserta los eventos de una predicción; llamar dentro de su transacción"""
+    PredictionOutboxEvent.objects.bulk_create(build_prediction_events(prediction, medical_cache_data))
+
+
+# --- Handlers por tipo: reciben el lote y devuelven los eventos fallidos -----
+
+def _load_predictions(events: Iterable[PredictionOutboxEvent]) -> Dict[str, Prediction]:
+    ids = {event.payload.get('prediction_id') for event in events}
+    predictions = Prediction.objects.select_related('patient', 'medical_record').filter(id__in=ids)
+    return {str(prediction.id): prediction for prediction in predictions}
+
+
+def _cache_predictions(events: List[PredictionOutboxEvent]) -> List[PredictionOutboxEvent]:
+    from .cache_service import cache_service
+    from .serializers import PredictionSerializer
+
+    predictions = _load_predictions(events)
+    failed = []
+    for event in events:
+        prediction = predictions.get(event.payload.get('prediction_id'))
+        if prediction is None:
+            # Predicción borrada después de crearse: no hay nada que cachear
+            continue
+        result = dict(PredictionSerializer(prediction).data)
+        result['risk_level'] = prediction.riesgo_nivel
+        result['confidence'] = prediction.confidence_score
+        if not cache_service.set_prediction_cache(event.payload.get('medical_cache_data') or {}, result):
+            failed.append(event)
+    return failed
+
+
+def _invalidate_patient_lists(events: List[PredictionOutboxEvent]) -> List[PredictionOutboxEvent]:
+    from .cache_service import cache_service
+
+    # Una invalidación (un INCR por etiqueta) cubre todos los eventos del lote
+    cache_service.invalidate_patient_lists()
+    cache_service.invalidate_prediction_stats()
+    return []
+
+
+def _notify_high_risk(events: List[PredictionOutboxEvent]) -> List[PredictionOutboxEvent]:
+    recipient_list = _setting('HIGH_RISK_NOTIFICATION_EMAILS', [])
+    if not recipient_list:
+        logger.warning("No hay emails configurados para notificaciones de alto riesgo")
+        return []
+
+    predictions = _load_predictions(events)
+    messages = []
+    for event in events:
+        prediction = predictions.get(event.payload.get('prediction_id'))
+        if prediction is None:
+            continue
+        patient = prediction.patient
+        subject = f'ALERTA: Alto Riesgo Cardiovascular - {patient.nombre} {patient.apellidos}'
+        message = f"""
+        Se ha detectado ALTO RIESGO cardiovascular en el paciente:
+
+        Paciente: {patient.nombre} {patient.apellidos}
+        DNI: {patient.dni}
+        Probabilidad: {prediction.probabilidad:.1f}%
+        Confianza: {prediction.confidence_score:.2%}
+        Fecha: {prediction.created_at.strftime('%d/%m/%Y %H:%M')}
+
+        Por favor, revise inmediatamente el caso en el sistema.
+        """
+        messages.append((subject, message, settings.DEFAULT_FROM_EMAIL, recipient_list))
+
+    # Una sola conexión SMTP para todo el lote
+    send_mass_mail(messages, fail_silently=False)
+    logger.info(f"Notificaciones de alto riesgo enviadas: {len(messages)}")
+    return []
+
+
+EVENT_HANDLERS = {
+    'cache_prediction': _cache_predictions,
+    'invalidate_patient_lists': _invalidate_patient_lists,
+    'notify_high_risk': _notify_high_risk,
+}
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(MAX_RETRY_DELAY, 5 * 2 ** attempts))
+
+
+def _claim_batch(batch_size: int) -> List[PredictionOutboxEvent]:
+    """
+    Reserva un lote de eventos pendientes en una transacción corta: los
+    demás workers no los verán hasta que venza PREDICTION_OUTBOX_LEASE_SECONDS
+    """
+    max_attempts = _setting('PREDICTION_OUTBOX_MAX_ATTEMPTS', 10)
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            PredictionOutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True, available_at__lte=now, attempts__lt=max_attempts)
+            .order_by('id')[:batch_size]
+        )
+        if events:
+            lease = timedelta(seconds=_setting('PREDICTION_OUTBOX_LEASE_SECONDS', 300))
+            PredictionOutboxEvent.objects.filter(id__in=[event.id for event in events]).update(
+                available_at=now + lease,
+            )
+    return events
+
+
+def drain_batch(batch_size: Optional[int] = None) -> Dict[str, int]:
+    """
+    Aplica un lote de eventos pendientes. Devuelve cuántos se procesaron y
+    cuántos fallaron (se reintentan más tarde).
+    """
+    events = _claim_batch(batch_size or _setting('PREDICTION_OUTBOX_BATCH_SIZE', 200))
+    if not events:
+        return {'processed': 0, 'failed': 0}
+
+    by_type: Dict[str, List[PredictionOutboxEvent]] = {}
+    for event in events:
+        by_type.setdefault(event.event_type, []).append(event)
+
+    # Efectos fuera de cualquier transacción: ya están reservados para este worker
+    failed: Dict[int, str] = {}
+    for event_type, typed_events in by_type.items():
+        handler = EVENT_HANDLERS.get(event_type)
+        if handler is None:
+            for event in typed_events:
+                failed[event.id] = f"Tipo de evento desconocido: {event_type}"
+            continue
+        try:
+            for event in handler(typed_events):
+                failed[event.id] = f"{event_type}: el efecto no se pudo aplicar"
+        except Exception as e:
+            logger.error(f"Error aplicando eventos outbox {event_type}: {e}")
+            for event in typed_events:
+                failed[event.id] = f"{e.__class__.__name__}: {e}"
+
+    processed_ids = [event.id for event in events if event.id not in failed]
+    retried = [event for event in events if event.id in failed]
+    for event in retried:
+        event.attempts += 1
+        event.last_error = failed[event.id][:2000]
+        event.available_at = timezone.now() + _retry_delay(event.attempts)
+    with transaction.atomic():
+        PredictionOutboxEvent.objects.filter(id__in=processed_ids).update(processed_at=timezone.now())
+        PredictionOutboxEvent.objects.bulk_update(retried, ['attempts', 'last_error', 'available_at'])
+
+    if retried:
+        logger.warning(f"Outbox: {len(retried)} eventos fallidos se reintentarán")
+    return {'processed': len(processed_ids), 'failed': len(retried)}
+
+
+def drain(max_batches: int = 50, batch_size: Optional[int] = None) -> Dict[str, int]:
+    """Drena lotes hasta vaciar los pendientes disponibles (o `max_batches`)"""
+    totals = {'processed': 0, 'failed': 0, 'batches': 0}
+    for _ in range(max_batches):
+        result = drain_batch(batch_size)
+        if not result['processed'] and not result['failed']:
+            break
+        totals['batches'] += 1
+        totals['processed'] += result['processed']
+        totals['failed'] += result['failed']
+        if result['processed'] + result['failed'] < (batch_size or _setting('PREDICTION_OUTBOX_BATCH_SIZE', 200)):
+            break
+    return totals
+
+
+def purge_processed(retention_days: Optional[int] = None) -> int:
+    """Borra los eventos procesados hace más de `retention_days` días"""
+    retention_days = retention_days or _setting('PREDICTION_OUTBOX_RETENTION_DAYS', 7)
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted, _ = PredictionOutboxEvent.objects.filter(processed_at__lt=cutoff).delete()
+    return deleted
+
+
+def outbox_stats() -> Dict[str, Any]:
+    max_attempts = _setting('PREDICTION_OUTBOX_MAX_ATTEMPTS', 10)
+    pending = PredictionOutboxEvent.objects.filter(processed_at__isnull=True)
+    oldest = pending.order_by('created_at').values_list('created_at', flat=True).first()
+    return {
+        'pending': pending.filter(attempts__lt=max_attempts).count(),
+        'dead': pending.filter(attempts__gte=max_attempts).count(),
+        'oldest_pending_age_s': round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0.0,
+    }
+
+
+@shared_task(ignore_result=True)
+def drain_prediction_outbox():
+    """Tarea periódica: drena el outbox y purga los eventos antiguos"""
+    totals = drain()
+    purged = purge_processed()
+    if totals['processed'] or totals['failed'] or purged:
+        logger.info(f"Outbox drenado: {totals}, purgados {purged}")
+    return {**totals, 'purged': purged}
@@ -1,22 +1,28 @@
 from django.core.cache import cache
 from django.conf import settings
-import joblib
 import numpy as np
 from .models import Prediction, ModelPerformance
 from .validators import MedicalDataValidator, ValidationResult
 import logging
 from pathlib import Path
 from ml_models.cardiovascular_predictor_clean import cardiovascular_predictor
+from ml_models.features import RAW_SERVICE_PROFILE, SERVICE_PROFILE, feature_pipeline
+from ml_models.timing import span
+from ml_models.registry import LazyModelsMixin, model_registry
 
 logger = logging.getLogger(__name__)
 
-class PredictionService:
+class PredictionService(LazyModelsMixin):
     def __init__(self):
-        self.model = self._load_model()
-        self.scaler = self._load_scaler()
+        # Modelo y scaler se cargan en el primer acceso (ver LazyModelsMixin)
         self.validator = MedicalDataValidator()
         self.cache_ttl = getattr(settings, 'CACHE_TTL', 300)
 
+    def load_models(self):
+        """Carga modelo y scaler desde el registro compartido"""
+        self.model = self._load_model()
+        self.scaler = self._load_scaler()
+
     def _load_model(self):
         """Carga el modelo desde el archivo guardado"""
         try:
@@ -29,7 +35,9 @@ class PredictionService:
                     logger.warning("El modelo no está disponible. Se usará un modelo simulado.")
                     return None
             logger.info(f"Cargando modelo desde: {model_path}")
-            return joblib.load(model_path)
+            handle = model_registry.get(model_path)
+            self.model_version = handle.version
+            return handle.obj
         except Exception as e:
             logger.error(f"Error cargando el modelo: {str(e)}")
             return None
@@ -46,7 +54,7 @@ class PredictionService:
                     logger.warning("El scaler no está disponible. Se usará normalización básica.")
                     return None
             logger.info(f"Cargando scaler desde: {scaler_path}")
-            return joblib.load(scaler_path)
+            return model_registry.get_object(scaler_path)
         except Exception as e:
             logger.error(f"Error cargando el scaler: {str(e)}")
             return None
@@ -63,25 +71,20 @@ class PredictionService:
         """Genera una clave única para el caché"""
         return f"prediction_{patient_id}_{medical_record_id}"
 
+    def score(self, medical_record):
+        """Resultado del predictor unificado para un registro (no toca la base de datos)"""
+        with span('service.predictor'):
+            return cardiovascular_predictor.predict_cardiovascular_risk(medical_record)
+
     def get_prediction(self, patient, medical_record):
         """Obtiene una predicción usando el predictor unificado"""
         try:
             # Usar el predictor unificado corregido
-            prediction_result = cardiovascular_predictor.predict_cardiovascular_risk(medical_record)
+            prediction_result = self.score(medical_record)
 
             # Crear objeto Prediction con el resultado
-            prediction = Prediction.objects.create(
-                patient=patient,
-                medical_record=medical_record,
-                riesgo_nivel=prediction_result['riesgo_nivel'],
-                probabilidad=prediction_result['probabilidad'],
-                factores_riesgo=prediction_result.get('factores_riesgo', []),
-                recomendaciones=prediction_result.get('recomendaciones', []),
-                scores_detallados=prediction_result.get('scores_detallados', {}),
-                confidence_score=prediction_result.get('confidence_score', 0.5),
-                model_version=prediction_result.get('model_version', 'v1.0.0'),
-                features_used=prediction_result.get('features_used', {})
-            )
+            with span('service.persist'):
+                prediction = self.create_prediction(patient, medical_record, prediction_result)
 
             logger.info(f"Predicción creada exitosamente para paciente {patient.id} usando predictor unificado")
             return prediction
@@ -90,6 +93,21 @@ class PredictionService:
             logger.error(f"Error en predicción usando predictor unificado: {str(e)}")
             raise
 
+    def create_prediction(self, patient, medical_record, prediction_result):
+        """Persiste el resultado del predictor como objeto Prediction"""
+        return Prediction.objects.create(
+            patient=patient,
+            medical_record=medical_record,
+            riesgo_nivel=prediction_result['riesgo_nivel'],
+            probabilidad=prediction_result['probabilidad'],
+            factores_riesgo=prediction_result.get('factores_riesgo', []),
+            recomendaciones=prediction_result.get('recomendaciones', []),
+            scores_detallados=prediction_result.get('scores_detallados', {}),
+            confidence_score=prediction_result.get('confidence_score', 0.5),
+            model_version=prediction_result.get('model_version', 'v1.0.0'),
+            features_used=prediction_result.get('features_used', {})
+        )
+
     def predict_from_data(self, data_dict):
         """Hace una predicción usando datos directos con el predictor unificado"""
         try:
@@ -142,74 +160,21 @@ class PredictionService:
             }
 
     def _prepare_features_validated(self, patient, medical_record, validation_result: ValidationResult):
-        """Prepara features con validación robusta y valores seguros"""
+        """Prepara features con validación robusta y valores seguros (ver ml_models.features)"""
         try:
-            # Calcular edad de forma segura
-            from datetime import date
-            if patient.fecha_nacimiento:
-                today = date.today()
-                age = today.year - patient.fecha_nacimiento.year - (
-                    (today.month, today.day) < (patient.fecha_nacimiento.month, patient.fecha_nacimiento.day)
-                )
-            else:
-                age = 0
-                logger.warning("Fecha de nacimiento no disponible, usando edad 0")
-            
-            # Calcular IMC de forma segura
-            if patient.peso and patient.altura and patient.altura > 0:
-                imc = patient.peso / ((patient.altura / 100) ** 2)
-            else:
-                imc = 25.0  # Valor por defecto seguro
-                logger.warning(f"Datos de peso/altura incompletos, usando IMC por defecto: {imc}")
-            
-            # Calcular índice de paquetes/año de forma segura
-            if medical_record.anos_tabaquismo and medical_record.anos_tabaquismo > 0:
-                indice_paquetes = (medical_record.cigarrillos_dia / 20) * medical_record.anos_tabaquismo
-            else:
-                indice_paquetes = 0
-            
-            # Mapear actividad física con validación
-            actividad_mapping = {'sedentario': 0, 'ligero': 1, 'moderado': 2, 'intenso': 3}
-            actividad_fisica = getattr(medical_record, 'actividad_fisica', 'sedentario')
-            actividad_fisica_encoded = actividad_mapping.get(actividad_fisica, 0)
-            
-            # Codificar sexo con validación
-            sexo_encoded = 1 if patient.sexo == 'M' else 0
-            
-            # Codificar antecedentes con validación
-            antecedentes_mapping = {'si': 1, 'no': 0, 'desconoce': 0.5}
-            antecedentes = getattr(medical_record, 'antecedentes_cardiacos', 'no')
-            antecedentes_encoded = antecedentes_mapping.get(antecedentes, 0)
-            
-            # Usar valores por defecto seguros para datos faltantes
-            safe_defaults = self.validator.get_safe_defaults(patient, medical_record)
-            
-            features = [
-                age,
-                imc,
-                medical_record.presion_sistolica,
-                medical_record.presion_diastolica,
-                medical_record.colesterol or safe_defaults.get('colesterol', 180),
-                medical_record.glucosa or safe_defaults.get('glucosa', 100),
-                indice_paquetes,
-                actividad_fisica_encoded,
-                sexo_encoded,
-                antecedentes_encoded
-            ]
-            
-            features = np.array(features, dtype=np.float32)
-            
+            features = feature_pipeline.vector(medical_record, SERVICE_PROFILE)
+
             # Validación final de features
             if np.isnan(features).any():
                 nan_indices = np.where(np.isnan(features))[0]
                 raise ValueError(f"Features contienen NaN en posiciones: {nan_indices}")
-            
+
             if np.isinf(features).any():
                 inf_indices = np.where(np.isinf(features))[0]
                 raise ValueError(f"Features contienen valores infinitos en posiciones: {inf_indices}")
-            
+
             return features
-            
+
         except Exception as e:
             logger.error(f"Error preparando features validados: {str(e)}")
             raise ValueError(f"Error al preparar los datos para la predicción: {str(e)}")
@@ -217,40 +182,7 @@ class PredictionService:
     def _prepare_features(self, patient, medical_record):
         """Prepara los features para el modelo, igual que en el entrenamiento"""
         try:
-            # Calcular edad desde fecha de nacimiento
-            from datetime import date
-            if patient.fecha_nacimiento:
-                today = date.today()
-                age = today.year - patient.fecha_nacimiento.year - ((today.month, today.day) < (patient.fecha_nacimiento.month, patient.fecha_nacimiento.day))
-            else:
-                age = 0
-            
-            # Calcular IMC
-            imc = patient.peso / ((patient.altura / 100) ** 2) if patient.altura else 0
-            # Calcular índice de paquetes/año
-            indice_paquetes = (medical_record.cigarrillos_dia / 20) * medical_record.anos_tabaquismo if medical_record.anos_tabaquismo else 0
-            # Codificar actividad física
-            actividad_mapping = {'sedentario': 0, 'ligero': 1, 'moderado': 2, 'intenso': 3}
-            actividad_fisica_encoded = actividad_mapping.get(medical_record.actividad_fisica, 0)
-            # Codificar sexo
-            sexo_encoded = 1 if patient.sexo == 'M' else 0
-            # Codificar antecedentes
-            antecedentes_mapping = {'si': 1, 'no': 0, 'desconoce': 0.5}
-            antecedentes_encoded = antecedentes_mapping.get(medical_record.antecedentes_cardiacos, 0)
-
-            features = [
-                age,
-                imc,
-                medical_record.presion_sistolica,
-                medical_record.presion_diastolica,
-                medical_record.colesterol or 0,
-                medical_record.glucosa or 0,
-                indice_paquetes,
-                actividad_fisica_encoded,
-                sexo_encoded,
-                antecedentes_encoded
-            ]
-            features = np.array(features, dtype=np.float32)
+            features = feature_pipeline.vector(medical_record, RAW_SERVICE_PROFILE)
             if np.isnan(features).any() or np.isinf(features).any():
                 raise ValueError("Los datos contienen valores inválidos (NaN o infinitos)")
             return features
@@ -463,15 +395,29 @@ class PredictionService:
         return max(0.3, min(0.99, adjusted_confidence))
 
     def batch_predict(self, data_list):
-        """Realiza predicciones en lote"""
-        results = []
-        for data in data_list:
+        """Realiza predicciones en lote con una única inferencia vectorizada"""
+        results = [None] * len(data_list)
+
+        valid_items = []
+        for index, data in enumerate(data_list):
+            try:
+                valid_items.append((index, data['patient'], data['medical_record']))
+            except Exception as e:
+                logger.error(f"Error en predicción en lote: {str(e)}")
+
+        try:
+            prediction_results = cardiovascular_predictor.predict_many(
+                [medical_record for _, _, medical_record in valid_items]
+            )
+        except Exception as e:
+            logger.error(f"Error en predicción en lote: {str(e)}")
+            return results
+
+        for (index, patient, medical_record), prediction_result in zip(valid_items, prediction_results):
             try:
-                prediction = self.get_prediction(data['patient'], data['medical_record'])
-                results.append(prediction)
+                results[index] = self.create_prediction(patient, medical_record, prediction_result)
             except Exception as e:
                 logger.error(f"Error en predicción en lote: {str(e)}")
-                results.append(None)
         return results
 
     def update_model_performance(self, predictions, actual_outcomes):
@@ -490,7 +436,7 @@ class PredictionService:
             }
             
             ModelPerformance.objects.create(
-                model_version=self.model.version if hasattr(self.model, 'version') else 'v1.0.0',
+                model_version=self.model_version or 'v1.0.0',
                 **metrics,
                 total_predictions=len(predictions),
                 correct_predictions=sum(1 for p, a in zip(y_pred, actual_outcomes) if p == a)
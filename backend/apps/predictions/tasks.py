@@ -3,18 +3,40 @@ Tareas asíncronas para el sistema de predicciones cardiovasculares
 """
 
 import logging
+import os
 from celery import shared_task
 from django.core.mail import send_mail
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from datetime import datetime, timedelta
 from apps.patients.models import Patient, MedicalRecord
-from apps.predictions.models import PredictionResult
+from apps.predictions.models import Prediction
+from apps.predictions.outbox import record_prediction_events
 from apps.predictions.services import PredictionService
 from apps.predictions.validators import MedicalDataValidator
+from ml_models.hot_reload import model_reload_watcher
 
 logger = logging.getLogger('cardiovascular.tasks')
 
+# Servicio de predicción del proceso worker, reutilizado entre tareas
+_prediction_service = None
+
+
+def get_prediction_service():
+    """
+    Devuelve el PredictionService del proceso worker. Los modelos se cargan
+    una sola vez por proceso y solo se recargan cuando hay una versión nueva
+    (publicada o en disco, según ML_MODEL_RELOAD_MODE).
+    """
+    global _prediction_service
+    if _prediction_service is None:
+        _prediction_service = PredictionService()
+    else:
+        changed = model_reload_watcher.maybe_reload()
+        if changed:
+            logger.info(f"Modelos recargados en el worker {os.getpid()}: {len(changed)} artefactos")
+    return _prediction_service
+
 @shared_task(bind=True, retry_backoff=True, max_retries=3)
 def predict_cardiovascular_risk_async(self, patient_id, medical_data):
     """
@@ -37,9 +59,21 @@ def predict_cardiovascular_risk_async(self, patient_id, medical_data):
             logger.error(f"Paciente {patient_id} no encontrado")
             raise Exception(f"Paciente {patient_id} no encontrado")
         
+        # Registro médico con los campos del modelo presentes en los datos
+        record_fields = {
+            field.name for field in MedicalRecord._meta.concrete_fields
+            if field.name not in ('id', 'patient', 'created_at', 'updated_at')
+        }
+        medical_record = MedicalRecord(
+            patient=patient,
+            **{key: value for key, value in medical_data.items() if key in record_fields}
+        )
+        if not medical_record.edad and patient.fecha_nacimiento:
+            medical_record.edad = patient.age
+
         # Validar datos médicos
         validator = MedicalDataValidator()
-        validation_result = validator.validate(medical_data)
+        validation_result = validator.validate_patient_data(patient, medical_record)
         
         if not validation_result.is_valid:
             logger.warning(f"Datos médicos inválidos para paciente {patient_id}: {validation_result.errors}")
@@ -49,34 +83,26 @@ def predict_cardiovascular_risk_async(self, patient_id, medical_data):
                 'validation_errors': validation_result.errors
             }
         
-        # Realizar predicción
-        prediction_service = PredictionService()
-        prediction_result = prediction_service.predict(patient, medical_data)
-        
-        # Guardar resultado
-        prediction_record = PredictionResult.objects.create(
-            patient=patient,
-            risk_level=prediction_result['risk_level'],
-            probability=prediction_result['probability'],
-            confidence_score=prediction_result['confidence_score'],
-            features_used=prediction_result.get('features_used', {}),
-            model_version=prediction_result.get('model_version', '1.0'),
-            created_by_id=medical_data.get('created_by_id'),
-            is_async=True
-        )
-        
-        logger.info(f"Predicción completada para paciente {patient_id}: {prediction_result['risk_level']}")
+        # Realizar predicción con el servicio del proceso worker (modelos ya cargados)
+        prediction_service = get_prediction_service()
+        prediction_result = prediction_service.score(medical_record)
+
+        # Registro, predicción y eventos outbox (invalidación de listados y,
+        # si es alto riesgo, la notificación) en una sola transacción: la
+        # notificación la envía drain_prediction_outbox tras el commit
+        with transaction.atomic():
+            medical_record.save()
+            prediction_record = prediction_service.create_prediction(patient, medical_record, prediction_result)
+            record_prediction_events(prediction_record)
         
-        # Enviar notificación por email si es alto riesgo
-        if prediction_result['risk_level'] == 'Alto':
-            send_high_risk_notification.delay(patient_id, prediction_record.id)
+        logger.info(f"Predicción completada para paciente {patient_id}: {prediction_record.riesgo_nivel}")
         
         return {
             'success': True,
-            'prediction_id': prediction_record.id,
-            'risk_level': prediction_result['risk_level'],
-            'probability': prediction_result['probability'],
-            'confidence_score': prediction_result['confidence_score']
+            'prediction_id': str(prediction_record.id),
+            'risk_level': prediction_record.riesgo_nivel,
+            'probability': prediction_record.probabilidad,
+            'confidence_score': prediction_record.confidence_score
         }
         
     except Exception as e:
@@ -103,7 +129,7 @@ def send_high_risk_notification(patient_id, prediction_id):
     """
     try:
         patient = Patient.objects.get(id=patient_id)
-        prediction = PredictionResult.objects.get(id=prediction_id)
+        prediction = Prediction.objects.get(id=prediction_id)
         
         subject = f'ALERTA: Alto Riesgo Cardiovascular - {patient.nombre} {patient.apellidos}'
         message = f"""
@@ -111,7 +137,7 @@ def send_high_risk_notification(patient_id, prediction_id):
         
         Paciente: {patient.nombre} {patient.apellidos}
         DNI: {patient.dni}
-        Probabilidad: {prediction.probability:.2%}
+        Probabilidad: {prediction.probabilidad:.1f}%
         Confianza: {prediction.confidence_score:.2%}
         Fecha: {prediction.created_at.strftime('%d/%m/%Y %H:%M')}
         
@@ -145,21 +171,17 @@ def cleanup_old_predictions():
         # Eliminar predicciones más antiguas de 90 días
         cutoff_date = datetime.now() - timedelta(days=90)
         
-        old_predictions = PredictionResult.objects.filter(
-            created_at__lt=cutoff_date,
-            is_archived=False
-        )
+        # Prediction no tiene marca de archivado: se informa del volumen sin
+        # borrar historial clínico
+        old_predictions = Prediction.objects.filter(created_at__lt=cutoff_date)
         
         count = old_predictions.count()
         
-        # Marcar como archivadas en lugar de eliminar
-        old_predictions.update(is_archived=True)
-        
-        logger.info(f"Se archivaron {count} predicciones antiguas")
+        logger.info(f"Predicciones con más de 90 días: {count}")
         
         return {
             'success': True,
-            'archived_count': count,
+            'old_count': count,
             'cutoff_date': cutoff_date.isoformat()
         }
         
@@ -268,14 +290,14 @@ def generate_prediction_report(report_type='daily', date_range=None):
                 start_date = end_date - timedelta(days=1)
         
         # Obtener estadísticas
-        predictions = PredictionResult.objects.filter(
+        predictions = Prediction.objects.filter(
             created_at__range=[start_date, end_date]
         )
         
         total_predictions = predictions.count()
-        high_risk_count = predictions.filter(risk_level='Alto').count()
-        medium_risk_count = predictions.filter(risk_level='Medio').count()
-        low_risk_count = predictions.filter(risk_level='Bajo').count()
+        high_risk_count = predictions.filter(riesgo_nivel__iexact='Alto').count()
+        medium_risk_count = predictions.filter(riesgo_nivel__iexact='Medio').count()
+        low_risk_count = predictions.filter(riesgo_nivel__iexact='Bajo').count()
         
         avg_confidence = predictions.aggregate(
             avg_confidence=models.Avg('confidence_score')
@@ -0,0 +1,284 @@
+import datetime
+from unittest import mock
+
+import numpy as np
+from celery.exceptions import Retry
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.patients.models import MedicalRecord, Patient
+from apps.predictions.cache_service import TwoTierCache, cache_service
+from apps.predictions.outbox import _claim_batch, drain_batch
+from apps.predictions.models import Prediction, PredictionOutboxEvent
+from apps.predictions.services import PredictionService
+from apps.predictions.tasks import predict_cardiovascular_risk_async, send_high_risk_notification
+from apps.predictions.write_path import PREDICT_MAX_STATEMENTS, PredictWriteService, is_data_statement
+from config.middleware.cache_middleware import CacheInvalidationMiddleware
+from ml_models.clinical_scores import framingham_scores, reynolds_scores
+from ml_models.features import PREDICTOR_PROFILE, FeaturePipeline, feature_pipeline
+
+
+class FraminghamHDLBoundaryTests(SimpleTestCase):
+    """Tramos de HDL del Framingham: <35 → 2 puntos, <45 → 1, resto (o ausente) → 0"""
+
+    def _scores(self, hdl):
+        size = len(hdl)
+        # Resto de factores en su tramo de 0 puntos: el score es 2 × puntos de HDL
+        return framingham_scores(
+            edad=np.full(size, 30.0),
+            sexo_encoded=np.ones(size),
+            colesterol=np.full(size, 150.0),
+            colesterol_hdl=np.array(hdl, dtype=np.float64),
+            presion_sistolica=np.full(size, 120.0),
+            diabetes_encoded=np.zeros(size),
+            indice_paquetes=np.zeros(size),
+        )
+
+    def test_boundaries(self):
+        scores = self._scores([34, 35, 44, 45, 60, np.nan])
+        self.assertEqual(scores.tolist(), [4, 2, 2, 0, 0, 0])
+
+    def test_reynolds_follows_framingham(self):
+        framingham = self._scores([34, 35, 44, 45])
+        reynolds = reynolds_scores(framingham, antecedentes_encoded=np.ones(4), imc=np.full(4, 25.0))
+        np.testing.assert_allclose(reynolds, [4.8, 2.4, 2.4, 0.0])
+
+
+class FeaturePipelineCacheTests(TestCase):
+    """La clave del caché de etapas sigue las versiones del registro y del paciente"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='medico', password='x')
+        patient = Patient.objects.create(
+            dni='12345678', numero_historia='HC-1', nombre='Ana', apellidos='Pérez',
+            fecha_nacimiento=datetime.date(1960, 1, 1), sexo='F', peso=70, altura=170,
+            medico_tratante=user,
+        )
+        self.record = MedicalRecord.objects.create(
+            patient=patient, presion_sistolica=130, presion_diastolica=80, colesterol=200, glucosa=95,
+        )
+        self.pipeline = FeaturePipeline()
+
+    def _features(self):
+        record = MedicalRecord.objects.select_related('patient').get(pk=self.record.pk)
+        return self.pipeline.features(record, PREDICTOR_PROFILE)
+
+    def test_unchanged_record_hits_cache(self):
+        self._features()
+        self._features()
+        # Primera llamada: etapas `registro` y perfil; segunda: solo el perfil, en caché
+        self.assertEqual((self.pipeline.misses, self.pipeline.hits), (2, 1))
+
+    def test_record_updated_elsewhere_is_recomputed(self):
+        # QuerySet.update() no emite señales: equivale a un cambio hecho en otro worker
+        self.assertEqual(self._features()['presion_sistolica'], 130)
+        MedicalRecord.objects.filter(pk=self.record.pk).update(
+            presion_sistolica=150, updated_at=timezone.now() + datetime.timedelta(seconds=1),
+        )
+        self.assertEqual(self._features()['presion_sistolica'], 150)
+
+    def test_patient_updated_elsewhere_is_recomputed(self):
+        imc = self._features()['imc']
+        Patient.objects.filter(pk=self.record.patient_id).update(
+            peso=90, updated_at=timezone.now() + datetime.timedelta(seconds=1),
+        )
+        self.assertGreater(self._features()['imc'], imc)
+
+    def test_save_invalidates_shared_pipeline(self):
+        # Señales conectadas en PredictionsConfig.ready()
+        record = MedicalRecord.objects.select_related('patient').get(pk=self.record.pk)
+        feature_pipeline.features(record, PREDICTOR_PROFILE)
+        self.assertIn(record.pk, feature_pipeline._keys_by_record)
+        record.save()
+        self.assertNotIn(record.pk, feature_pipeline._keys_by_record)
+
+
+@override_settings(CACHE_L1_SYNC_INTERVAL=0)
+class TwoTierCacheOverwriteTests(SimpleTestCase):
+    """Dos TwoTierCache sobre el mismo backend simulan dos workers"""
+
+    def setUp(self):
+        backend = LocMemCache('two-tier-tests', {})
+        backend.clear()
+        self.worker_a = TwoTierCache('patient', backend, invalidate_on_overwrite=True)
+        self.worker_b = TwoTierCache('patient', backend, invalidate_on_overwrite=True)
+
+    def test_overwrite_reaches_other_workers_l1(self):
+        self.worker_a.set('k', {'nombre': 'Ana'})
+        self.assertEqual(self.worker_b.get('k'), {'nombre': 'Ana'})  # queda en el L1 de B
+        self.worker_a.set('k', {'nombre': 'Ana María'})
+        self.assertEqual(self.worker_b.get('k'), {'nombre': 'Ana María'})
+
+    def test_overwrite_keeps_other_entries(self):
+        self.worker_a.set('k1', 1)
+        self.worker_a.set('k2', 2)
+        self.assertEqual((self.worker_b.get('k1'), self.worker_b.get('k2')), (1, 2))
+        self.worker_a.set('k1', 3)
+        # Solo se descarta k1 del L1 de B; k2 sigue en L1
+        self.assertEqual((self.worker_b.get('k1'), self.worker_b.get('k2')), (3, 2))
+        self.assertEqual((self.worker_b.l1_hits, self.worker_b.l2_hits), (1, 3))
+
+    def test_delete_and_clear_reach_other_workers(self):
+        self.worker_a.set('k1', 1)
+        self.worker_a.set('k2', 2)
+        self.worker_b.get('k1')
+        self.worker_b.get('k2')
+        self.worker_a.delete('k1')
+        self.assertIsNone(self.worker_b.get('k1'))
+        self.worker_a.clear()
+        self.assertEqual(self.worker_b.get('k2'), 2)  # L1 vacío: se relee de L2
+        self.assertEqual(self.worker_b.stats()['l1_entries'], 1)
+        self.assertEqual((self.worker_b.l1_hits, self.worker_b.l2_hits), (0, 3))
+
+
+LOCMEM_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': alias}
+    for alias in ('default', 'sessions', 'predictions')
+}
+
+
+def _predict_payload(**overrides):
+    """Datos de /predict/ de un paciente sintético"""
+    payload = {
+        'dni': '40111222', 'numero_historia': 'HC-40111222', 'nombre': 'Paciente',
+        'apellidos': 'Verificación SQL', 'fecha_nacimiento': '1968-05-14', 'sexo': 'M',
+        'peso': 82.0, 'altura': 174.0, 'presion_sistolica': 142, 'presion_diastolica': 88,
+        'frecuencia_cardiaca': 76, 'colesterol': 232.0, 'glucosa': 104.0,
+        'cigarrillos_dia': 10, 'anos_tabaquismo': 15, 'actividad_fisica': 'ligero',
+        'antecedentes_cardiacos': 'no',
+    }
+    payload.update(overrides)
+    return payload
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PredictWriteStatementTests(TestCase):
+    """Presupuesto de sentencias SQL de la escritura de /predict/ (ver write_path.py)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='medico', password='x')
+        cls.writer = PredictWriteService(PredictionService())
+
+    def _write(self, payload):
+        # BEGIN/SAVEPOINT no cuentan: dentro de TestCase la transacción es un savepoint
+        with CaptureQueriesContext(connection) as queries:
+            self.writer.write(payload, self.user, cache_data={'presion_sistolica': payload['presion_sistolica']})
+        return [query['sql'] for query in queries if is_data_statement(query['sql'])]
+
+    def _patient_writes(self, statements, verb):
+        table = Patient._meta.db_table
+        return [sql for sql in statements if sql.startswith(verb) and f'"{table}"' in sql.split('(')[0]]
+
+    def test_new_patient(self):
+        statements = self._write(_predict_payload())
+        self.assertLessEqual(len(statements), PREDICT_MAX_STATEMENTS, statements)
+        self.assertEqual(len(self._patient_writes(statements, 'INSERT')), 1)
+        self.assertEqual(Prediction.objects.count(), 1)
+        self.assertTrue(PredictionOutboxEvent.objects.filter(event_type='cache_prediction').exists())
+
+    def test_changed_patient(self):
+        self._write(_predict_payload())
+        statements = self._write(_predict_payload(peso=79.5, telefono='999111222'))
+        self.assertLessEqual(len(statements), PREDICT_MAX_STATEMENTS, statements)
+        self.assertEqual(len(self._patient_writes(statements, 'UPDATE')), 1)
+        self.assertEqual(Patient.objects.get(dni='40111222').peso, 79.5)
+
+    def test_unchanged_patient(self):
+        self._write(_predict_payload())
+        statements = self._write(_predict_payload())
+        self.assertLessEqual(len(statements), PREDICT_MAX_STATEMENTS, statements)
+        self.assertEqual(self._patient_writes(statements, 'UPDATE'), [])
+        self.assertEqual(Patient.objects.count(), 1)
+        self.assertEqual(Prediction.objects.count(), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HIGH_RISK_NOTIFICATION_EMAILS=[])
+class OutboxDrainTests(TestCase):
+    """Reserva de lotes del outbox y efectos aplicados fuera de la transacción"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='medico', password='x')
+        writer = PredictWriteService(PredictionService())
+        _, _, self.prediction = writer.write(_predict_payload(), user, cache_data={'presion_sistolica': 142})
+
+    def test_claimed_batch_is_hidden_from_other_workers(self):
+        self.assertTrue(_claim_batch(10))
+        self.assertEqual(_claim_batch(10), [])
+
+    def test_cached_result_uses_prediction_confidence(self):
+        with mock.patch.object(cache_service, 'set_prediction_cache', return_value=True) as set_cache:
+            result = drain_batch(10)
+        self.assertEqual(result['failed'], 0)
+        cached = set_cache.call_args[0][1]
+        self.assertEqual(cached['confidence'], self.prediction.confidence_score)
+        self.assertFalse(PredictionOutboxEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_failed_effect_is_retried_alone(self):
+        with mock.patch.object(cache_service, 'set_prediction_cache', side_effect=RuntimeError('redis caído')):
+            result = drain_batch(10)
+        self.assertEqual(result['failed'], 1)
+        pending = PredictionOutboxEvent.objects.get(processed_at__isnull=True)
+        self.assertEqual((pending.event_type, pending.attempts), ('cache_prediction', 1))
+
+
+class PredictInvalidationMiddlewareTests(SimpleTestCase):
+    """CacheInvalidationMiddleware no repite la invalidación que /predict/ deja en el outbox"""
+
+    def _post(self, path):
+        middleware = CacheInvalidationMiddleware(lambda request: HttpResponse(status=201))
+        with mock.patch.object(cache_service.tags, 'invalidate') as invalidate:
+            middleware(RequestFactory().post(path))
+        return invalidate
+
+    def test_predict_is_left_to_the_outbox(self):
+        self._post('/api/predictions/predictions/predict/').assert_not_called()
+
+    def test_batch_predict_still_invalidates(self):
+        self._post('/api/predictions/predictions/batch_predict/').assert_called_once()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, HIGH_RISK_NOTIFICATION_EMAILS=['cardiologia@example.com'])
+class AsyncPredictionOutboxTests(TestCase):
+    """La tarea asíncrona deja la notificación de alto riesgo en el outbox"""
+
+    medical_data = {
+        'presion_sistolica': 178, 'presion_diastolica': 104, 'colesterol': 290.0, 'glucosa': 160.0,
+        'cigarrillos_dia': 20, 'anos_tabaquismo': 30, 'actividad_fisica': 'sedentario',
+        'antecedentes_cardiacos': 'si',
+    }
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='medico', password='x')
+        self.patient = Patient.objects.create(
+            dni='50111222', numero_historia='HC-50111222', nombre='Luis', apellidos='Gómez',
+            fecha_nacimiento=datetime.date(1950, 3, 1), sexo='M', peso=98, altura=170,
+            medico_tratante=user,
+        )
+
+    def test_notification_goes_through_outbox(self):
+        with mock.patch.object(send_high_risk_notification, 'delay') as delay:
+            result = predict_cardiovascular_risk_async(str(self.patient.id), self.medical_data)
+        self.assertTrue(result['success'])
+        self.assertEqual(result['risk_level'].upper(), 'ALTO')
+        delay.assert_not_called()
+        events = PredictionOutboxEvent.objects.filter(event_type='notify_high_risk')
+        self.assertEqual([event.payload['prediction_id'] for event in events], [result['prediction_id']])
+
+        drain_batch(10)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Luis Gómez', mail.outbox[0].subject)
+
+    def test_record_prediction_and_events_commit_together(self):
+        with mock.patch('apps.predictions.tasks.record_prediction_events', side_effect=RuntimeError('fallo')):
+            # Llamada directa: el reintento de Celery se propaga como Retry
+            with self.assertRaises(Retry):
+                predict_cardiovascular_risk_async(str(self.patient.id), self.medical_data)
+        self.assertFalse(MedicalRecord.objects.filter(patient=self.patient).exists())
+        self.assertFalse(Prediction.objects.exists())
@@ -5,8 +5,9 @@ import datetime
 from rest_framework.permissions import IsAuthenticated
 from django.core.cache import cache
 from django.conf import settings
+from django.core.exceptions import ValidationError
 # from django_filters.rest_framework import DjangoFilterBackend  # Temporalmente removido por problemas de compatibilidad
-from django.db.models import Count, Avg, Prefetch, Q
+from django.db.models import Count, Avg, OuterRef, Prefetch, Q, Subquery
 from django.utils import timezone
 import logging
 from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter, OpenApiExample
@@ -16,9 +17,17 @@ from .models import Prediction, ModelPerformance
 from .serializers import PredictionSerializer, ModelPerformanceSerializer
 from .services import PredictionService
 from .cache_service import cache_service
+from .write_path import PredictInputError, PredictWriteService, predict_statement_stats
 from apps.patients.models import Patient, MedicalRecord
 from apps.medical_data.models import MedicalData
 from apps.common.rate_limiting import prediction_rate_limit, statistics_rate_limit
+from ml_models.cardiovascular_predictor_clean import cardiovascular_predictor
+from ml_models.clinical_scores import calculate_clinical_scores, clinical_score_columns
+from ml_models.features import PREDICTOR_PROFILE, feature_pipeline
+from ml_models.inference_pool import InferencePool
+from ml_models.registry import model_registry
+from ml_models.scoring_cache import scoring_cache
+from ml_models.timing import span, stage_metrics, trace
 
 logger = logging.getLogger('cardiovascular.predictions')
 
@@ -68,6 +77,7 @@ class PredictionViewSet(viewsets.ModelViewSet):
     serializer_class = PredictionSerializer
     permission_classes = [IsAuthenticated]
     prediction_service = PredictionService()
+    write_service = PredictWriteService(prediction_service)
     # filter_backends = [DjangoFilterBackend]  # Temporalmente deshabilitado
     # filterset_fields = ['riesgo_nivel', 'patient', 'model_version']  # Filtros manuales implementados en get_queryset
     ordering = ['-created_at']
@@ -199,7 +209,7 @@ class PredictionViewSet(viewsets.ModelViewSet):
                             'created_at': '2024-08-24T10:30:00Z',
                             'cache_info': {
                                 'from_cache': False,
-                                'cached_successfully': True,
+                                'side_effects': 'queued',
                                 'generated_at': '2024-08-24T10:30:00Z'
                             }
                         }
@@ -246,9 +256,17 @@ class PredictionViewSet(viewsets.ModelViewSet):
         Recibe datos completos de paciente y registro médico con sistema de cache inteligente.
         Optimización NIVEL 2: Cache para predicciones y datos de paciente + Rate limiting.
         """
-        from apps.medical_data.models import MedicalData
-        from django.utils import timezone
+        with trace() as request_trace:
+            with span('view.total'):
+                response = self._predict(request)
 
+        # Desglose de latencias para el personal (ver ml_models.timing)
+        if getattr(settings, 'PREDICTION_SERVER_TIMING', False) and request.user.is_staff:
+            response['Server-Timing'] = request_trace.server_timing()
+        return response
+
+    def _predict(self, request):
+        """Cuerpo de `predict`; cada etapa se mide con un span"""
         try:
             data = request.data
             logger.info(f"Datos recibidos en predict: {data}")
@@ -272,7 +290,8 @@ class PredictionViewSet(viewsets.ModelViewSet):
             logger.info(f"Datos para cache: {medical_cache_data}")
 
             # --- 0.2 Verificar cache de predicción ---
-            cached_prediction = cache_service.get_prediction_cache(medical_cache_data)
+            with span('view.cache_lookup'):
+                cached_prediction = cache_service.get_prediction_cache(medical_cache_data)
             logger.info(f"Predicción en cache: {cached_prediction is not None}")
             if cached_prediction:
                 logger.info(f"Datos de cache: riesgo={cached_prediction.get('riesgo_nivel')}, prob={cached_prediction.get('probabilidad')}")
@@ -288,219 +307,46 @@ class PredictionViewSet(viewsets.ModelViewSet):
                     }
                 })
 
-            # --- 0.3 Procesar y validar datos de entrada ---
-            fecha_nacimiento_str = data.get('fecha_nacimiento')
-            fecha_nacimiento_obj = None
-            if fecha_nacimiento_str:
-                try:
-                    fecha_nacimiento_obj = datetime.datetime.strptime(fecha_nacimiento_str, '%Y-%m-%d').date()
-                except ValueError:
-                    return Response({'error': 'El formato de fecha_nacimiento es inválido. Use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
-
-            # --- 1. Buscar o crear/actualizar paciente con cache ---
-            dni = data.get('dni')
-            numero_historia = data.get('numero_historia')
-            
-            # Validar identificador mínimo
-            if not dni and not numero_historia:
-                return Response({'error': 'Se requiere al menos el DNI o el número de historia para identificar al paciente.'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Verificar cache de paciente primero
-            patient = None
-            patient_cache_key = f"patient_{dni}_{numero_historia}" if dni and numero_historia else (f"patient_dni_{dni}" if dni else f"patient_historia_{numero_historia}")
-            
-            # Buscar paciente existente y validar duplicados
-            if dni:
-                pacientes = Patient.objects.filter(dni=dni)
-            else:
-                pacientes = Patient.objects.filter(numero_historia=numero_historia)
-            
-            if pacientes.count() > 1:
-                return Response({'error': 'Hay más de un paciente con el mismo identificador. Corrija los duplicados antes de continuar.'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            if pacientes.count() == 1:
-                patient = pacientes.first()
-                
-                # Actualizar cache de paciente
-                patient_data = {
-                    'id': patient.id,
-                    'nombre': patient.nombre,
-                    'apellidos': patient.apellidos,
-                    'dni': patient.dni,
-                    'numero_historia': patient.numero_historia
-                }
-                cache_service.set_patient_cache(patient.id, patient_data)
-                
-                patient_fields_to_update = {
-                    'nombre': data.get('nombre'),
-                    'apellidos': data.get('apellidos'),
-                    'sexo': data.get('sexo'),
-                    'peso': data.get('peso'),
-                    'altura': data.get('altura'),
-                    'telefono': data.get('telefono'),
-                    'email': data.get('email'),
-                    'direccion': data.get('direccion'),
-                    'numero_historia': data.get('numero_historia'),
-                    'hospital': data.get('hospital'),
-                    'fecha_nacimiento': fecha_nacimiento_obj
-                }
-                updated = False
-                for field, value in patient_fields_to_update.items():
-                    if value not in [None, '', []] and getattr(patient, field) != value:
-                        setattr(patient, field, value)
-                        updated = True
-                if updated:
-                    patient.save()
-            else:
-                # Validar campos obligatorios para crear paciente
-                required_fields = ['dni', 'nombre', 'apellidos', 'fecha_nacimiento', 'sexo']
-                for field in required_fields:
-                    if not data.get(field):
-                        return Response({'error': f'El campo obligatorio "{field}" falta o está vacío.'}, status=status.HTTP_400_BAD_REQUEST)
-                create_fields = {
-                    'fecha_nacimiento': fecha_nacimiento_obj
-                }
-                for field in ['dni','nombre','apellidos','sexo','peso','altura','telefono','email','direccion','numero_historia','hospital']:
-                    if data.get(field) not in [None, '', []]:
-                        create_fields[field] = data.get(field)
-                if 'dni' not in create_fields:
-                    create_fields['dni'] = None
-                if 'numero_historia' not in create_fields:
-                    create_fields['numero_historia'] = f"AUTO_{int(timezone.now().timestamp())}"
-                patient = Patient.objects.create(**create_fields)
-
-            # --- 2. Crear el registro médico ---
-            # Calcular la edad del paciente
-            today = datetime.date.today()
-            if not fecha_nacimiento_obj:
-                if patient and patient.fecha_nacimiento:
-                    fecha_nacimiento_obj = patient.fecha_nacimiento
-                else:
-                    return Response({'error': 'No se puede calcular la edad sin una fecha de nacimiento.'}, status=status.HTTP_400_BAD_REQUEST)
-
-            edad = today.year - fecha_nacimiento_obj.year - ((today.month, today.day) < (fecha_nacimiento_obj.month, fecha_nacimiento_obj.day))
-
-            medical_record = MedicalRecord.objects.create(
-                patient=patient,
-                edad=edad,
-                presion_sistolica=data.get('presion_sistolica', 120),
-                presion_diastolica=data.get('presion_diastolica', 80),
-                frecuencia_cardiaca=data.get('frecuencia_cardiaca', 70),
-                colesterol=data.get('colesterol'),
-                colesterol_hdl=data.get('colesterol_hdl'),
-                colesterol_ldl=data.get('colesterol_ldl'),
-                trigliceridos=data.get('trigliceridos'),
-                glucosa=data.get('glucosa'),
-                hemoglobina_glicosilada=data.get('hemoglobina_glicosilada'),
-                cigarrillos_dia=data.get('cigarrillos_dia', 0),
-                anos_tabaquismo=data.get('anos_tabaquismo', 0),
-                actividad_fisica=data.get('actividad_fisica', 'sedentario'),
-                antecedentes_cardiacos=data.get('antecedentes_cardiacos', 'no'),
-                diabetes=data.get('diabetes', False),
-                hipertension=data.get('hipertension', False),
-                medicamentos_actuales=data.get('medicamentos_actuales', []),
-                alergias=data.get('alergias', []),
-                observaciones=data.get('observaciones', ''),
-                fecha_registro=data.get('fecha_registro', timezone.now()),
-                external_record_id=data.get('external_record_id'),
-                external_data=data.get('external_data', {})
-            )
+            # --- 1-5. Paciente, registro médico, predicción y MedicalData ---
+            # Una transacción con el mínimo de sentencias (ver write_path.py)
+            try:
+                with span('view.write'):
+                    patient, medical_record, prediction_obj = self.write_service.write(
+                        data, request.user, cache_data=medical_cache_data,
+                    )
+            except PredictInputError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except ValidationError as e:
+                return Response({'error': e.message_dict if hasattr(e, 'error_dict') else e.messages},
+                                status=status.HTTP_400_BAD_REQUEST)
+            logger.info(f"Predicción generada: {prediction_obj.riesgo_nivel} {prediction_obj.probabilidad}% - "
+                        f"ID: {prediction_obj.id} (paciente {patient.id}, registro {medical_record.id})")
 
-            # --- 3. Crear registro en MedicalData ---
-            age = 0
-            if fecha_nacimiento_obj:
-                today = datetime.date.today()
-                age = today.year - fecha_nacimiento_obj.year - ((today.month, today.day) < (fecha_nacimiento_obj.month, fecha_nacimiento_obj.day))
-
-            MedicalData.objects.create(
-                patient=patient,
-                age=age,
-                gender=patient.sexo,
-                smoking=data.get('cigarrillos_dia', 0) > 0,
-                alcohol_consumption=data.get('alcohol_consumption', False),
-                physical_activity=data.get('actividad_fisica', 'sedentario') != 'sedentario',
-                systolic_pressure=data.get('presion_sistolica', 120),
-                diastolic_pressure=data.get('presion_diastolica', 80),
-                heart_rate=data.get('frecuencia_cardiaca', 70),
-                cholesterol=data.get('colesterol'),
-                glucose=data.get('glucosa'),
-                family_history=data.get('antecedentes_cardiacos', 'no') == 'si',
-                previous_conditions=data.get('observaciones', ''),
-                prediction_date=timezone.now()
-            )
+            cache_service.set_patient_cache(patient.id, {
+                'id': patient.id,
+                'nombre': patient.nombre,
+                'apellidos': patient.apellidos,
+                'dni': patient.dni,
+                'numero_historia': patient.numero_historia
+            })
+
+            # --- 6. Serializar la respuesta ---
+            # Caché del resultado, invalidación de listados y notificación de
+            # alto riesgo quedan como eventos outbox en la misma transacción
+            # (ver apps/predictions/outbox.py)
+            with span('view.serialize'):
+                serializer = self.get_serializer(prediction_obj)
+                prediction_result = serializer.data
 
-            # --- 4. Generar predicción ---
-            logger.info(f"Generando predicción para paciente {patient.id} con registro médico {medical_record.id}")
-            prediction_obj = self.prediction_service.get_prediction(patient, medical_record)
-            logger.info(f"Predicción generada: {prediction_obj.riesgo_nivel} {prediction_obj.probabilidad}% - ID: {prediction_obj.id}")
-            
-            # Verificar que la predicción se guardó en la base de datos
-            prediction_from_db = Prediction.objects.get(id=prediction_obj.id)
-            logger.info(f"Predicción verificada en BD: {prediction_from_db.riesgo_nivel} {prediction_from_db.probabilidad}%")
-
-            # --- 5. Actualizar MedicalData con los resultados ---
-            medical_data_record = MedicalData.objects.filter(patient=patient).latest('date_recorded')
-            # Convertir de porcentaje (0-100) a decimal (0-1) para almacenar en risk_score
-            medical_data_record.risk_score = prediction_obj.probabilidad / 100.0
-            medical_data_record.prediction_date = prediction_obj.created_at
-            medical_data_record.save()
-
-            # --- 6. Cachear resultado de predicción ---
-            serializer = self.get_serializer(prediction_obj)
-            prediction_result = serializer.data
-            
-            # Enriquecer datos para cache
             prediction_result['risk_level'] = prediction_obj.riesgo_nivel
             prediction_result['confidence'] = prediction_obj.confidence if hasattr(prediction_obj, 'confidence') else 0.85
-            
-            # Guardar en cache
-            cache_success = cache_service.set_prediction_cache(medical_cache_data, prediction_result)
-            if cache_success:
-                logger.info("Prediction result cached successfully")
-            
-            # --- 6.5 Invalidar cache de lista de pacientes ---
-            # Invalidar todas las claves de cache que empiecen con 'patients_list_'
-            from django.core.cache import cache
-            
-            # Obtener todas las claves del cache que contengan 'patients_list_'
-            # Como no podemos iterar directamente sobre las claves en algunas implementaciones de cache,
-            # vamos a intentar borrar varias variaciones comunes
-            cache_keys_to_try = []
-            
-            # Generar posibles claves de cache basadas en parámetros comunes
-            common_params = [
-                {},  # Sin parámetros
-                {'page': '1'},
-                {'page': '2'}, 
-                {'page_size': '10'},
-                {'page_size': '20'},
-                {'ordering': '-created_at'},
-                {'search': ''},
-            ]
-            
-            for params in common_params:
-                cache_key = 'patients_list_{}'.format(hash(str(params)))
-                cache_keys_to_try.append(cache_key)
-            
-            # También intentar con algunos hashes específicos que podrían existir
-            for i in range(20):  # Intentar con diferentes variaciones
-                cache_key = f'patients_list_{hash(str({})) + i}'
-                cache_keys_to_try.append(cache_key)
-            
-            # Borrar todas las claves encontradas
-            deleted_count = 0
-            for cache_key in cache_keys_to_try:
-                if cache.delete(cache_key):
-                    deleted_count += 1
-            
-            logger.info(f"Invalidated {deleted_count} patient list cache keys")
-            
+
             # --- 7. Devolver la respuesta con información de cache ---
             return Response({
                 **prediction_result,
                 'cache_info': {
                     'from_cache': False,
-                    'cached_successfully': cache_success,
+                    'side_effects': 'queued',
                     'generated_at': timezone.now().isoformat()
                 }
             })
@@ -610,6 +456,94 @@ class PredictionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    @statistics_rate_limit
+    def cohort_scores(self, request):
+        """Distribución de scores clínicos de los pacientes de un hospital (último registro de cada uno)"""
+        hospital = request.query_params.get('hospital')
+        if not hospital:
+            return Response(
+                {'error': 'El parámetro hospital es requerido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            # Solo el último registro de cada paciente, filtrado en SQL: el coste
+            # crece con los pacientes, no con su historial
+            latest_record_id = MedicalRecord.objects.filter(
+                patient_id=OuterRef('patient_id')
+            ).order_by('-fecha_registro').values('id')[:1]
+            records = MedicalRecord.objects.filter(
+                id=Subquery(latest_record_id),
+                patient__hospital=hospital,
+                patient__is_active=True
+            ).select_related('patient').order_by('patient_id')
+            if not request.user.is_staff:
+                records = records.filter(patient__medico_tratante=request.user)
+            latest_records = list(records)
+
+            features_list = feature_pipeline.features_many(latest_records, PREDICTOR_PROFILE)
+            scores = calculate_clinical_scores(
+                clinical_score_columns(feature_pipeline.score_rows(latest_records, features_list))
+            )
+
+            return Response({
+                'hospital': hospital,
+                'total_patients': len(latest_records),
+                'scores': scores.distribution(),
+            })
+        except Exception as e:
+            logger.error(f"Error calculando scores de cohorte: {str(e)}")
+            return Response(
+                {'error': 'Error al calcular los scores de la cohorte'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['get'])
+    def inference_stats(self, request):
+        """Métricas de inferencia del proceso: micro-batching y modelos cargados (solo staff)"""
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'No autorizado'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            batcher = cardiovascular_predictor.micro_batcher
+            # No forzar la carga del modelo solo para consultar métricas
+            model = cardiovascular_predictor.model if cardiovascular_predictor.models_loaded else None
+            return Response({
+                'micro_batching': batcher.stats() if batcher is not None else {'enabled': False},
+                'inference_pool': model.stats() if isinstance(model, InferencePool) else {'enabled': False},
+                'registry': model_registry.stats(),
+                'scoring_cache': scoring_cache.stats(),
+            })
+        except Exception as e:
+            logger.error(f"Error obteniendo métricas de inferencia: {str(e)}")
+            return Response(
+                {'error': 'Error al obtener métricas de inferencia'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    @action(detail=False, methods=['get', 'delete'])
+    def latency_stats(self, request):
+        """Histogramas de latencia por etapa y sentencias SQL de /predict/ en este proceso; DELETE los reinicia (solo staff)"""
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'No autorizado'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        if request.method == 'DELETE':
+            stage_metrics.reset()
+            predict_statement_stats.reset()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        return Response({
+            'stages': stage_metrics.as_dict(),
+            'predict_db_statements': predict_statement_stats.as_dict(),
+        })
+
     @action(detail=False, methods=['get'])
     def cache_stats(self, request):
         """Obtiene estadísticas del sistema de cache."""
@@ -640,8 +574,8 @@ class PredictionViewSet(viewsets.ModelViewSet):
                 success = True  # Implementar limpieza específica
                 message = "Cache de predicciones limpiado"
             elif cache_type == 'patients':
-                # Limpiar solo cache de pacientes
-                success = True  # Implementar limpieza específica
+                # Limpiar solo cache de pacientes (listados y estadísticas)
+                success = cache_service.invalidate_patient_lists() > 0
                 message = "Cache de pacientes limpiado"
             else:
                 success = cache_service.clear_all_cache()
@@ -0,0 +1,281 @@
+"""
+Escritura de /api/predictions/predict/ en una transacción con el mínimo de sentencias
+
+Orden:
+  1. Búsqueda del paciente por DNI o número de historia (1 SELECT)
+  2. Paciente y registro médico construidos y validados en memoria: las
+     reglas de `clean()` y de campo se aplican igual, pero sin las consultas
+     de `validate_unique` ni de las FK (la unicidad de DNI y número de
+     historia la garantizan los índices únicos de la base de datos)
+  3. Predicción sobre el registro sin guardar (no toca la base de datos)
+  4. Una transacción: INSERT o UPDATE (solo campos cambiados) del paciente,
+     INSERT del registro médico, INSERT de la predicción, INSERT de
+     MedicalData ya con `risk_score` y `prediction_date` e INSERT en bloque
+     de los eventos outbox (caché, invalidación de listados, notificación;
+     ver apps/predictions/outbox.py)
+
+Son como mucho PREDICT_MAX_STATEMENTS sentencias, frente a las ~15 de la
+versión anterior (conteos duplicados, validaciones con consultas, relectura
+de la predicción, `latest()` + `save()` de MedicalData). Cada escritura
+registra sus sentencias en `predict_statement_stats`; el presupuesto lo
+verifica PredictWriteStatementTests (apps/predictions/tests.py).
+"""
+
+import datetime
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from apps.medical_data.models import MedicalData
+from apps.patients.models import MedicalRecord, Patient
+from ml_models.timing import span
+
+from .models import Prediction
+from .outbox import record_prediction_events
+
+logger = logging.getLogger('cardiovascular.predictions')
+
+# Sentencias SQL máximas de una escritura de /predict/
+PREDICT_MAX_STATEMENTS = 6
+
+PATIENT_UPDATE_FIELDS = (
+    'nombre', 'apellidos', 'sexo', 'peso', 'altura', 'telefono', 'email',
+    'direccion', 'numero_historia', 'hospital', 'fecha_nacimiento',
+)
+PATIENT_CREATE_FIELDS = (
+    'dni', 'nombre', 'apellidos', 'sexo', 'peso', 'altura', 'telefono', 'email',
+    'direccion', 'numero_historia', 'hospital',
+)
+PATIENT_REQUIRED_FIELDS = ('dni', 'nombre', 'apellidos', 'fecha_nacimiento', 'sexo')
+
+EMPTY_VALUES = (None, '', [])
+
+
+class PredictInputError(ValueError):
+    """Datos de /predict/ inválidos; la vista responde 400 con el mensaje"""
+
+
+# Control de transacciones: no cuenta en el presupuesto (el BEGIN es explícito
+# en SQLite e implícito en PostgreSQL)
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+def is_data_statement(sql: str) -> bool:
+    return not sql.lstrip().upper().startswith(TRANSACTION_CONTROL)
+
+
+class StatementCounter:
+    """Cuenta las sentencias SQL de datos del bloque (`connection.execute_wrapper`)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if is_data_statement(sql):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class StatementStats:
+    """Sentencias SQL por escritura de /predict/ en este proceso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, statements: int):
+        with self._lock:
+            self.writes += 1
+            self.total += statements
+            self.last = statements
+            self.max = max(self.max, statements)
+            if statements > PREDICT_MAX_STATEMENTS:
+                self.over_budget += 1
+
+    def reset(self):
+        with self._lock:
+            self.writes = 0
+            self.total = 0
+            self.last = 0
+            self.max = 0
+            self.over_budget = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'budget': PREDICT_MAX_STATEMENTS,
+                'writes': self.writes,
+                'last': self.last,
+                'max': self.max,
+                'avg': round(self.total / self.writes, 2) if self.writes else 0.0,
+                'over_budget': self.over_budget,
+            }
+
+
+predict_statement_stats = StatementStats()
+
+
+def _age(birth_date: datetime.date, today: datetime.date) -> int:
+    return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+
+
+class PredictWriteService:
+    """Paciente, registro médico, predicción y MedicalData de una petición /predict/"""
+
+    def __init__(self, prediction_service):
+        self.prediction_service = prediction_service
+
+    def write(self, data: Dict[str, Any], user=None,
+              cache_data: Optional[Dict[str, Any]] = None) -> Tuple[Patient, MedicalRecord, Prediction]:
+        """
+        Ejecuta la escritura completa. `cache_data` son los datos médicos con
+        los que se cacheará el resultado (evento outbox; sin él no se cachea).
+        Lanza PredictInputError si los datos no permiten identificar o crear al
+        paciente, o ValidationError si no superan las validaciones de los modelos.
+        """
+        counter = StatementCounter()
+        with connection.execute_wrapper(counter):
+            result = self._write(data, user, cache_data)
+        predict_statement_stats.record(counter.count)
+        if counter.count > PREDICT_MAX_STATEMENTS:
+            logger.warning(f"Escritura de /predict/ con {counter.count} sentencias SQL "
+                           f"(presupuesto {PREDICT_MAX_STATEMENTS})")
+        return result
+
+    def _write(self, data, user, cache_data):
+        birth_date = self._parse_birth_date(data.get('fecha_nacimiento'))
+
+        with span('write.patient_lookup'):
+            patient, changed_fields = self._resolve_patient(data, birth_date, user)
+
+        birth_date = birth_date or patient.fecha_nacimiento
+        if not birth_date:
+            raise PredictInputError('No se puede calcular la edad sin una fecha de nacimiento.')
+
+        with span('write.validate'):
+            medical_record = self._build_medical_record(data, patient, _age(birth_date, datetime.date.today()))
+            if patient._state.adding or changed_fields:
+                # Sin validate_unique ni la consulta de la FK medico_tratante si ya
+                # viene resuelta (ver docstring del módulo)
+                exclude = ['medico_tratante'] if patient.medico_tratante_id else []
+                patient.full_clean(exclude=exclude, validate_unique=False)
+            medical_record.full_clean(exclude=['patient'], validate_unique=False)
+
+        # Inferencia fuera de la transacción: no alarga los bloqueos
+        prediction_result = self.prediction_service.score(medical_record)
+
+        with span('write.transaction'):
+            try:
+                with transaction.atomic():
+                    if patient._state.adding:
+                        patient.save(clean=False, force_insert=True)
+                    elif changed_fields:
+                        patient.save(clean=False, update_fields=changed_fields + ['updated_at'])
+                    medical_record.save(clean=False, force_insert=True)
+                    prediction = self.prediction_service.create_prediction(
+                        patient, medical_record, prediction_result,
+                    )
+                    self._create_medical_data(data, patient, medical_record, prediction)
+                    record_prediction_events(prediction, cache_data)
+            except IntegrityError as e:
+                logger.warning(f"Conflicto de unicidad guardando paciente en /predict/: {e}")
+                raise PredictInputError('Ya existe otro paciente con el mismo DNI o número de historia.')
+
+        return patient, medical_record, prediction
+
+    def _parse_birth_date(self, value) -> Optional[datetime.date]:
+        if not value:
+            return None
+        try:
+            return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise PredictInputError('El formato de fecha_nacimiento es inválido. Use YYYY-MM-DD.')
+
+    def _resolve_patient(self, data, birth_date, user) -> Tuple[Patient, List[str]]:
+        """Paciente existente con los cambios aplicados en memoria, o uno nuevo sin guardar"""
+        dni = data.get('dni')
+        numero_historia = data.get('numero_historia')
+        if not dni and not numero_historia:
+            raise PredictInputError('Se requiere al menos el DNI o el número de historia para identificar al paciente.')
+
+        lookup = {'dni': dni} if dni else {'numero_historia': numero_historia}
+        # Una sola consulta: hasta dos filas bastan para detectar duplicados
+        patients = list(Patient.objects.filter(**lookup)[:2])
+        if len(patients) > 1:
+            raise PredictInputError('Hay más de un paciente con el mismo identificador. Corrija los duplicados antes de continuar.')
+
+        if patients:
+            patient = patients[0]
+            updates = {field: data.get(field) for field in PATIENT_UPDATE_FIELDS}
+            updates['fecha_nacimiento'] = birth_date
+            changed_fields = []
+            for field, value in updates.items():
+                if value not in EMPTY_VALUES and getattr(patient, field) != value:
+                    setattr(patient, field, value)
+                    changed_fields.append(field)
+            return patient, changed_fields
+
+        for field in PATIENT_REQUIRED_FIELDS:
+            if not data.get(field):
+                raise PredictInputError(f'El campo obligatorio "{field}" falta o está vacío.')
+
+        create_fields = {field: data.get(field) for field in PATIENT_CREATE_FIELDS
+                         if data.get(field) not in EMPTY_VALUES}
+        create_fields['fecha_nacimiento'] = birth_date
+        create_fields.setdefault('dni', None)
+        create_fields.setdefault('numero_historia', f"AUTO_{int(timezone.now().timestamp())}")
+        if user is not None and user.is_authenticated:
+            # Médico tratante obligatorio: quien registra al paciente
+            create_fields['medico_tratante'] = user
+        return Patient(**create_fields), []
+
+    def _build_medical_record(self, data, patient, edad) -> MedicalRecord:
+        return MedicalRecord(
+            patient=patient,
+            edad=edad,
+            presion_sistolica=data.get('presion_sistolica', 120),
+            presion_diastolica=data.get('presion_diastolica', 80),
+            frecuencia_cardiaca=data.get('frecuencia_cardiaca', 70),
+            colesterol=data.get('colesterol'),
+            colesterol_hdl=data.get('colesterol_hdl'),
+            colesterol_ldl=data.get('colesterol_ldl'),
+            trigliceridos=data.get('trigliceridos'),
+            glucosa=data.get('glucosa'),
+            hemoglobina_glicosilada=data.get('hemoglobina_glicosilada'),
+            cigarrillos_dia=data.get('cigarrillos_dia', 0),
+            anos_tabaquismo=data.get('anos_tabaquismo', 0),
+            actividad_fisica=data.get('actividad_fisica', 'sedentario'),
+            antecedentes_cardiacos=data.get('antecedentes_cardiacos', 'no'),
+            diabetes=data.get('diabetes', False),
+            hipertension=data.get('hipertension', False),
+            medicamentos_actuales=data.get('medicamentos_actuales', []),
+            alergias=data.get('alergias', []),
+            observaciones=data.get('observaciones', ''),
+            fecha_registro=data.get('fecha_registro', timezone.now()),
+            external_record_id=data.get('external_record_id'),
+            external_data=data.get('external_data', {}),
+        )
+
+    def _create_medical_data(self, data, patient, medical_record, prediction) -> MedicalData:
+        """MedicalData con el resultado ya incluido (sin `latest()` + `save()` posteriores)"""
+        return MedicalData.objects.create(
+            patient=patient,
+            age=medical_record.edad,
+            gender=patient.sexo,
+            smoking=data.get('cigarrillos_dia', 0) > 0,
+            alcohol_consumption=data.get('alcohol_consumption', False),
+            physical_activity=data.get('actividad_fisica', 'sedentario') != 'sedentario',
+            systolic_pressure=data.get('presion_sistolica', 120),
+            diastolic_pressure=data.get('presion_diastolica', 80),
+            heart_rate=data.get('frecuencia_cardiaca', 70),
+            cholesterol=data.get('colesterol'),
+            glucose=data.get('glucosa'),
+            family_history=data.get('antecedentes_cardiacos', 'no') == 'si',
+            previous_conditions=data.get('observaciones', ''),
+            # Probabilidad en porcentaje (0-100) almacenada como decimal (0-1)
+            risk_score=prediction.probabilidad / 100.0,
+            prediction_date=prediction.created_at,
+        )
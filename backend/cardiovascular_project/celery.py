@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 from django.conf import settings
 
 # Set default Django settings module for Celery
@@ -12,6 +13,8 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django app configs
 app.autodiscover_tasks()
+# Tarea del outbox de predicciones (apps/predictions/outbox.py)
+app.autodiscover_tasks(related_name='outbox')
 
 # Configuration
 app.conf.update(
@@ -29,6 +32,7 @@ app.conf.update(
     # Task routing
     task_routes={
         'apps.predictions.tasks.*': {'queue': 'predictions'},
+        'apps.predictions.outbox.*': {'queue': 'predictions'},
         'apps.integration.tasks.*': {'queue': 'integration'},
         'apps.analytics.tasks.*': {'queue': 'analytics'},
     },
@@ -52,6 +56,10 @@ app.conf.update(
             'task': 'apps.predictions.tasks.cleanup_old_predictions',
             'schedule': 86400.0,  # Daily
         },
+        'drain-prediction-outbox': {
+            'task': 'apps.predictions.outbox.drain_prediction_outbox',
+            'schedule': getattr(settings, 'PREDICTION_OUTBOX_DRAIN_INTERVAL', 2.0),
+        },
         'sync-external-data': {
             'task': 'apps.integration.tasks.sync_external_data',
             'schedule': 3600.0,   # Hourly
@@ -63,6 +71,24 @@ app.conf.update(
     },
 )
 
+@worker_process_init.connect
+def preload_prediction_models(**kwargs):
+    """
+    Carga los modelos una vez por proceso hijo del worker, antes de la primera
+    tarea. Solo se activa en los workers de la cola 'predictions'
+    (ML_PRELOAD_IN_CELERY_WORKERS=true); integration y analytics no pagan
+    el coste del ML.
+    """
+    if not getattr(settings, 'ML_PRELOAD_IN_CELERY_WORKERS', False):
+        return
+
+    from apps.predictions.tasks import get_prediction_service
+    from ml_models.warmup import warm_up_models
+
+    get_prediction_service().ensure_models_loaded()
+    warm_up_models()
+
+
 @app.task(bind=True)
 def debug_task(self):
     """Debug task for testing Celery configuration"""
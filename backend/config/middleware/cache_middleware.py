@@ -2,7 +2,6 @@
 # Optimización avanzada para respuestas HTTP y control de cache
 
 import json
-import hashlib
 import time
 import logging
 from typing import Optional, Dict, Any
@@ -12,6 +11,14 @@ from django.utils.deprecation import MiddlewareMixin
 from django.conf import settings
 from django.urls import resolve
 from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from apps.patients.serializers import PatientListSerializer
+from apps.predictions.cache_service import (
+    PATIENTS_TAG, PREDICTION_STATS_TAG, USER_PATIENTS_TAG, build_cache_key, cache_service,
+)
 
 logger = logging.getLogger('cardiovascular.cache_middleware')
 
@@ -24,23 +31,29 @@ class IntelligentCacheMiddleware(MiddlewareMixin):
     - Headers de usuario
     """
     
-    # Configuración de cache por endpoint
+    # Configuración de cache por endpoint. `tags`: etiquetas de invalidación
+    # cuya generación forma parte de la clave (ver CacheTags en
+    # apps/predictions/cache_service.py); {user_id} se sustituye por el usuario.
+    # `version`: versión del serializador de la respuesta.
+    # Claves: nombres de URL tal como resuelven (los urls.py de las apps no
+    # declaran app_name, así que no llevan espacio de nombres)
     CACHE_CONFIG = {
         # Endpoints que se pueden cachear (GET únicamente)
-        'predictions:prediction-statistics': {'timeout': 900, 'vary_on': ['user_id']},  # 15 min
-        'predictions:modelperformance-list': {'timeout': 3600, 'vary_on': []},  # 1 hora
-        'patients:patient-list': {'timeout': 300, 'vary_on': ['user_id', 'query']},  # 5 min
-        'patients:patient-statistics': {'timeout': 600, 'vary_on': ['user_id']},  # 10 min
-        'authentication:user-profile': {'timeout': 1800, 'vary_on': ['user_id']},  # 30 min
+        'prediction-statistics': {'timeout': 900, 'vary_on': ['user_id'], 'tags': [PREDICTION_STATS_TAG]},  # 15 min
+        'modelperformance-list': {'timeout': 3600, 'vary_on': [], 'tags': [PREDICTION_STATS_TAG]},  # 1 hora
+        'patient-list': {'timeout': 300, 'vary_on': ['user_id', 'query'], 'tags': [PATIENTS_TAG, USER_PATIENTS_TAG],
+                         'version': PatientListSerializer.cache_version},  # 5 min
+        'patient-stats': {'timeout': 600, 'vary_on': ['user_id'], 'tags': [PATIENTS_TAG, USER_PATIENTS_TAG]},  # 10 min
+        'profile': {'timeout': 1800, 'vary_on': ['user_id']},  # 30 min
     }
     
     # Endpoints que nunca se cachean
     NEVER_CACHE = {
-        'predictions:prediction-predict',  # Predicciones siempre fresh
-        'predictions:prediction-batch-predict',
-        'authentication:login',
-        'authentication:logout',
-        'authentication:token-refresh'
+        'prediction-predict',  # Predicciones siempre fresh
+        'prediction-batch-predict',
+        'login',
+        'logout',
+        'token_refresh'
     }
     
     def __init__(self, get_response):
@@ -68,11 +81,14 @@ class IntelligentCacheMiddleware(MiddlewareMixin):
             if not cache_config:
                 return None
             
-            # Generar clave de cache
-            cache_key = self._generate_cache_key(request, url_name, cache_config['vary_on'])
+            # Generar clave de cache (None: generaciones no disponibles, sin cache)
+            cache_key = self._generate_cache_key(request, url_name, cache_config)
+            if not cache_key:
+                return None
             
             # Intentar obtener respuesta cacheada
             cached_response = cache.get(cache_key)
+            cache_service.response_stats.record(f"middleware:{url_name}", bool(cached_response))
             if cached_response:
                 logger.info(f"Cache HIT: {url_name} - {cache_key[:12]}...")
                 
@@ -128,7 +144,9 @@ class IntelligentCacheMiddleware(MiddlewareMixin):
                 return response
             
             # Generar clave de cache
-            cache_key = self._generate_cache_key(request, url_name, cache_config['vary_on'])
+            cache_key = self._generate_cache_key(request, url_name, cache_config)
+            if not cache_key:
+                return response
             
             # Preparar datos para cache
             if hasattr(response, 'content'):
@@ -175,58 +193,106 @@ class IntelligentCacheMiddleware(MiddlewareMixin):
         except Exception:
             return None
     
-    def _generate_cache_key(self, request, url_name: str, vary_on: list) -> str:
-        """Genera una clave de cache única."""
-        
-        key_components = [
-            'intelligent_cache',
-            url_name,
-            request.path_info
-        ]
+    def _generate_cache_key(self, request, url_name: str, cache_config: Dict[str, Any]) -> Optional[str]:
+        """
+        Genera una clave de cache única, con la generación de sus etiquetas.
+        None si la petición no está autenticada: esas no se cachean ni se
+        sirven desde cache (la vista debe comprobar los permisos).
+        """
+        vary_on = cache_config['vary_on']
+        request_user_id = _request_user_id(request)
+        if request_user_id is None:
+            return None
         
-        # Agregar componentes variables
+        # Componentes variables; clave canónica y estable entre workers (ver build_cache_key)
+        user_id = None
+        params = None
+        extra = {'path': request.path_info}
         for vary_field in vary_on:
             if vary_field == 'user_id':
-                user_id = getattr(request.user, 'id', 'anonymous')
-                key_components.append(f"user:{user_id}")
+                user_id = request_user_id
             
             elif vary_field == 'query':
-                # Incluir parámetros de consulta importantes
-                query_params = dict(request.GET.items())
-                # Filtrar parámetros de paginación y timestamp
-                filtered_params = {
-                    k: v for k, v in query_params.items() 
-                    if k not in ['page', 'page_size', 'timestamp', 'force_refresh']
-                }
-                if filtered_params:
-                    query_str = json.dumps(filtered_params, sort_keys=True)
-                    key_components.append(f"query:{hashlib.md5(query_str.encode()).hexdigest()[:8]}")
+                # Todos los parámetros (también página y tamaño de página), ordenados
+                params = request.GET
             
             elif vary_field == 'version':
                 # Incluir versión de API si está disponible
-                version = request.META.get('HTTP_ACCEPT_VERSION', '1.0')
-                key_components.append(f"version:{version}")
-        
-        # Crear clave final
-        key_string = ':'.join(str(comp) for comp in key_components)
-        
-        # Usar hash para claves muy largas
-        if len(key_string) > 200:
-            return f"cache:{hashlib.md5(key_string.encode()).hexdigest()}"
+                extra['api_version'] = request.META.get('HTTP_ACCEPT_VERSION', '1.0')
         
-        return key_string.replace(' ', '_').replace(':', '-')
+        key_string = build_cache_key(
+            f"intelligent_cache:{url_name}",
+            params,
+            user_id=user_id,
+            version=cache_config.get('version'),
+            extra=extra,
+            defaults={'page': '1'},
+        )
+
+        tags = cache_config.get('tags')
+        if not tags:
+            return key_string
+        return cache_service.tags.versioned_key(key_string, _resolve_tags(tags, request_user_id))
+
+
+_jwt_authentication = JWTAuthentication()
+
+
+def _request_user_id(request) -> Optional[str]:
+    """
+    Usuario de la petición, o None si no está autenticada. En process_request
+    todavía no hay `request.user` (el middleware va antes de
+    AuthenticationMiddleware y DRF valida el JWT dentro de la vista), así
+    que se lee del token; en process_response DRF ya lo ha asignado.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return str(user.id)
+
+    header = _jwt_authentication.get_header(request)
+    raw_token = _jwt_authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        token = _jwt_authentication.get_validated_token(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+    user_id = token.get(jwt_settings.USER_ID_CLAIM)
+    return str(user_id) if user_id is not None else None
+
+
+def _resolve_tags(tags: list, user_id: Optional[str]) -> list:
+    """Etiquetas con {user_id} sustituido; sin usuario se omiten las etiquetas por usuario"""
+    return [tag.format(user_id=user_id) for tag in tags if user_id is not None or '{user_id}' not in tag]
+
 
 class CacheInvalidationMiddleware(MiddlewareMixin):
     """
     Middleware que invalida cache automáticamente cuando hay cambios.
+    Cada etiqueta es un único INCR de su generación (ver CacheTags).
     """
     
-    # Patrones de invalidación
+    # Etiquetas invalidadas por método
     INVALIDATION_PATTERNS = {
-        'POST': ['predictions', 'patients'],  # Crear invalida listados
-        'PUT': ['predictions', 'patients'],   # Actualizar invalida detalles y listados
-        'PATCH': ['predictions', 'patients'], # Actualización parcial
-        'DELETE': ['predictions', 'patients'] # Eliminar invalida todo
+        'POST': [PATIENTS_TAG, USER_PATIENTS_TAG, PREDICTION_STATS_TAG],  # Crear invalida listados
+        'PUT': [PATIENTS_TAG, USER_PATIENTS_TAG, PREDICTION_STATS_TAG],   # Actualizar invalida detalles y listados
+        'PATCH': [PATIENTS_TAG, USER_PATIENTS_TAG, PREDICTION_STATS_TAG], # Actualización parcial
+        'DELETE': [PATIENTS_TAG, USER_PATIENTS_TAG, PREDICTION_STATS_TAG] # Eliminar invalida todo
+    }
+
+    # Solo las escrituras bajo estas rutas modifican pacientes o predicciones
+    # (login, logout o refresco de token no invalidan nada)
+    INVALIDATING_PREFIXES = (
+        '/api/patients/',
+        '/api/predictions/',
+        '/api/medical-records/',
+        '/api/integration/',
+    )
+
+    # Rutas cuya invalidación ya registra el outbox en la misma transacción
+    # (invalidate_patient_lists, ver apps/predictions/outbox.py)
+    OUTBOX_INVALIDATED = {
+        'prediction-predict',
     }
     
     def process_response(self, request, response):
@@ -239,51 +305,28 @@ class CacheInvalidationMiddleware(MiddlewareMixin):
         if not (200 <= response.status_code < 300):
             return response
         
+        if not request.path_info.startswith(self.INVALIDATING_PREFIXES):
+            return response
+        
         try:
-            # Obtener patrones a invalidar
-            patterns_to_invalidate = self.INVALIDATION_PATTERNS.get(request.method, [])
-            
-            for pattern in patterns_to_invalidate:
-                # Invalidar cache basándose en patrones
-                self._invalidate_pattern(pattern, request)
+            if self._get_url_name(request) in self.OUTBOX_INVALIDATED:
+                return response
+
+            tags = _resolve_tags(self.INVALIDATION_PATTERNS.get(request.method, []), _request_user_id(request))
+            cache_service.tags.invalidate(*tags)
             
-            logger.info(f"Cache invalidated for {request.method} on {request.path_info}")
+            logger.info(f"Cache invalidated for {request.method} on {request.path_info}: {tags}")
             
         except Exception as e:
             logger.error(f"Error en cache invalidation: {e}")
         
         return response
-    
-    def _invalidate_pattern(self, pattern: str, request):
-        """Invalida cache basándose en un patrón."""
+
+    def _get_url_name(self, request) -> Optional[str]:
         try:
-            # Esta es una implementación simplificada
-            # En producción, se usaría una estrategia más sofisticada con Redis patterns
-            
-            if pattern == 'patients':
-                # Invalidar cache de listados de pacientes
-                user_id = getattr(request.user, 'id', 'anonymous')
-                potential_keys = [
-                    f'intelligent_cache-patients-patient-list-user-{user_id}',
-                    f'intelligent_cache-patients-patient-statistics-user-{user_id}'
-                ]
-                
-                for key in potential_keys:
-                    cache.delete(key)
-            
-            elif pattern == 'predictions':
-                # Invalidar cache de predicciones y estadísticas
-                user_id = getattr(request.user, 'id', 'anonymous')
-                potential_keys = [
-                    f'intelligent_cache-predictions-prediction-statistics-user-{user_id}',
-                    'intelligent_cache-predictions-modelperformance-list'
-                ]
-                
-                for key in potential_keys:
-                    cache.delete(key)
-            
-        except Exception as e:
-            logger.error(f"Error invalidating pattern {pattern}: {e}")
+            return resolve(request.path_info).url_name
+        except Exception:
+            return None
 
 # Middleware de performance para medir tiempos
 class PerformanceMonitoringMiddleware(MiddlewareMixin):
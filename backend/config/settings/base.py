@@ -57,6 +57,7 @@ MIDDLEWARE = [
     # Custom middleware
     'apps.common.middleware.RequestLoggingMiddleware',
     'apps.common.middleware.ExceptionHandlingMiddleware',
+    'apps.common.middleware.ModelReloadMiddleware',
     # Cache invalidation middleware (NIVEL 2)
     'config.middleware.cache_middleware.CacheInvalidationMiddleware',
 ]
@@ -464,9 +465,84 @@ LOGGING = {
 # Ruta donde se almacenan los modelos de ML
 ML_MODELS_PATH = BASE_DIR / 'ml_models' / 'trained_models'
 
+# Los modelos se cargan en la primera inferencia. Activar para calentarlos
+# al arrancar los workers web (config/wsgi.py) y evitar la latencia inicial.
+# En cualquier caso /ready/ no responde 'ready' hasta completar el calentamiento
+ML_WARMUP_ON_STARTUP = os.getenv('ML_WARMUP_ON_STARTUP', 'False').lower() == 'true'
+
+# Precarga de modelos por proceso hijo en los workers Celery de predicciones
+# (señal worker_process_init en cardiovascular_project/celery.py)
+ML_PRELOAD_IN_CELERY_WORKERS = os.getenv('ML_PRELOAD_IN_CELERY_WORKERS', 'False').lower() == 'true'
+
+# Modo de mapeo en memoria para artefactos joblib sin comprimir (None o 'r').
+# Con 'r' los arrays NumPy del artefacto se comparten entre workers vía page cache
+ML_ARTIFACT_MMAP_MODE = os.getenv('ML_ARTIFACT_MMAP_MODE') or None
+
+# Recarga en caliente de modelos (ver ml_models/hot_reload.py): 'redis'
+# (versiones publicadas con `manage.py publish_model`), 'file' (mtime de los
+# artefactos, desarrollo) u 'off'. Intervalo mínimo entre comprobaciones en segundos
+ML_MODEL_RELOAD_MODE = os.getenv('ML_MODEL_RELOAD_MODE', 'file')
+ML_MODEL_RELOAD_INTERVAL = float(os.getenv('ML_MODEL_RELOAD_INTERVAL', '5.0'))
+
+# Directorio del pipeline XGBoost exportado a arrays planos (export_flat_artifacts)
+ML_FLAT_PIPELINE_PATH = ML_MODELS_PATH / 'pipeline_flat'
+
+# Directorio del pipeline XGBoost exportado a ONNX (export_onnx_pipeline)
+ML_ONNX_PIPELINE_PATH = ML_MODELS_PATH / 'pipeline_onnx'
+
+# Backend de inferencia del pipeline XGBoost: 'sklearn' (joblib), 'flat'
+# (evaluador vectorizado sobre arrays planos) u 'onnx' (ONNX Runtime en CPU,
+# requiere onnxruntime). Ver ml_models/backends.py
+ML_INFERENCE_BACKEND = os.getenv('ML_INFERENCE_BACKEND', 'sklearn')
+
+# Presupuesto de hilos de cómputo por proceso (vacío = valor por defecto de cada
+# biblioteca). Con workers gthread o Celery con concurrencia > 1, mantener
+# hilos de petición × ML_MODEL_THREADS ≤ núcleos (ver ml_models/thread_budget.py)
+ML_MODEL_THREADS = int(os.getenv('ML_MODEL_THREADS') or 0) or None    # xgboost nthread, sklearn n_jobs, onnxruntime
+ML_OPENMP_THREADS = int(os.getenv('ML_OPENMP_THREADS') or 0) or None
+ML_BLAS_THREADS = int(os.getenv('ML_BLAS_THREADS') or 0) or None
+
+# Micro-batching de inferencia: agrupa predicciones concurrentes del mismo
+# proceso en un único predict_proba (ver ml_models/batching.py)
+ML_MICROBATCH_ENABLED = os.getenv('ML_MICROBATCH_ENABLED', 'False').lower() == 'true'
+ML_MICROBATCH_MAX_SIZE = int(os.getenv('ML_MICROBATCH_MAX_SIZE', '32'))
+ML_MICROBATCH_MAX_WAIT_MS = float(os.getenv('ML_MICROBATCH_MAX_WAIT_MS', '2.0'))
+
+# Pool de procesos de inferencia con memoria compartida (0 = modelo en proceso).
+# Los workers web envían las matrices de features al pool (ver ml_models/inference_pool.py)
+ML_INFERENCE_POOL_SIZE = int(os.getenv('ML_INFERENCE_POOL_SIZE', '0'))
+ML_INFERENCE_POOL_MAX_ROWS = int(os.getenv('ML_INFERENCE_POOL_MAX_ROWS', '1024'))
+
+# Caché de resultados de scoring por huella de las 10 features (redondeadas) y
+# versión del modelo, en la caché 'predictions' (ver ml_models/scoring_cache.py)
+ML_SCORING_CACHE_ENABLED = os.getenv('ML_SCORING_CACHE_ENABLED', 'True').lower() == 'true'
+ML_SCORING_CACHE_TIMEOUT = int(os.getenv('ML_SCORING_CACHE_TIMEOUT', '1800'))
+
+# Cabecera Server-Timing con las latencias por etapa de /api/predictions/predict/
+# (solo en respuestas a usuarios staff; ver ml_models/timing.py)
+PREDICTION_SERVER_TIMING = os.getenv('PREDICTION_SERVER_TIMING', 'False').lower() == 'true'
+
 # Tiempo de vida del caché en segundos (por ejemplo, 1 hora)
 CACHE_TTL = 60 * 60
 
+# Nivel L1 en memoria de cada proceso delante de Redis para predicciones,
+# pacientes y estadísticas (ver apps/predictions/cache_service.py): entradas
+# máximas por espacio de claves, TTL en segundos e intervalo mínimo entre
+# comprobaciones de invalidaciones de otros workers
+CACHE_L1_MAX_ENTRIES = int(os.getenv('CACHE_L1_MAX_ENTRIES', '1024'))
+CACHE_L1_TIMEOUT = float(os.getenv('CACHE_L1_TIMEOUT', '60'))
+CACHE_L1_SYNC_INTERVAL = float(os.getenv('CACHE_L1_SYNC_INTERVAL', '1.0'))
+
+# Outbox de efectos secundarios de /predict/ (ver apps/predictions/outbox.py):
+# eventos por lote, intervalo de la tarea de Celery beat en segundos,
+# reintentos máximos por evento, segundos que un lote reclamado queda
+# reservado para su worker y días que se conservan los procesados
+PREDICTION_OUTBOX_BATCH_SIZE = int(os.getenv('PREDICTION_OUTBOX_BATCH_SIZE', '200'))
+PREDICTION_OUTBOX_DRAIN_INTERVAL = float(os.getenv('PREDICTION_OUTBOX_DRAIN_INTERVAL', '2.0'))
+PREDICTION_OUTBOX_MAX_ATTEMPTS = int(os.getenv('PREDICTION_OUTBOX_MAX_ATTEMPTS', '10'))
+PREDICTION_OUTBOX_LEASE_SECONDS = int(os.getenv('PREDICTION_OUTBOX_LEASE_SECONDS', '300'))
+PREDICTION_OUTBOX_RETENTION_DAYS = int(os.getenv('PREDICTION_OUTBOX_RETENTION_DAYS', '7'))
+
 # Modelo de usuario personalizado
 AUTH_USER_MODEL = 'authentication.User'
 
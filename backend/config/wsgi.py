@@ -3,4 +3,12 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.development')
 
-application = get_wsgi_application() 
\ No newline at end of file
+application = get_wsgi_application()
+
+# Calentamiento opcional de modelos solo en los workers web. Corre en segundo
+# plano: /ready/ responde 503 hasta que termina (ver ml_models/warmup.py)
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, 'ML_WARMUP_ON_STARTUP', False):
+    from ml_models.warmup import start_warm_up  # noqa: E402
+    start_warm_up()
@@ -0,0 +1,68 @@
+"""
+Selección del backend de inferencia para el pipeline XGBoost
+
+`settings.ML_INFERENCE_BACKEND` decide cómo se sirve `pipeline.joblib`:
+  - 'sklearn': el Pipeline original deserializado con joblib
+  - 'flat':    FlatPipelineModel sobre el artefacto de arrays planos
+  - 'onnx':    OnnxPipelineModel sobre el grafo exportado (onnxruntime, CPU)
+
+Si el backend elegido no está disponible (artefacto ausente o desactualizado,
+onnxruntime sin instalar) se vuelve al Pipeline sklearn.
+"""
+
+import logging
+import os
+
+from django.conf import settings
+
+from ml_models.registry import model_registry
+
+logger = logging.getLogger('cardiovascular')
+
+DEFAULT_BACKEND = 'sklearn'
+
+
+def get_backend_name() -> str:
+    return getattr(settings, 'ML_INFERENCE_BACKEND', DEFAULT_BACKEND) or DEFAULT_BACKEND
+
+
+def load_pipeline_model(pipeline_path=None):
+    """Devuelve el modelo del pipeline según el backend configurado"""
+    pipeline_path = pipeline_path or os.path.join(settings.ML_MODELS_PATH, 'pipeline.joblib')
+    backend = get_backend_name()
+
+    if backend == 'flat':
+        try:
+            from ml_models.inference.flat_evaluator import FlatPipelineModel
+
+            artifact = model_registry.get_object(settings.ML_FLAT_PIPELINE_PATH)
+            if artifact is None:
+                logger.warning("Artefacto plano no encontrado, usando pipeline sklearn")
+            elif artifact.manifest.get('source_version') != model_registry.version_of(pipeline_path):
+                # Exportación obsoleta: el pipeline cambió después de exportarlo
+                logger.warning("Artefacto plano desactualizado respecto a pipeline.joblib, "
+                               "usando pipeline sklearn")
+            else:
+                return FlatPipelineModel(artifact)
+        except Exception as e:
+            logger.error(f"Error cargando backend plano, usando pipeline sklearn: {e}")
+    elif backend == 'onnx':
+        try:
+            from ml_models.inference.onnx_model import OnnxPipelineModel
+
+            artifact = model_registry.get_object(settings.ML_ONNX_PIPELINE_PATH)
+            if artifact is None:
+                logger.warning("Artefacto ONNX no encontrado, usando pipeline sklearn")
+            elif artifact.manifest.get('source_version') != model_registry.version_of(pipeline_path):
+                logger.warning("Artefacto ONNX desactualizado respecto a pipeline.joblib, "
+                               "usando pipeline sklearn")
+            else:
+                return OnnxPipelineModel(artifact)
+        except ImportError as e:
+            logger.warning(f"onnxruntime no disponible, usando pipeline sklearn: {e}")
+        except Exception as e:
+            logger.error(f"Error cargando backend ONNX, usando pipeline sklearn: {e}")
+    elif backend != DEFAULT_BACKEND:
+        logger.warning(f"Backend de inferencia desconocido '{backend}', usando pipeline sklearn")
+
+    return model_registry.get_object(pipeline_path)
@@ -0,0 +1,172 @@
+"""
+Micro-batching de inferencia dentro del proceso
+
+Las peticiones concurrentes a /api/predictions/predict/ hacen cada una una
+llamada al modelo con una sola fila. MicroBatcher las agrupa: cada hilo
+entrega su vector de features y recibe un Future; un hilo de fondo reúne
+hasta `max_batch_size` elementos o espera como máximo `max_wait_ms` desde
+el primero, ejecuta una única predicción por lotes y resuelve cada Future.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger('cardiovascular')
+
+
+def latency_percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/máximo de una muestra de latencias en ms"""
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+    ordered = sorted(values)
+
+    def percentile(fraction):
+        return round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)], 3)
+
+    return {
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        'max': round(ordered[-1], 3),
+    }
+
+
+class BatchingMetrics:
+    """Distribución de tamaños de lote y tiempos de espera en cola"""
+
+    def __init__(self, max_samples: int = 1000):
+        self._lock = threading.Lock()
+        self.batch_sizes: Dict[int, int] = {}
+        self.total_batches = 0
+        self.total_items = 0
+        self.errors = 0
+        self._queue_waits_ms = deque(maxlen=max_samples)
+        self._batch_times_ms = deque(maxlen=max_samples)
+
+    def record_batch(self, size: int, queue_waits_ms: List[float], batch_time_ms: float, failed: bool = False):
+        with self._lock:
+            self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+            self.total_batches += 1
+            self.total_items += size
+            if failed:
+                self.errors += 1
+            self._queue_waits_ms.extend(queue_waits_ms)
+            self._batch_times_ms.append(batch_time_ms)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            queue_waits = list(self._queue_waits_ms)
+            batch_times = list(self._batch_times_ms)
+            return {
+                'total_batches': self.total_batches,
+                'total_items': self.total_items,
+                'errors': self.errors,
+                'avg_batch_size': round(self.total_items / self.total_batches, 2) if self.total_batches else 0.0,
+                'batch_size_distribution': dict(sorted(self.batch_sizes.items())),
+                'queue_wait_ms': latency_percentiles(queue_waits),
+                'batch_time_ms': latency_percentiles(batch_times),
+            }
+
+
+class MicroBatcher:
+    """
+    Agrupa llamadas concurrentes en lotes para `batch_fn`.
+
+    `batch_fn` recibe la lista de elementos pendientes y debe devolver una
+    lista de resultados en el mismo orden. Si lanza una excepción, todos los
+    Futures del lote la reciben.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0, name: str = 'inference'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.name = name
+        self.metrics = BatchingMetrics()
+
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, item: Any) -> Future:
+        """Encola un elemento y devuelve el Future con su resultado"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def predict(self, item: Any, timeout: float = None) -> Any:
+        """Atajo síncrono: encola y espera el resultado"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _ensure_started(self):
+        # El hilo no sobrevive a un fork (workers de gunicorn/celery): se
+        # arranca de nuevo en cada proceso
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f'microbatcher-{self.name}', daemon=True)
+            self._thread.start()
+
+    def _collect_batch(self) -> List[tuple]:
+        """Bloquea hasta el primer elemento y reúne el resto hasta llenar el lote o agotar la espera"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started_at = time.perf_counter()
+            queue_waits_ms = [(started_at - enqueued_at) * 1000 for _, _, enqueued_at in batch]
+            items = [item for item, _, _ in batch]
+
+            failed = False
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise ValueError(f"batch_fn devolvió {len(results)} resultados para {len(items)} elementos")
+            except Exception as e:
+                failed = True
+                logger.error(f"Error en lote de inferencia ({len(items)} elementos): {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+
+            self.metrics.record_batch(
+                len(batch), queue_waits_ms, (time.perf_counter() - started_at) * 1000, failed=failed
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.metrics.as_dict()
+        stats.update({
+            'name': self.name,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'pending': self._queue.qsize(),
+        })
+        return stats
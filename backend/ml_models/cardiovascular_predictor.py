@@ -1,15 +1,120 @@
 import os
-import joblib
 import numpy as np
-import pandas as pd
 import logging
+from functools import lru_cache
 from django.conf import settings
-from sklearn.preprocessing import StandardScaler
 from typing import Dict, List, Tuple, Any
 
+from ml_models.backends import get_backend_name, load_pipeline_model
+from ml_models.clinical_scores import calculate_clinical_scores, clinical_score_columns
+from ml_models.features import PREDICTOR_PROFILE, feature_pipeline
+from ml_models.registry import LazyModelsMixin, model_registry
+from ml_models.rule_engine import FALLBACK_RULES, ML_FACTOR_RULES, PREDICTOR_RECOMMENDATIONS, TEXT_CACHE_SIZE
+
 logger = logging.getLogger('cardiovascular')
 
-class CardiovascularPredictor:
+# Recomendaciones generales según nivel de riesgo
+LEVEL_RECOMMENDATIONS = {
+    'alto': (
+        "Consulta inmediata con cardiólogo",
+        "Realizar pruebas de esfuerzo",
+        "Considerar estudios de imagen cardíaca",
+    ),
+    'moderado': (
+        "Seguimiento médico cada 3-6 meses",
+        "Realizar pruebas de laboratorio completas",
+    ),
+}
+
+# Recomendaciones por factor de riesgo: (textos que identifican el factor, recomendaciones)
+FACTOR_RECOMMENDATIONS = (
+    (("Hipertensión",), (
+        "Control estricto de presión arterial",
+        "Reducir consumo de sal",
+        "Considerar medicación antihipertensiva si no está en tratamiento",
+    )),
+    (("Colesterol",), (
+        "Dieta baja en grasas saturadas",
+        "Aumentar consumo de fibra",
+        "Considerar estatinas si no está en tratamiento",
+    )),
+    (("Diabetes",), (
+        "Control estricto de glucemia",
+        "Dieta controlada en carbohidratos",
+        "Ejercicio regular",
+    )),
+    (("Insuficiencia renal",), (
+        "Control de función renal",
+        "Dieta baja en proteínas",
+        "Control estricto de presión arterial",
+    )),
+    (("PCR elevada", "Homocisteína elevada"), (
+        "Evaluar causas de inflamación",
+        "Considerar suplementación con ácido fólico si hay homocisteína elevada",
+        "Control de otros factores inflamatorios",
+    )),
+    (("Estilo de vida sedentario",), (
+        "Iniciar programa de ejercicio gradual",
+        "Objetivo: 150 minutos de actividad moderada por semana",
+        "Considerar asesoría con fisioterapeuta",
+    )),
+    (("Dieta poco saludable",), (
+        "Consultar con nutricionista",
+        "Implementar dieta mediterránea",
+        "Aumentar consumo de frutas y verduras",
+    )),
+    (("Consumo excesivo de alcohol",), (
+        "Reducir consumo de alcohol",
+        "Considerar programa de apoyo si hay dependencia",
+        "Máximo 1-2 unidades por día",
+    )),
+    (("Estrés psicológico",), (
+        "Considerar técnicas de manejo de estrés",
+        "Evaluar necesidad de apoyo psicológico",
+        "Implementar rutinas de relajación",
+    )),
+    (("Apnea del sueño",), (
+        "Evaluación por especialista en sueño",
+        "Considerar estudio de polisomnografía",
+        "Implementar medidas de higiene del sueño",
+    )),
+)
+
+# Recomendaciones específicas según valores: (condición, recomendación)
+VALUE_RECOMMENDATIONS = (
+    (lambda features: features['circunferencia_cintura'] > 102 if features['sexo_encoded'] == 1 else 88,
+     "Reducir circunferencia de cintura mediante dieta y ejercicio"),
+    (lambda features: features['indice_cintura_cadera'] > 0.9 if features['sexo_encoded'] == 1 else 0.85,
+     "Implementar programa de reducción de grasa abdominal"),
+    (lambda features: features['acido_urico'] > 7.0,
+     "Dieta baja en purinas y control de ácido úrico"),
+    (lambda features: features['fibrinogeno'] > 400,
+     "Evaluar riesgo trombótico y considerar medidas preventivas"),
+)
+
+# Recomendaciones de seguimiento
+FOLLOW_UP_RECOMMENDATIONS = (
+    "Realizar controles periódicos según nivel de riesgo",
+    "Mantener registro de mediciones y síntomas",
+    "Seguir plan de tratamiento prescrito",
+)
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def _personalized_recommendations(risk_level: str, factor_mask: int, value_mask: int) -> Tuple[str, ...]:
+    """Lista de recomendaciones sin duplicados (en orden de aparición) para un par de máscaras y nivel"""
+    recommendations = list(LEVEL_RECOMMENDATIONS.get(risk_level, ()))
+    for bit, (_, texts) in enumerate(FACTOR_RECOMMENDATIONS):
+        if factor_mask >> bit & 1:
+            recommendations.extend(texts)
+    for bit, (_, text) in enumerate(VALUE_RECOMMENDATIONS):
+        if value_mask >> bit & 1:
+            recommendations.append(text)
+    recommendations.extend(FOLLOW_UP_RECOMMENDATIONS)
+    return tuple(dict.fromkeys(recommendations))
+
+
+class CardiovascularPredictor(LazyModelsMixin):
     """
     Sistema de predicción cardiovascular integrado
     Soporta tanto modelos ML como sistema de reglas médicas
@@ -32,23 +137,25 @@ class CardiovascularPredictor:
             'sexo_encoded', 'antecedentes_encoded'
         ]
         
-        self.model = None
-        self.scaler = None
-        self.load_models()
+        # Los modelos se cargan en la primera inferencia (ver LazyModelsMixin)
 
     def load_models(self):
         """Cargar modelos entrenados si existen"""
         try:
             # Preferir pipeline unificado si existe
             if os.path.exists(self.pipeline_path):
-                self.model = joblib.load(self.pipeline_path)
+                self.model = load_pipeline_model(self.pipeline_path)
                 self.scaler = None  # Ya está dentro del pipeline
-                logger.info("Pipeline de modelo cargado exitosamente (pipeline.joblib)")
+                # Los backends plano/ONNX se exportan de esta misma versión
+                self.model_version = model_registry.version_of(self.pipeline_path)
+                logger.info(f"Pipeline de modelo cargado exitosamente (pipeline.joblib, backend {get_backend_name()})")
             else:
                 # Buscar el primer modelo existente de la lista de candidatos
                 model_path = next((p for p in self.model_candidates if os.path.exists(p)), None)
                 if model_path:
-                    self.model = joblib.load(model_path)
+                    handle = model_registry.get(model_path)
+                    self.model = handle.obj
+                    self.model_version = handle.version
                     logger.info(f"Modelo cardiovascular cargado exitosamente desde: {os.path.basename(model_path)}")
                 else:
                     logger.info("Modelo no encontrado (.pkl/.joblib), usando sistema de reglas médicas")
@@ -56,7 +163,7 @@ class CardiovascularPredictor:
             # Cargar scaler solo si NO usamos pipeline
             if self.model is not None and not os.path.exists(self.pipeline_path):
                 if os.path.exists(self.scaler_path):
-                    self.scaler = joblib.load(self.scaler_path)
+                    self.scaler = model_registry.get_object(self.scaler_path)
                     logger.info("Scaler cargado exitosamente")
                 
         except Exception as e:
@@ -90,53 +197,8 @@ class CardiovascularPredictor:
             return self._default_prediction()
 
     def _extract_features(self, medical_record) -> Dict[str, float]:
-        """Extraer y preparar features del registro médico para el modelo reentrenado"""
-        patient = medical_record.patient
-
-        # Calcular IMC
-        imc = patient.imc or 25.0  # Valor por defecto
-
-        # Calcular índice de paquetes/año
-        indice_paquetes = medical_record.indice_paquetes_ano or 0.0
-
-        # Calcular edad desde fecha de nacimiento
-        from datetime import date
-        if patient.fecha_nacimiento:
-            today = date.today()
-            edad = today.year - patient.fecha_nacimiento.year - ((today.month, today.day) < (patient.fecha_nacimiento.month, patient.fecha_nacimiento.day))
-        else:
-            edad = 30  # Valor por defecto
-
-        # Codificar variables categóricas (0-1 encoding)
-        sexo_encoded = 1 if patient.sexo == 'M' else 0
-
-        antecedentes_mapping = {'si': 1, 'no': 0, 'desconoce': 0}
-        antecedentes_encoded = antecedentes_mapping.get(medical_record.antecedentes_cardiacos, 0)
-
-        # Mapear actividad física a encoding numérico
-        actividad_mapping = {
-            'sedentario': 0,
-            'ligero': 1,
-            'moderado': 2,
-            'intenso': 3
-        }
-        actividad_fisica_encoded = actividad_mapping.get(medical_record.actividad_fisica, 1)
-
-        # Features simplificadas para el modelo reentrenado
-        features = {
-            'edad': float(edad),
-            'imc': float(imc),
-            'presion_sistolica': float(medical_record.presion_sistolica or 120),
-            'presion_diastolica': float(medical_record.presion_diastolica or 80),
-            'colesterol': float(medical_record.colesterol_total or 200),
-            'glucosa': float(medical_record.glucosa or 100),
-            'indice_paquetes': float(indice_paquetes),
-            'actividad_fisica_encoded': float(actividad_fisica_encoded),
-            'sexo_encoded': float(sexo_encoded),
-            'antecedentes_encoded': float(antecedentes_encoded)
-        }
-
-        return features
+        """Features del registro médico para el modelo reentrenado (ver ml_models.features)"""
+        return feature_pipeline.features(medical_record, PREDICTOR_PROFILE)
 
     def _ml_prediction(self, features: Dict[str, float], medical_record) -> Dict[str, Any]:
         """Realizar predicción usando modelo de machine learning"""
@@ -181,7 +243,7 @@ class CardiovascularPredictor:
                 'probabilidad': round(risk_probability, 1),
                 'factores_riesgo': risk_factors,
                 'recomendaciones': recommendations,
-                'model_version': 'realistic_v1.0.0',
+                'model_version': self.model_version or 'realistic_v1.0.0',
                 'confidence_score': round(max(prediction_proba), 3),
                 'features_used': features,
                 'prediction_probabilities': {
@@ -197,170 +259,29 @@ class CardiovascularPredictor:
             return self._rule_based_prediction(features, medical_record)
 
     def _analyze_risk_factors_ml(self, features: Dict[str, float]) -> List[str]:
-        """Analizar factores de riesgo para predicción ML"""
-        risk_factors = []
-
-        # Edad
-        if features['edad'] > 65:
-            risk_factors.append(f"Edad avanzada ({features['edad']:.0f} años)")
-        elif features['edad'] > 45:
-            risk_factors.append(f"Edad media ({features['edad']:.0f} años)")
-
-        # IMC
-        if features['imc'] > 30:
-            risk_factors.append(f"Obesidad (IMC: {features['imc']:.1f})")
-        elif features['imc'] > 25:
-            risk_factors.append(f"Sobrepeso (IMC: {features['imc']:.1f})")
-
-        # Presión arterial
-        if features['presion_sistolica'] > 140 or features['presion_diastolica'] > 90:
-            risk_factors.append(f"Hipertensión ({features['presion_sistolica']:.0f}/{features['presion_diastolica']:.0f} mmHg)")
-        elif features['presion_sistolica'] > 130 or features['presion_diastolica'] > 80:
-            risk_factors.append(f"Presión elevada ({features['presion_sistolica']:.0f}/{features['presion_diastolica']:.0f} mmHg)")
-
-        # Colesterol
-        if features['colesterol'] > 240:
-            risk_factors.append(f"Colesterol alto ({features['colesterol']:.0f} mg/dL)")
-        elif features['colesterol'] > 200:
-            risk_factors.append(f"Colesterol borderline ({features['colesterol']:.0f} mg/dL)")
-
-        # Glucosa
-        if features['glucosa'] > 126:
-            risk_factors.append(f"Glucosa elevada ({features['glucosa']:.0f} mg/dL)")
-        elif features['glucosa'] > 100:
-            risk_factors.append(f"Glucosa alterada ({features['glucosa']:.0f} mg/dL)")
-
-        # Tabaquismo
-        if features['indice_paquetes'] > 10:
-            risk_factors.append(f"Tabaquismo intenso ({features['indice_paquetes']:.1f} paquetes/año)")
-        elif features['indice_paquetes'] > 0:
-            risk_factors.append(f"Tabaquismo ({features['indice_paquetes']:.1f} paquetes/año)")
-
-        # Actividad física
-        if features['actividad_fisica_encoded'] < 1:
-            risk_factors.append("Sedentarismo")
-
-        # Antecedentes
-        if features['antecedentes_encoded'] > 0:
-            risk_factors.append("Antecedentes cardíacos familiares")
-
-        return risk_factors
+        """Analizar factores de riesgo para predicción ML (ver ML_FACTOR_RULES)"""
+        return ML_FACTOR_RULES.render_factors(ML_FACTOR_RULES.evaluate_one(features)[2], features)
 
     def _generate_recommendations(self, risk_level: str, features: Dict[str, float]) -> List[str]:
-        """Generar recomendaciones basadas en el nivel de riesgo"""
-        recommendations = []
-
-        if risk_level == 'ALTO':
-            recommendations.extend([
-                "Consulta cardiológica inmediata",
-                "Exámenes cardíacos completos (ECG, ecocardiograma, pruebas de esfuerzo)",
-                "Control estricto de factores de riesgo",
-                "Posible inicio de tratamiento farmacológico"
-            ])
-        elif risk_level == 'MEDIO':
-            recommendations.extend([
-                "Consulta cardiológica en las próximas 4-6 semanas",
-                "Exámenes de laboratorio básicos",
-                "Modificación de estilo de vida",
-                "Seguimiento regular de presión arterial y colesterol"
-            ])
-        else:  # BAJO
-            recommendations.extend([
-                "Mantener controles médicos regulares",
-                "Estilo de vida saludable",
-                "Prevención primaria",
-                "Chequeos anuales"
-            ])
-
-        # Recomendaciones específicas basadas en factores de riesgo
-        if features['imc'] > 25:
-            recommendations.append("Control de peso y dieta saludable")
-        if features['presion_sistolica'] > 130:
-            recommendations.append("Control de presión arterial")
-        if features['colesterol'] > 200:
-            recommendations.append("Control de colesterol")
-        if features['indice_paquetes'] > 0:
-            recommendations.append("Dejar de fumar - programa de cesación tabáquica")
-        if features['actividad_fisica_encoded'] < 2:
-            recommendations.append("Aumentar actividad física (150 min/semana de ejercicio moderado)")
-
-        return recommendations
+        """Generar recomendaciones basadas en el nivel de riesgo (ver PREDICTOR_RECOMMENDATIONS)"""
+        return PREDICTOR_RECOMMENDATIONS.recommendations(risk_level, features)
 
     def _rule_based_prediction(self, features: Dict[str, float], medical_record) -> Dict[str, Any]:
-        """Sistema de predicción basado en reglas médicas cuando ML falla"""
-        # Implementación básica de reglas médicas
-        risk_score = 0
-        risk_factors = []
+        """Sistema de predicción basado en reglas médicas cuando ML falla (ver FALLBACK_RULES)"""
+        evaluation = FALLBACK_RULES.evaluate_records([features])
+        risk_level = evaluation.level(0)
 
-        # Evaluar factores de riesgo
-        if features['edad'] > 65:
-            risk_score += 25
-            risk_factors.append(f"Edad avanzada ({features['edad']:.0f} años)")
-        elif features['edad'] > 45:
-            risk_score += 15
-            risk_factors.append(f"Edad media ({features['edad']:.0f} años)")
-
-        if features['imc'] > 30:
-            risk_score += 20
-            risk_factors.append(f"Obesidad (IMC: {features['imc']:.1f})")
-        elif features['imc'] > 25:
-            risk_score += 10
-            risk_factors.append(f"Sobrepeso (IMC: {features['imc']:.1f})")
-
-        if features['presion_sistolica'] > 140 or features['presion_diastolica'] > 90:
-            risk_score += 25
-            risk_factors.append(f"Hipertensión ({features['presion_sistolica']:.0f}/{features['presion_diastolica']:.0f})")
-        elif features['presion_sistolica'] > 130 or features['presion_diastolica'] > 80:
-            risk_score += 15
-            risk_factors.append(f"Presión elevada ({features['presion_sistolica']:.0f}/{features['presion_diastolica']:.0f})")
-
-        if features['colesterol'] > 240:
-            risk_score += 20
-            risk_factors.append(f"Colesterol alto ({features['colesterol']:.0f})")
-        elif features['colesterol'] > 200:
-            risk_score += 10
-            risk_factors.append(f"Colesterol borderline ({features['colesterol']:.0f})")
-
-        if features['glucosa'] > 126:
-            risk_score += 20
-            risk_factors.append(f"Glucosa elevada ({features['glucosa']:.0f})")
-        elif features['glucosa'] > 100:
-            risk_score += 10
-            risk_factors.append(f"Glucosa alterada ({features['glucosa']:.0f})")
-
-        if features['indice_paquetes'] > 10:
-            risk_score += 20
-            risk_factors.append(f"Tabaquismo intenso ({features['indice_paquetes']:.1f} paquetes/año)")
-        elif features['indice_paquetes'] > 0:
-            risk_score += 10
-            risk_factors.append(f"Tabaquismo ({features['indice_paquetes']:.1f} paquetes/año)")
-
-        if features['antecedentes_encoded'] > 0:
-            risk_score += 15
-            risk_factors.append("Antecedentes cardíacos familiares")
-
-        # Determinar nivel de riesgo
-        if risk_score >= 40:
-            risk_level = 'ALTO'
-            probability = 85.0
-        elif risk_score >= 20:
-            risk_level = 'MEDIO'
-            probability = 60.0
-        else:
-            risk_level = 'BAJO'
-            probability = 25.0
-
-        recommendations = self._generate_recommendations(risk_level, features)
+        recommendations = self._generate_recommendations(risk_level.name, features)
 
         return {
-            'riesgo_nivel': risk_level,
-            'probabilidad': probability,
-            'factores_riesgo': risk_factors,
+            'riesgo_nivel': risk_level.name,
+            'probabilidad': risk_level.probability,
+            'factores_riesgo': evaluation.factors(0, features),
             'recomendaciones': recommendations,
             'model_version': 'rules_fallback_v1.0.0',
             'confidence_score': 0.7,
             'features_used': features,
-            'scores_detallados': {'total_score': risk_score}
+            'scores_detallados': {'total_score': int(evaluation.score(0))}
         }
 
     def _describe_risk_factor(self, feature_name: str, value: float) -> str:
@@ -522,228 +443,24 @@ class CardiovascularPredictor:
 
     def _generate_recommendations(self, risk_factors: List[str], risk_level: str, features: Dict[str, float]) -> List[str]:
         """Generar recomendaciones personalizadas basadas en los factores de riesgo"""
-        recommendations = []
-        
-        # Recomendaciones generales según nivel de riesgo
-        if risk_level == 'alto':
-            recommendations.extend([
-                "Consulta inmediata con cardiólogo",
-                "Realizar pruebas de esfuerzo",
-                "Considerar estudios de imagen cardíaca"
-            ])
-        elif risk_level == 'moderado':
-            recommendations.extend([
-                "Seguimiento médico cada 3-6 meses",
-                "Realizar pruebas de laboratorio completas"
-            ])
-        
-        # Recomendaciones específicas por factor de riesgo
-        for factor in risk_factors:
-            if "Hipertensión" in factor:
-                recommendations.extend([
-                    "Control estricto de presión arterial",
-                    "Reducir consumo de sal",
-                    "Considerar medicación antihipertensiva si no está en tratamiento"
-                ])
-            
-            if "Colesterol" in factor:
-                recommendations.extend([
-                    "Dieta baja en grasas saturadas",
-                    "Aumentar consumo de fibra",
-                    "Considerar estatinas si no está en tratamiento"
-                ])
-            
-            if "Diabetes" in factor:
-                recommendations.extend([
-                    "Control estricto de glucemia",
-                    "Dieta controlada en carbohidratos",
-                    "Ejercicio regular"
-                ])
-            
-            if "Insuficiencia renal" in factor:
-                recommendations.extend([
-                    "Control de función renal",
-                    "Dieta baja en proteínas",
-                    "Control estricto de presión arterial"
-                ])
-            
-            if "PCR elevada" in factor or "Homocisteína elevada" in factor:
-                recommendations.extend([
-                    "Evaluar causas de inflamación",
-                    "Considerar suplementación con ácido fólico si hay homocisteína elevada",
-                    "Control de otros factores inflamatorios"
-                ])
-            
-            if "Estilo de vida sedentario" in factor:
-                recommendations.extend([
-                    "Iniciar programa de ejercicio gradual",
-                    "Objetivo: 150 minutos de actividad moderada por semana",
-                    "Considerar asesoría con fisioterapeuta"
-                ])
-            
-            if "Dieta poco saludable" in factor:
-                recommendations.extend([
-                    "Consultar con nutricionista",
-                    "Implementar dieta mediterránea",
-                    "Aumentar consumo de frutas y verduras"
-                ])
-            
-            if "Consumo excesivo de alcohol" in factor:
-                recommendations.extend([
-                    "Reducir consumo de alcohol",
-                    "Considerar programa de apoyo si hay dependencia",
-                    "Máximo 1-2 unidades por día"
-                ])
-            
-            if "Estrés psicológico" in factor:
-                recommendations.extend([
-                    "Considerar técnicas de manejo de estrés",
-                    "Evaluar necesidad de apoyo psicológico",
-                    "Implementar rutinas de relajación"
-                ])
-            
-            if "Apnea del sueño" in factor:
-                recommendations.extend([
-                    "Evaluación por especialista en sueño",
-                    "Considerar estudio de polisomnografía",
-                    "Implementar medidas de higiene del sueño"
-                ])
-        
-        # Recomendaciones específicas según valores
-        if features['circunferencia_cintura'] > 102 if features['sexo_encoded'] == 1 else 88:
-            recommendations.append("Reducir circunferencia de cintura mediante dieta y ejercicio")
-        
-        if features['indice_cintura_cadera'] > 0.9 if features['sexo_encoded'] == 1 else 0.85:
-            recommendations.append("Implementar programa de reducción de grasa abdominal")
-        
-        if features['acido_urico'] > 7.0:
-            recommendations.append("Dieta baja en purinas y control de ácido úrico")
-        
-        if features['fibrinogeno'] > 400:
-            recommendations.append("Evaluar riesgo trombótico y considerar medidas preventivas")
-        
-        # Recomendaciones de seguimiento
-        recommendations.extend([
-            "Realizar controles periódicos según nivel de riesgo",
-            "Mantener registro de mediciones y síntomas",
-            "Seguir plan de tratamiento prescrito"
-        ])
-        
-        return list(set(recommendations))  # Eliminar duplicados
+        # Máscara de categorías presentes en los factores
+        factor_mask = 0
+        for bit, (keywords, _) in enumerate(FACTOR_RECOMMENDATIONS):
+            if any(keyword in factor for factor in risk_factors for keyword in keywords):
+                factor_mask |= 1 << bit
 
-    def _calculate_detailed_scores(self, features: Dict[str, float], medical_record) -> Dict[str, Any]:
-        """Calcular scores detallados por categoría"""
-        return {
-            'framingham_score': self._calculate_framingham_score(features),
-            'reynolds_score': self._calculate_reynolds_score(features),
-            'acc_aha_score': self._calculate_acc_aha_score(features),
-            'metabolic_syndrome': self._evaluate_metabolic_syndrome(features),
-        }
+        # Máscara de recomendaciones específicas según valores
+        value_mask = 0
+        for bit, (condition, _) in enumerate(VALUE_RECOMMENDATIONS):
+            if condition(features):
+                value_mask |= 1 << bit
 
-    def _calculate_framingham_score(self, features: Dict[str, float]) -> float:
-        """Calcular Framingham Risk Score simplificado"""
-        score = 0
-        
-        # Edad
-        edad = features['edad']
-        if features['sexo_encoded'] == 1:  # Hombre
-            if edad >= 70: score += 11
-            elif edad >= 60: score += 8
-            elif edad >= 50: score += 5
-            elif edad >= 40: score += 2
-        else:  # Mujer
-            if edad >= 70: score += 12
-            elif edad >= 60: score += 9
-            elif edad >= 50: score += 6
-            elif edad >= 40: score += 3
-        
-        # Colesterol total
-        if features['colesterol_total'] >= 280: score += 3
-        elif features['colesterol_total'] >= 240: score += 2
-        elif features['colesterol_total'] >= 200: score += 1
-        
-        # HDL
-        if features['colesterol_hdl'] < 35: score += 2
-        elif features['colesterol_hdl'] < 45: score += 1
-        
-        # Presión arterial
-        if features['presion_sistolica'] >= 160: score += 3
-        elif features['presion_sistolica'] >= 140: score += 2
-        elif features['presion_sistolica'] >= 130: score += 1
-        
-        # Diabetes
-        if features['diabetes_encoded']: score += 2
-        
-        # Tabaquismo
-        if features['indice_paquetes'] > 0: score += 2
-        
-        return min(score * 2, 30)  # Convertir a porcentaje
-
-    def _calculate_reynolds_score(self, features: Dict[str, float]) -> float:
-        """Calcular Reynolds Risk Score simplificado"""
-        # Implementación simplificada del Reynolds Score
-        base_score = self._calculate_framingham_score(features)
-        
-        # Ajustes por factores adicionales
-        if features['antecedentes_encoded'] == 1:
-            base_score *= 1.2
-        
-        if features['imc'] >= 30:
-            base_score *= 1.1
-        
-        return min(base_score, 30)
-
-    def _calculate_acc_aha_score(self, features: Dict[str, float]) -> float:
-        """Calcular ACC/AHA Risk Score simplificado"""
-        # Implementación simplificada basada en las guías ACC/AHA
-        score = 0
-        
-        # Factores principales
-        if features['edad'] >= 65: score += 15
-        elif features['edad'] >= 55: score += 10
-        elif features['edad'] >= 45: score += 5
-        
-        if features['presion_sistolica'] >= 140: score += 10
-        if features['colesterol_total'] >= 240: score += 8
-        if features['diabetes_encoded']: score += 12
-        if features['indice_paquetes'] > 10: score += 8
-        
-        return min(score, 30)
+        return list(_personalized_recommendations(risk_level, factor_mask, value_mask))
 
-    def _evaluate_metabolic_syndrome(self, features: Dict[str, float]) -> Dict[str, Any]:
-        """Evaluar síndrome metabólico"""
-        criteria_met = 0
-        criteria = []
-        
-        # Criterios del síndrome metabólico
-        if features['imc'] >= 30:  # Aproximación con IMC
-            criteria_met += 1
-            criteria.append("Obesidad abdominal")
-        
-        if features['trigliceridos'] >= 150:
-            criteria_met += 1
-            criteria.append("Triglicéridos elevados")
-        
-        if features['colesterol_hdl'] < 40 if features['sexo_encoded'] else features['colesterol_hdl'] < 50:
-            criteria_met += 1
-            criteria.append("HDL bajo")
-        
-        if features['presion_sistolica'] >= 130 or features['presion_diastolica'] >= 85:
-            criteria_met += 1
-            criteria.append("Hipertensión arterial")
-        
-        if features['glucosa'] >= 100:
-            criteria_met += 1
-            criteria.append("Glucosa alterada")
-        
-        has_syndrome = criteria_met >= 3
-        
-        return {
-            'tiene_sindrome': has_syndrome,
-            'criterios_cumplidos': criteria_met,
-            'criterios': criteria,
-            'riesgo': "Alto" if has_syndrome else "Moderado" if criteria_met >= 2 else "Bajo"
-        }
+    def _calculate_detailed_scores(self, features: Dict[str, float], medical_record) -> Dict[str, Any]:
+        """Calcular scores detallados por categoría (ver ml_models.clinical_scores)"""
+        columns = clinical_score_columns(feature_pipeline.score_rows([medical_record], [features]))
+        return calculate_clinical_scores(columns).records()[0]
 
     def _ml_prediction(self, features: Dict[str, float], medical_record) -> Dict[str, Any]:
         """Predicción usando modelo ML entrenado"""
@@ -771,7 +488,7 @@ class CardiovascularPredictor:
                 'probabilidad': float(probability * 100),
                 'factores_riesgo': risk_factors,
                 'recomendaciones': recommendations,
-                'model_version': 'ml_v1.2.0',
+                'model_version': self.model_version or 'ml_v1.2.0',
                 'confidence_score': float(confidence),
                 'features_used': features
             }
@@ -4,23 +4,43 @@ Predictor cardiovascular actualizado para usar el modelo reentrenado
 con datos más realistas
 """
 
+import copy
 import os
-import joblib
+import threading
 import numpy as np
-import pandas as pd
 import logging
 from django.conf import settings
-from sklearn.preprocessing import StandardScaler
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any
+
+from ml_models.batching import MicroBatcher
+from ml_models.clinical_scores import calculate_clinical_scores, clinical_score_columns
+from ml_models.features import PREDICTOR_PROFILE, feature_pipeline
+from ml_models.registry import LazyModelsMixin, model_registry
+from ml_models.rule_engine import FALLBACK_RULES, ML_FACTOR_RULES, PREDICTOR_RECOMMENDATIONS
+from ml_models.scoring_cache import RECORD_FIELDS, canonical_features, feature_fingerprint, scoring_cache
+from ml_models.timing import span
 
 logger = logging.getLogger('cardiovascular')
 
-class CardiovascularPredictor:
+# Segundos máximos que una petición espera el resultado de su lote
+MICROBATCH_RESULT_TIMEOUT = 5.0
+
+class CardiovascularPredictor(LazyModelsMixin):
     """
     Sistema de predicción cardiovascular integrado
     Soporta tanto modelos ML como sistema de reglas médicas
+
+    La instancia global `cardiovascular_predictor` la comparten todos los
+    hilos del proceso. `predict_cardiovascular_risk` y `predict_many` son
+    reentrantes: cada llamada trabaja con sus propias features y matrices,
+    el modelo y el scaler solo se leen (predict_proba de sklearn/xgboost no
+    modifica el estimador) y el estado compartido está protegido (carga de
+    modelos y micro-batcher con locks, caché de features con el suyo). Los
+    hilos nativos que usa cada llamada los limita ml_models.thread_budget.
     """
 
+    _micro_batcher_lock = threading.Lock()
+
     def __init__(self):
         # Priorizar modelos reentrenados con datos realistas
         self.model_candidates = [
@@ -38,9 +58,8 @@ class CardiovascularPredictor:
             'sexo_encoded', 'antecedentes_encoded'
         ]
 
-        self.model = None
-        self.scaler = None
-        self.load_models()
+        # Los modelos se cargan en la primera inferencia (ver LazyModelsMixin)
+        self._micro_batcher = None
 
     def load_models(self):
         """Cargar modelos entrenados si existen"""
@@ -61,13 +80,19 @@ class CardiovascularPredictor:
             else:
                 scaler_path = os.path.join(settings.ML_MODELS_PATH, 'scaler.pkl')
 
+            # Modo pool: el modelo vive en procesos de inferencia dedicados
+            if model_path and os.path.exists(model_path) and self._load_inference_pool(model_path, scaler_path):
+                return
+
             # Cargar modelo y scaler
             if model_path and os.path.exists(model_path):
-                self.model = joblib.load(model_path)
-                logger.info(f"Modelo reentrenado cargado: {os.path.basename(model_path)}")
+                handle = model_registry.get(model_path)
+                self.model = handle.obj
+                self.model_version = handle.version
+                logger.info(f"Modelo reentrenado cargado: {os.path.basename(model_path)} (versión {handle.version})")
 
                 if os.path.exists(scaler_path):
-                    self.scaler = joblib.load(scaler_path)
+                    self.scaler = model_registry.get_object(scaler_path)
                     logger.info(f"Scaler cargado: {os.path.basename(scaler_path)}")
                 else:
                     logger.warning("Scaler no encontrado, usando predicción sin normalización")
@@ -78,6 +103,36 @@ class CardiovascularPredictor:
             logger.error(f"Error cargando modelos: {e}")
             self.model = None
             self.scaler = None
+            self.model_version = None
+
+    def _load_inference_pool(self, model_path: str, scaler_path: str) -> bool:
+        """
+        Si ML_INFERENCE_POOL_SIZE > 0, usa como modelo un pool de procesos que
+        aplica scaler + predict_proba fuera de este proceso. Devuelve False si
+        el modo está desactivado o el pool no pudo arrancar.
+        """
+        pool_size = getattr(settings, 'ML_INFERENCE_POOL_SIZE', 0)
+        if pool_size <= 0:
+            return False
+
+        try:
+            from ml_models.inference_pool import get_inference_pool
+
+            version = model_registry.version_of(model_path)
+            self.model = get_inference_pool(
+                model_path,
+                scaler_path if os.path.exists(scaler_path) else None,
+                processes=pool_size,
+                max_rows=getattr(settings, 'ML_INFERENCE_POOL_MAX_ROWS', 1024),
+                version=version,
+            )
+            self.scaler = None  # Lo aplica el pool
+            self.model_version = version
+            logger.info(f"Modelo servido por pool de inferencia: {os.path.basename(model_path)} ({pool_size} procesos)")
+            return True
+        except Exception as e:
+            logger.error(f"Error iniciando pool de inferencia, se carga el modelo en proceso: {e}")
+            return False
 
     def predict_cardiovascular_risk(self, medical_record) -> Dict[str, Any]:
         """
@@ -85,16 +140,20 @@ class CardiovascularPredictor:
         """
         try:
             # Preparar features
-            features = self._extract_features(medical_record)
+            with span('predictor.features'):
+                features = self._extract_features(medical_record)
+
+            # Carga perezosa del modelo: solo cuesta en la primera predicción del proceso
+            with span('predictor.model_load'):
+                model = self.model
 
             # Realizar predicción: si hay modelo (pipeline o modelo+scaler) usamos ML
-            if self.model is not None:
-                prediction_result = self._ml_prediction(features, medical_record)
-            else:
-                prediction_result = self._rule_based_prediction(features, medical_record)
+            prediction_result = self._score_records([features], [medical_record], single=True)[0]
 
             # Análisis adicional
-            prediction_result['scores_detallados'] = self._calculate_detailed_scores(features, medical_record)
+            with span('predictor.scores'):
+                prediction_result['scores_detallados'] = self._calculate_detailed_scores(features, medical_record)
+                prediction_result['scores_detallados'].update(self._clinical_scores([features], [medical_record])[0])
 
             logger.info(f"Predicción completada: {prediction_result['riesgo_nivel']} - {prediction_result['probabilidad']}%")
 
@@ -104,279 +163,313 @@ class CardiovascularPredictor:
             logger.error(f"Error en predicción cardiovascular: {e}")
             return self._default_prediction()
 
-    def _extract_features(self, medical_record) -> Dict[str, float]:
-        """Extraer y preparar features del registro médico para el modelo reentrenado"""
-        patient = medical_record.patient
-
-        # Calcular IMC
-        imc = patient.imc or 25.0  # Valor por defecto
-
-        # Calcular índice de paquetes/año
-        indice_paquetes = medical_record.indice_paquetes_ano or 0.0
-
-        # Calcular edad desde fecha de nacimiento
-        from datetime import date
-        if patient.fecha_nacimiento:
-            today = date.today()
-            edad = today.year - patient.fecha_nacimiento.year - ((today.month, today.day) < (patient.fecha_nacimiento.month, patient.fecha_nacimiento.day))
-        else:
-            edad = 30  # Valor por defecto
-
-        # Codificar variables categóricas (0-1 encoding)
-        sexo_encoded = 1 if patient.sexo == 'M' else 0
-
-        antecedentes_mapping = {'si': 1, 'no': 0, 'desconoce': 0}
-        antecedentes_encoded = antecedentes_mapping.get(medical_record.antecedentes_cardiacos, 0)
-
-        # Mapear actividad física a encoding numérico
-        actividad_mapping = {
-            'sedentario': 0,
-            'ligero': 1,
-            'moderado': 2,
-            'intenso': 3
-        }
-        actividad_fisica_encoded = actividad_mapping.get(medical_record.actividad_fisica, 1)
-
-        # Features simplificadas para el modelo reentrenado
-        features = {
-            'edad': float(edad),
-            'imc': float(imc),
-            'presion_sistolica': float(medical_record.presion_sistolica or 120),
-            'presion_diastolica': float(medical_record.presion_diastolica or 80),
-            'colesterol': float(medical_record.colesterol or 200),  # Corregido: usar colesterol en lugar de colesterol_total
-            'glucosa': float(medical_record.glucosa or 100),
-            'indice_paquetes': float(indice_paquetes),
-            'actividad_fisica_encoded': float(actividad_fisica_encoded),
-            'sexo_encoded': float(sexo_encoded),
-            'antecedentes_encoded': float(antecedentes_encoded)
-        }
+    def predict_many(self, medical_records) -> List[Dict[str, Any]]:
+        """
+        Predicción vectorizada de riesgo cardiovascular para un lote de registros.
+        Construye una única matriz N×10, ejecuta un solo predict_proba y solo
+        después aplica el post-procesamiento por registro. Devuelve los
+        resultados en el mismo orden que los registros de entrada.
+        """
+        records = list(medical_records)
+        results: List[Dict[str, Any]] = [None] * len(records)
+
+        # Extraer features por registro, aislando los registros inválidos
+        valid_indices = []
+        features_list = []
+        for index, medical_record in enumerate(records):
+            try:
+                features_list.append(self._extract_features(medical_record))
+                valid_indices.append(index)
+            except Exception as e:
+                logger.error(f"Error extrayendo features del registro {index}: {e}")
+                results[index] = self._default_prediction()
+
+        if not valid_indices:
+            return results
+
+        valid_records = [records[index] for index in valid_indices]
+
+        batch_results = self._score_records(features_list, valid_records)
+
+        clinical_scores = self._clinical_scores(features_list, valid_records)
+
+        for index, features, medical_record, prediction_result, clinical in zip(
+            valid_indices, features_list, valid_records, batch_results, clinical_scores
+        ):
+            try:
+                prediction_result['scores_detallados'] = self._calculate_detailed_scores(features, medical_record)
+                prediction_result['scores_detallados'].update(clinical)
+                results[index] = prediction_result
+            except Exception as e:
+                logger.error(f"Error en predicción cardiovascular del registro {index}: {e}")
+                results[index] = self._default_prediction()
+
+        logger.info(f"Predicción en lote completada: {len(records)} registros")
+
+        return results
+
+    def _score_records(self, features_list: List[Dict[str, float]], medical_records,
+                       single: bool = False) -> List[Dict[str, Any]]:
+        """
+        Nivel de riesgo, probabilidad, factores y recomendaciones de cada
+        registro (ML si hay modelo, reglas si no). Con la caché de scoring
+        activa se reutilizan los resultados por huella del vector de features
+        y solo se puntúan las huellas nuevas (ver ml_models.scoring_cache).
+        """
+        if not scoring_cache.active:
+            return self._score_uncached(features_list, medical_records, single)
+
+        with span('predictor.scoring_cache'):
+            canonical_list = [canonical_features(features) for features in features_list]
+            version = self._scoring_version()
+            keys = [feature_fingerprint(canonical, version) for canonical in canonical_list]
+            scored = scoring_cache.get_many(set(keys))
+
+        # Huellas sin resultado, una vez cada una aunque se repitan en el lote
+        pending: Dict[str, int] = {}
+        for index, key in enumerate(keys):
+            if key not in scored:
+                pending.setdefault(key, index)
+        if pending:
+            indices = list(pending.values())
+            fresh = dict(zip(pending, self._score_uncached(
+                [canonical_list[index] for index in indices],
+                [medical_records[index] for index in indices],
+                single,
+            )))
+            scoring_cache.set_many(fresh)
+            scored.update(fresh)
+
+        results = []
+        for key, features in zip(keys, features_list):
+            result = {field: copy.deepcopy(value) for field, value in scored[key].items()
+                      if field not in RECORD_FIELDS}
+            result['features_used'] = features
+            results.append(result)
+        return results
+
+    def _score_uncached(self, features_list: List[Dict[str, float]], medical_records,
+                        single: bool = False) -> List[Dict[str, Any]]:
+        """Scoring sin caché; `single` usa el camino por petición (micro-batcher)"""
+        if single:
+            if self.model is not None:
+                with span('predictor.ml'):
+                    return [self._ml_prediction(features_list[0], medical_records[0])]
+            with span('predictor.rules'):
+                return [self._rule_based_prediction(features_list[0], medical_records[0])]
+
+        if self.model is not None:
+            return self._ml_predictions_batch(features_list, medical_records)
+        return self._rule_based_predictions_batch(features_list, medical_records)
+
+    def _scoring_version(self) -> str:
+        """Versión que distingue los resultados cacheados: modelo activo o reglas"""
+        model, _, model_version = self.active_models()
+        if model is None:
+            return 'rules'
+        return model_version or 'unversioned'
 
-        return features
+    def _extract_features(self, medical_record) -> Dict[str, float]:
+        """Features del registro médico para el modelo reentrenado (ver ml_models.features)"""
+        return feature_pipeline.features(medical_record, PREDICTOR_PROFILE)
 
     def _ml_prediction(self, features: Dict[str, float], medical_record) -> Dict[str, Any]:
         """Realizar predicción usando modelo de machine learning"""
+        batcher = self.micro_batcher
+        if batcher is None:
+            return self._ml_predictions_batch([features], [medical_record])[0]
+
+        # Con micro-batching, la llamada al modelo se agrupa con las de otras
+        # peticiones concurrentes; el post-procesamiento sigue en este hilo
         try:
-            # Preparar features en el orden correcto para el modelo
-            feature_values = []
-            for feature_name in self.feature_names:
-                if feature_name in features:
-                    feature_values.append(features[feature_name])
-                else:
-                    # Valor por defecto si falta alguna feature
-                    feature_values.append(0.0)
+            prediction_proba, prediction, model_version = batcher.predict(features, timeout=MICROBATCH_RESULT_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Error en predicción ML: {e}")
+            return self._rule_based_prediction(features, medical_record)
+
+        return self._build_ml_result(features, prediction_proba, prediction, medical_record, model_version)
+
+    @property
+    def micro_batcher(self) -> Optional[MicroBatcher]:
+        """Micro-batcher de inferencia, solo si está habilitado en settings"""
+        if not getattr(settings, 'ML_MICROBATCH_ENABLED', False):
+            return None
+        if self._micro_batcher is None:
+            with self._micro_batcher_lock:
+                # Un solo batcher aunque varios hilos lleguen a la vez
+                if self._micro_batcher is None:
+                    self._micro_batcher = MicroBatcher(
+                        self._predict_rows,
+                        max_batch_size=getattr(settings, 'ML_MICROBATCH_MAX_SIZE', 32),
+                        max_wait_ms=getattr(settings, 'ML_MICROBATCH_MAX_WAIT_MS', 2.0),
+                        name='cardiovascular_predictor',
+                    )
+        return self._micro_batcher
+
+    def _build_feature_matrix(self, features_list: List[Dict[str, float]]) -> 'pd.DataFrame':
+        """Construir la matriz N×F de features en el orden esperado por el modelo"""
+        # Valor por defecto 0.0 si falta alguna feature
+        X = np.array(
+            [[features.get(feature_name, 0.0) for feature_name in self.feature_names]
+             for features in features_list],
+            dtype=np.float64
+        )
+        # DataFrame con nombres de features para compatibilidad con scaler.
+        # pandas se importa aquí para no cargarlo en procesos que no predicen
+        import pandas as pd
+        return pd.DataFrame(X, columns=self.feature_names)
+
+    def _predict_probabilities(self, features_list: List[Dict[str, float]]) -> Tuple[np.ndarray, np.ndarray, Optional[str]]:
+        """
+        Una sola llamada a predict_proba para todo el lote; devuelve
+        (probabilidades, clases, versión del modelo usado)
+        """
+        # Modelo, scaler y versión de la misma carga aunque haya una recarga en curso
+        model, scaler, model_version = self.active_models()
 
-            # Convertir a DataFrame con nombres de features para compatibilidad con scaler
-            X_df = pd.DataFrame([feature_values], columns=self.feature_names)
+        with span('predictor.scaling'):
+            X_df = self._build_feature_matrix(features_list)
 
             # Aplicar scaler si existe
-            if self.scaler is not None:
-                X_scaled = self.scaler.transform(X_df)
+            if scaler is not None:
+                X_scaled = scaler.transform(X_df)
             else:
                 X_scaled = X_df.values
 
-            # Realizar predicción
-            prediction_proba = self.model.predict_proba(X_scaled)[0]
-            prediction = self.model.predict(X_scaled)[0]
-
-            # Mapear predicción numérica a nivel de riesgo
-            risk_levels = {0: 'BAJO', 1: 'MEDIO', 2: 'ALTO'}
-            risk_level = risk_levels.get(prediction, 'MEDIO')
+        # Una única predicción de probabilidades; las clases se derivan de ellas
+        with span('predictor.predict_proba'):
+            probabilities = model.predict_proba(X_scaled)
+        class_indices = np.argmax(probabilities, axis=1)
+        classes = getattr(model, 'classes_', None)
+        predictions = classes[class_indices] if classes is not None else class_indices
 
-            # Calcular probabilidad del riesgo predicho
-            risk_probability = prediction_proba[prediction] * 100
+        return probabilities, predictions, model_version
 
-            # Análisis de factores de riesgo
-            risk_factors = self._analyze_risk_factors_ml(features)
-
-            # Recomendaciones basadas en el riesgo
-            recommendations = self._generate_recommendations(risk_level, features)
-
-            return {
-                'riesgo_nivel': risk_level,
-                'probabilidad': round(risk_probability, 1),
-                'factores_riesgo': risk_factors,
-                'recomendaciones': recommendations,
-                'model_version': 'realistic_v1.0.0',
-                'confidence_score': round(max(prediction_proba), 3),
-                'features_used': features,
-                'prediction_probabilities': {
-                    'BAJO': round(prediction_proba[0] * 100, 1),
-                    'MEDIO': round(prediction_proba[1] * 100, 1),
-                    'ALTO': round(prediction_proba[2] * 100, 1)
-                }
-            }
+    def _predict_rows(self, features_list: List[Dict[str, float]]) -> List[Tuple[np.ndarray, Any, Optional[str]]]:
+        """Función de lote del micro-batcher: (probabilidades, clase, versión) por fila"""
+        probabilities, predictions, model_version = self._predict_probabilities(features_list)
+        return [(row, prediction, model_version) for row, prediction in zip(probabilities, predictions)]
 
+    def _ml_predictions_batch(self, features_list: List[Dict[str, float]], medical_records) -> List[Dict[str, Any]]:
+        """Predicción ML vectorizada: una sola llamada a predict_proba para todo el lote"""
+        try:
+            probabilities, predictions, model_version = self._predict_probabilities(features_list)
+        except Exception as e:
+            logger.error(f"Error en predicción ML: {e}")
+            # Fallback al sistema de reglas
+            return self._rule_based_predictions_batch(features_list, medical_records)
+
+        results: List[Dict[str, Any]] = [None] * len(features_list)
+        failed_indices = []
+        for index, (features, prediction_proba, prediction) in enumerate(
+            zip(features_list, probabilities, predictions)
+        ):
+            try:
+                results[index] = self._format_ml_result(features, prediction_proba, prediction, model_version)
+            except Exception as e:
+                logger.error(f"Error en predicción ML: {e}")
+                failed_indices.append(index)
+
+        # Fallback al sistema de reglas, evaluado en lote para los registros fallidos
+        if failed_indices:
+            fallback_results = self._rule_based_predictions_batch(
+                [features_list[index] for index in failed_indices],
+                [medical_records[index] for index in failed_indices],
+            )
+            for index, fallback_result in zip(failed_indices, fallback_results):
+                results[index] = fallback_result
+
+        return results
+
+    def _build_ml_result(self, features: Dict[str, float], prediction_proba, prediction, medical_record,
+                         model_version: Optional[str] = None) -> Dict[str, Any]:
+        """Post-procesamiento por registro de una predicción ML"""
+        try:
+            return self._format_ml_result(features, prediction_proba, prediction, model_version)
         except Exception as e:
             logger.error(f"Error en predicción ML: {e}")
             # Fallback al sistema de reglas
             return self._rule_based_prediction(features, medical_record)
 
-    def _rule_based_prediction(self, features: Dict[str, float], medical_record) -> Dict[str, Any]:
-        """Sistema de predicción basado en reglas médicas cuando ML falla"""
-        # Implementación básica de reglas médicas
-        risk_score = 0
-        risk_factors = []
-
-        # Evaluar factores de riesgo
-        if features['edad'] > 65:
-            risk_score += 25
-            risk_factors.append(f"Edad avanzada ({features['edad']:.0f} años)")
-        elif features['edad'] > 45:
-            risk_score += 15
-            risk_factors.append(f"Edad media ({features['edad']:.0f} años)")
-
-        if features['imc'] > 30:
-            risk_score += 20
-            risk_factors.append(f"Obesidad (IMC: {features['imc']:.1f})")
-        elif features['imc'] > 25:
-            risk_score += 10
-            risk_factors.append(f"Sobrepeso (IMC: {features['imc']:.1f})")
-
-        if features['presion_sistolica'] > 140 or features['presion_diastolica'] > 90:
-            risk_score += 25
-            risk_factors.append(f"Hipertensión ({features['presion_sistolica']:.0f}/{features['presion_diastolica']:.0f})")
-        elif features['presion_sistolica'] > 130 or features['presion_diastolica'] > 80:
-            risk_score += 15
-            risk_factors.append(f"Presión elevada ({features['presion_sistolica']:.0f}/{features['presion_diastolica']:.0f})")
+    def _format_ml_result(self, features: Dict[str, float], prediction_proba, prediction,
+                          model_version: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Formatea el resultado ML de un registro; lanza excepción si no es
+        posible. `model_version` es el hash del artefacto que hizo la predicción.
+        """
+        # Mapear predicción numérica a nivel de riesgo
+        risk_levels = {0: 'BAJO', 1: 'MEDIO', 2: 'ALTO'}
+        risk_level = risk_levels.get(prediction, 'MEDIO')
 
-        if features['colesterol'] > 240:
-            risk_score += 20
-            risk_factors.append(f"Colesterol alto ({features['colesterol']:.0f})")
-        elif features['colesterol'] > 200:
-            risk_score += 10
-            risk_factors.append(f"Colesterol borderline ({features['colesterol']:.0f})")
+        # Calcular probabilidad del riesgo predicho
+        risk_probability = prediction_proba[prediction] * 100
 
-        if features['glucosa'] > 126:
-            risk_score += 20
-            risk_factors.append(f"Glucosa elevada ({features['glucosa']:.0f})")
-        elif features['glucosa'] > 100:
-            risk_score += 10
-            risk_factors.append(f"Glucosa alterada ({features['glucosa']:.0f})")
-
-        if features['indice_paquetes'] > 10:
-            risk_score += 20
-            risk_factors.append(f"Tabaquismo intenso ({features['indice_paquetes']:.1f} paquetes/año)")
-        elif features['indice_paquetes'] > 0:
-            risk_score += 10
-            risk_factors.append(f"Tabaquismo ({features['indice_paquetes']:.1f} paquetes/año)")
-
-        if features['antecedentes_encoded'] > 0:
-            risk_score += 15
-            risk_factors.append("Antecedentes cardíacos familiares")
-
-        # Determinar nivel de riesgo
-        if risk_score >= 40:
-            risk_level = 'ALTO'
-            probability = 85.0
-        elif risk_score >= 20:
-            risk_level = 'MEDIO'
-            probability = 60.0
-        else:
-            risk_level = 'BAJO'
-            probability = 25.0
+        # Análisis de factores de riesgo
+        risk_factors = self._analyze_risk_factors_ml(features)
 
+        # Recomendaciones basadas en el riesgo
         recommendations = self._generate_recommendations(risk_level, features)
 
         return {
             'riesgo_nivel': risk_level,
-            'probabilidad': probability,
+            'probabilidad': round(risk_probability, 1),
             'factores_riesgo': risk_factors,
             'recomendaciones': recommendations,
-            'model_version': 'rules_fallback_v1.0.0',
-            'confidence_score': 0.7,
+            'model_version': model_version or 'realistic_v1.0.0',
+            'confidence_score': round(max(prediction_proba), 3),
             'features_used': features,
-            'scores_detallados': {'total_score': risk_score}
+            'prediction_probabilities': {
+                'BAJO': round(prediction_proba[0] * 100, 1),
+                'MEDIO': round(prediction_proba[1] * 100, 1),
+                'ALTO': round(prediction_proba[2] * 100, 1)
+            }
         }
 
-    def _analyze_risk_factors_ml(self, features: Dict[str, float]) -> List[str]:
-        """Analizar factores de riesgo para predicción ML"""
-        risk_factors = []
-
-        # Edad
-        if features['edad'] > 65:
-            risk_factors.append(f"Edad avanzada ({features['edad']:.0f} años)")
-        elif features['edad'] > 45:
-            risk_factors.append(f"Edad media ({features['edad']:.0f} años)")
-
-        # IMC
-        if features['imc'] > 30:
-            risk_factors.append(f"Obesidad (IMC: {features['imc']:.1f})")
-        elif features['imc'] > 25:
-            risk_factors.append(f"Sobrepeso (IMC: {features['imc']:.1f})")
-
-        # Presión arterial
-        if features['presion_sistolica'] > 140 or features['presion_diastolica'] > 90:
-            risk_factors.append(f"Hipertensión ({features['presion_sistolica']:.0f}/{features['presion_diastolica']:.0f} mmHg)")
-        elif features['presion_sistolica'] > 130 or features['presion_diastolica'] > 80:
-            risk_factors.append(f"Presión elevada ({features['presion_sistolica']:.0f}/{features['presion_diastolica']:.0f} mmHg)")
-
-        # Colesterol
-        if features['colesterol'] > 240:
-            risk_factors.append(f"Colesterol alto ({features['colesterol']:.0f} mg/dL)")
-        elif features['colesterol'] > 200:
-            risk_factors.append(f"Colesterol borderline ({features['colesterol']:.0f} mg/dL)")
-
-        # Glucosa
-        if features['glucosa'] > 126:
-            risk_factors.append(f"Glucosa elevada ({features['glucosa']:.0f} mg/dL)")
-        elif features['glucosa'] > 100:
-            risk_factors.append(f"Glucosa alterada ({features['glucosa']:.0f} mg/dL)")
-
-        # Tabaquismo
-        if features['indice_paquetes'] > 10:
-            risk_factors.append(f"Tabaquismo intenso ({features['indice_paquetes']:.1f} paquetes/año)")
-        elif features['indice_paquetes'] > 0:
-            risk_factors.append(f"Tabaquismo ({features['indice_paquetes']:.1f} paquetes/año)")
-
-        # Actividad física
-        if features['actividad_fisica_encoded'] < 1:
-            risk_factors.append("Sedentarismo")
+    def _rule_based_prediction(self, features: Dict[str, float], medical_record) -> Dict[str, Any]:
+        """Sistema de predicción basado en reglas médicas cuando ML falla"""
+        return self._rule_based_predictions_batch([features], [medical_record])[0]
 
-        # Antecedentes
-        if features['antecedentes_encoded'] > 0:
-            risk_factors.append("Antecedentes cardíacos familiares")
+    def _rule_based_predictions_batch(self, features_list: List[Dict[str, float]], medical_records) -> List[Dict[str, Any]]:
+        """
+        Reglas médicas evaluadas en una sola pasada vectorizada sobre el lote
+        (ver ml_models.rule_engine.FALLBACK_RULES). Los textos de factores se
+        generan solo al construir cada resultado y las recomendaciones salen
+        de la caché por (máscara, nivel).
+        """
+        evaluation = FALLBACK_RULES.evaluate_records(features_list)
+        recommendation_flags = PREDICTOR_RECOMMENDATIONS.flags.evaluate_records(features_list)
+
+        results = []
+        for index, features in enumerate(features_list):
+            level = evaluation.level(index)
+            results.append({
+                'riesgo_nivel': level.name,
+                'probabilidad': level.probability,
+                'factores_riesgo': evaluation.factors(index, features),
+                'recomendaciones': PREDICTOR_RECOMMENDATIONS.render(level.name, recommendation_flags.factor_mask(index)),
+                'model_version': 'rules_fallback_v1.0.0',
+                'confidence_score': 0.7,
+                'features_used': features,
+                'scores_detallados': {'total_score': int(evaluation.score(index))}
+            })
+        return results
 
-        return risk_factors
+    def _analyze_risk_factors_ml(self, features: Dict[str, float]) -> List[str]:
+        """Analizar factores de riesgo para predicción ML (ver ML_FACTOR_RULES)"""
+        return ML_FACTOR_RULES.render_factors(ML_FACTOR_RULES.evaluate_one(features)[2], features)
 
     def _generate_recommendations(self, risk_level: str, features: Dict[str, float]) -> List[str]:
-        """Generar recomendaciones basadas en el nivel de riesgo"""
-        recommendations = []
-
-        if risk_level == 'ALTO':
-            recommendations.extend([
-                "Consulta cardiológica inmediata",
-                "Exámenes cardíacos completos (ECG, ecocardiograma, pruebas de esfuerzo)",
-                "Control estricto de factores de riesgo",
-                "Posible inicio de tratamiento farmacológico"
-            ])
-        elif risk_level == 'MEDIO':
-            recommendations.extend([
-                "Consulta cardiológica en las próximas 4-6 semanas",
-                "Exámenes de laboratorio básicos",
-                "Modificación de estilo de vida",
-                "Seguimiento regular de presión arterial y colesterol"
-            ])
-        else:  # BAJO
-            recommendations.extend([
-                "Mantener controles médicos regulares",
-                "Estilo de vida saludable",
-                "Prevención primaria",
-                "Chequeos anuales"
-            ])
-
-        # Recomendaciones específicas basadas en factores de riesgo
-        if features['imc'] > 25:
-            recommendations.append("Control de peso y dieta saludable")
-        if features['presion_sistolica'] > 130:
-            recommendations.append("Control de presión arterial")
-        if features['colesterol'] > 200:
-            recommendations.append("Control de colesterol")
-        if features['indice_paquetes'] > 0:
-            recommendations.append("Dejar de fumar - programa de cesación tabáquica")
-        if features['actividad_fisica_encoded'] < 2:
-            recommendations.append("Aumentar actividad física (150 min/semana de ejercicio moderado)")
-
-        return recommendations
+        """Generar recomendaciones basadas en el nivel de riesgo (ver PREDICTOR_RECOMMENDATIONS)"""
+        return PREDICTOR_RECOMMENDATIONS.recommendations(risk_level, features)
+
+    def _clinical_scores(self, features_list: List[Dict[str, float]], medical_records) -> List[Dict[str, Any]]:
+        """Scores clínicos (Framingham, Reynolds, ACC/AHA, síndrome metabólico) del lote en una pasada"""
+        try:
+            columns = clinical_score_columns(feature_pipeline.score_rows(medical_records, features_list))
+            return calculate_clinical_scores(columns).records()
+        except Exception as e:
+            logger.error(f"Error calculando scores clínicos: {e}")
+            return [{} for _ in features_list]
 
     def _calculate_detailed_scores(self, features: Dict[str, float], medical_record) -> Dict[str, float]:
         """Calcular scores detallados para análisis adicional"""
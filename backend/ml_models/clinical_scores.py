@@ -0,0 +1,226 @@
+"""
+Scores clínicos vectorizados
+
+Versiones por arrays de los scores simplificados de Framingham, Reynolds,
+ACC/AHA y de los criterios de síndrome metabólico. Cada función recibe
+columnas (arrays de igual longitud) y devuelve un array con el score de
+cada registro, de modo que un registro, un lote o la cohorte completa de un
+hospital se calculan con las mismas operaciones NumPy.
+
+Los valores opcionales ausentes (HDL, triglicéridos) llegan como NaN: las
+comparaciones con NaN son falsas, así que no suman puntos ni cumplen
+criterios.
+"""
+
+from operator import itemgetter
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+# Columnas que necesitan los scores (features del predictor + datos del registro)
+SCORE_COLUMNS = (
+    'edad', 'sexo_encoded', 'imc', 'presion_sistolica', 'presion_diastolica',
+    'colesterol', 'colesterol_hdl', 'trigliceridos', 'glucosa', 'diabetes_encoded',
+    'indice_paquetes', 'antecedentes_encoded',
+)
+
+# Criterios de síndrome metabólico en el orden de sus bits
+METABOLIC_CRITERIA = (
+    "Obesidad abdominal",
+    "Triglicéridos elevados",
+    "HDL bajo",
+    "Hipertensión arterial",
+    "Glucosa alterada",
+)
+
+# Textos de criterios para cada máscara posible (2^5 combinaciones)
+_METABOLIC_CRITERIA_BY_MASK = [
+    [name for bit, name in enumerate(METABOLIC_CRITERIA) if mask >> bit & 1]
+    for mask in range(1 << len(METABOLIC_CRITERIA))
+]
+
+_METABOLIC_BITS = 1 << np.arange(len(METABOLIC_CRITERIA), dtype=np.int64)
+
+# Número de criterios cumplidos de cada máscara
+_METABOLIC_COUNT_BY_MASK = np.array([len(criteria) for criteria in _METABOLIC_CRITERIA_BY_MASK])
+
+MAX_SCORE = 30
+
+# Límites de los intervalos del histograma de la distribución de cohorte
+DISTRIBUTION_BINS = (0, 5, 10, 15, 20, 25, MAX_SCORE)
+
+
+def clinical_score_columns(rows: Sequence[Dict[str, float]]) -> Dict[str, np.ndarray]:
+    """
+    Construye las columnas de SCORE_COLUMNS a partir de filas con todas sus
+    claves (ver `FeaturePipeline.score_rows`).
+    """
+    getter = itemgetter(*SCORE_COLUMNS)
+    matrix = np.array([getter(row) for row in rows], dtype=np.float64).reshape(len(rows), len(SCORE_COLUMNS))
+    return {name: matrix[:, index] for index, name in enumerate(SCORE_COLUMNS)}
+
+
+def _step_points(values: np.ndarray, thresholds: np.ndarray, points: np.ndarray, side: str = 'right') -> np.ndarray:
+    """
+    Puntos del tramo en que cae cada valor (umbrales ascendentes). Con
+    side='right' un valor igual al umbral pasa al tramo siguiente (tramos
+    `< umbral`); con side='left' se queda en el anterior (tramos `<= umbral`).
+    Una sola búsqueda binaria vectorizada en lugar de np.select, cuyo coste
+    fijo domina cuando se evalúa un solo registro.
+    """
+    return points[np.searchsorted(thresholds, values, side=side)]
+
+
+# Tablas de puntos por tramos (umbrales ascendentes, un punto más que umbrales)
+FRAMINGHAM_AGE_THRESHOLDS = np.array([40, 50, 60, 70])
+FRAMINGHAM_AGE_POINTS_MEN = np.array([0, 2, 5, 8, 11])
+FRAMINGHAM_AGE_POINTS_WOMEN = np.array([0, 3, 6, 9, 12])
+FRAMINGHAM_CHOLESTEROL_THRESHOLDS = np.array([200, 240, 280])
+FRAMINGHAM_CHOLESTEROL_POINTS = np.array([0, 1, 2, 3])
+FRAMINGHAM_HDL_THRESHOLDS = np.array([35, 45])  # <35: 2 puntos, <45: 1 punto
+FRAMINGHAM_HDL_POINTS = np.array([2, 1, 0])
+FRAMINGHAM_SYSTOLIC_THRESHOLDS = np.array([130, 140, 160])
+FRAMINGHAM_SYSTOLIC_POINTS = np.array([0, 1, 2, 3])
+ACC_AHA_AGE_THRESHOLDS = np.array([45, 55, 65])
+ACC_AHA_AGE_POINTS = np.array([0, 5, 10, 15])
+
+
+def framingham_scores(edad, sexo_encoded, colesterol, colesterol_hdl, presion_sistolica,
+                      diabetes_encoded, indice_paquetes) -> np.ndarray:
+    """Framingham Risk Score simplificado (en porcentaje, máximo 30)"""
+    score = np.where(
+        sexo_encoded == 1,
+        _step_points(edad, FRAMINGHAM_AGE_THRESHOLDS, FRAMINGHAM_AGE_POINTS_MEN),
+        _step_points(edad, FRAMINGHAM_AGE_THRESHOLDS, FRAMINGHAM_AGE_POINTS_WOMEN),
+    )
+    score = score + _step_points(colesterol, FRAMINGHAM_CHOLESTEROL_THRESHOLDS, FRAMINGHAM_CHOLESTEROL_POINTS)
+    # HDL ausente (NaN) queda al final del orden de búsqueda: 0 puntos
+    score = score + _step_points(colesterol_hdl, FRAMINGHAM_HDL_THRESHOLDS, FRAMINGHAM_HDL_POINTS)
+    score = score + _step_points(presion_sistolica, FRAMINGHAM_SYSTOLIC_THRESHOLDS, FRAMINGHAM_SYSTOLIC_POINTS)
+    score = score + 2 * (diabetes_encoded != 0) + 2 * (indice_paquetes > 0)
+    return np.minimum(score * 2, MAX_SCORE)
+
+
+def reynolds_scores(framingham, antecedentes_encoded, imc) -> np.ndarray:
+    """Reynolds Risk Score simplificado a partir del Framingham ya calculado"""
+    score = framingham * np.where(antecedentes_encoded == 1, 1.2, 1.0)
+    score = score * np.where(imc >= 30, 1.1, 1.0)
+    return np.minimum(score, MAX_SCORE)
+
+
+def acc_aha_scores(edad, presion_sistolica, colesterol, diabetes_encoded, indice_paquetes) -> np.ndarray:
+    """ACC/AHA Risk Score simplificado (máximo 30)"""
+    score = _step_points(edad, ACC_AHA_AGE_THRESHOLDS, ACC_AHA_AGE_POINTS)
+    score = score + 10 * (presion_sistolica >= 140) + 8 * (colesterol >= 240)
+    score = score + 12 * (diabetes_encoded != 0) + 8 * (indice_paquetes > 10)
+    return np.minimum(score, MAX_SCORE)
+
+
+def metabolic_syndrome_masks(imc, trigliceridos, colesterol_hdl, sexo_encoded, presion_sistolica,
+                             presion_diastolica, glucosa) -> np.ndarray:
+    """Máscara de criterios de síndrome metabólico cumplidos (bits en el orden de METABOLIC_CRITERIA)"""
+    hdl_low = np.where(sexo_encoded != 0, colesterol_hdl < 40, colesterol_hdl < 50)
+    criteria = (
+        imc >= 30,  # Aproximación de obesidad abdominal con IMC
+        trigliceridos >= 150,
+        hdl_low,
+        (presion_sistolica >= 130) | (presion_diastolica >= 85),
+        glucosa >= 100,
+    )
+    return np.column_stack(criteria) @ _METABOLIC_BITS
+
+
+def _metabolic_risk(criteria_met: int) -> str:
+    return "Alto" if criteria_met >= 3 else "Moderado" if criteria_met >= 2 else "Bajo"
+
+
+class ClinicalScores:
+    """Scores clínicos de un conjunto de registros como arrays alineados"""
+
+    def __init__(self, framingham: np.ndarray, reynolds: np.ndarray, acc_aha: np.ndarray,
+                 metabolic_masks: np.ndarray):
+        self.framingham = framingham
+        self.reynolds = reynolds
+        self.acc_aha = acc_aha
+        self.metabolic_masks = metabolic_masks
+        self.metabolic_counts = _METABOLIC_COUNT_BY_MASK[metabolic_masks]
+
+    def __len__(self) -> int:
+        return len(self.framingham)
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Scores por registro con el formato de `scores_detallados`"""
+        results = []
+        for framingham, reynolds, acc_aha, mask, criteria_met in zip(
+            self.framingham.tolist(), self.reynolds.tolist(), self.acc_aha.tolist(),
+            self.metabolic_masks.tolist(), self.metabolic_counts.tolist(),
+        ):
+            results.append({
+                'framingham_score': framingham,
+                'reynolds_score': reynolds,
+                'acc_aha_score': acc_aha,
+                'metabolic_syndrome': {
+                    'tiene_sindrome': criteria_met >= 3,
+                    'criterios_cumplidos': criteria_met,
+                    'criterios': list(_METABOLIC_CRITERIA_BY_MASK[mask]),
+                    'riesgo': _metabolic_risk(criteria_met),
+                },
+            })
+        return results
+
+    def distribution(self) -> Dict[str, Any]:
+        """Resumen de la distribución de scores de la cohorte"""
+        def summary(values: np.ndarray) -> Dict[str, Any]:
+            if not len(values):
+                return {'media': 0.0, 'percentiles': {}, 'histograma': []}
+            percentiles = np.percentile(values, [25, 50, 75, 90])
+            counts, edges = np.histogram(values, bins=DISTRIBUTION_BINS)
+            return {
+                'media': round(float(values.mean()), 2),
+                'percentiles': {
+                    f'p{p}': round(float(v), 2) for p, v in zip((25, 50, 75, 90), percentiles)
+                },
+                'histograma': [
+                    {'desde': int(edges[i]), 'hasta': int(edges[i + 1]), 'pacientes': int(counts[i])}
+                    for i in range(len(counts))
+                ],
+            }
+
+        counts = self.metabolic_counts
+        return {
+            'framingham_score': summary(self.framingham),
+            'reynolds_score': summary(self.reynolds),
+            'acc_aha_score': summary(self.acc_aha),
+            'metabolic_syndrome': {
+                'con_sindrome': int((counts >= 3).sum()),
+                'riesgo': {
+                    'Alto': int((counts >= 3).sum()),
+                    'Moderado': int((counts == 2).sum()),
+                    'Bajo': int((counts < 2).sum()),
+                },
+                'criterios': {
+                    name: int(((self.metabolic_masks >> bit) & 1).sum())
+                    for bit, name in enumerate(METABOLIC_CRITERIA)
+                },
+            },
+        }
+
+
+def calculate_clinical_scores(columns: Dict[str, np.ndarray]) -> ClinicalScores:
+    """Calcula los cuatro scores para todas las filas de `columns` (ver SCORE_COLUMNS)"""
+    framingham = framingham_scores(
+        columns['edad'], columns['sexo_encoded'], columns['colesterol'], columns['colesterol_hdl'],
+        columns['presion_sistolica'], columns['diabetes_encoded'], columns['indice_paquetes'],
+    )
+    return ClinicalScores(
+        framingham=framingham,
+        reynolds=reynolds_scores(framingham, columns['antecedentes_encoded'], columns['imc']),
+        acc_aha=acc_aha_scores(
+            columns['edad'], columns['presion_sistolica'], columns['colesterol'],
+            columns['diabetes_encoded'], columns['indice_paquetes'],
+        ),
+        metabolic_masks=metabolic_syndrome_masks(
+            columns['imc'], columns['trigliceridos'], columns['colesterol_hdl'], columns['sexo_encoded'],
+            columns['presion_sistolica'], columns['presion_diastolica'], columns['glucosa'],
+        ),
+    )
@@ -0,0 +1,347 @@
+"""
+Pipeline único de features cardiovasculares
+
+Edad, IMC, índice paquetes/año y las codificaciones categóricas se derivan
+una sola vez por registro médico (etapa `registro`) y de ahí salen las
+features del modelo, las de las reglas, las de los scores clínicos y
+`features_used`. Cada consumidor aplica su propio perfil (valores por
+defecto, codificación de antecedentes, redondeo), declarado en
+FeatureProfile en lugar de repetido en cada `_extract_features` /
+`_prepare_features`.
+
+Las etapas se cachean por `MedicalRecord.id`, el `updated_at` del registro
+y de su paciente (y el día, porque la edad depende de la fecha) en un LRU
+acotado por proceso. Las versiones en la clave detectan cambios hechos en
+otros workers, donde las señales de este proceso no llegan; guardar o
+borrar un registro o su paciente además libera sus entradas locales. Un
+`QuerySet.update()` no toca `auto_now`: debe actualizar `updated_at`
+explícitamente. Los registros simulados sin `id` (predict_from_data) se
+calculan siempre.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import date
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Orden de las features del modelo (y de `features_used`)
+MODEL_FEATURES = (
+    'edad', 'imc', 'presion_sistolica', 'presion_diastolica', 'colesterol', 'glucosa',
+    'indice_paquetes', 'actividad_fisica_encoded', 'sexo_encoded', 'antecedentes_encoded',
+)
+
+# Datos opcionales del registro que solo usan los scores clínicos
+CLINICAL_FEATURES = ('colesterol_hdl', 'trigliceridos', 'diabetes_encoded')
+
+ACTIVIDAD_CODES = {'sedentario': 0, 'ligero': 1, 'moderado': 2, 'intenso': 3}
+
+# Entradas máximas del caché de etapas por proceso
+FEATURE_CACHE_SIZE = 4096
+
+
+def _edad(record, patient) -> Optional[int]:
+    fecha_nacimiento = patient.fecha_nacimiento
+    if not fecha_nacimiento:
+        return None
+    today = date.today()
+    return today.year - fecha_nacimiento.year - (
+        (today.month, today.day) < (fecha_nacimiento.month, fecha_nacimiento.day)
+    )
+
+
+def _imc(record, patient) -> Optional[float]:
+    """IMC sin redondear; los pacientes simulados solo traen `imc`"""
+    peso = getattr(patient, 'peso', None)
+    altura = getattr(patient, 'altura', None)
+    if peso and altura and altura > 0:
+        return peso / ((altura / 100) ** 2)
+    return getattr(patient, 'imc', None)
+
+
+def _indice_paquetes(record, patient) -> float:
+    """Índice paquetes/año sin redondear"""
+    cigarrillos = getattr(record, 'cigarrillos_dia', None)
+    if cigarrillos is None:
+        return getattr(record, 'indice_paquetes_ano', None) or 0.0
+    anos = record.anos_tabaquismo
+    if cigarrillos > 0 and anos and anos > 0:
+        return (cigarrillos / 20) * anos
+    return 0.0
+
+
+def _colesterol(record, patient):
+    # Los registros simulados de predict_from_data usan `colesterol_total`
+    value = getattr(record, 'colesterol', None)
+    return value if value is not None else getattr(record, 'colesterol_total', None)
+
+
+def _attribute(name: str, default=None) -> Callable:
+    def getter(record, patient):
+        return getattr(record, name, default)
+    return getter
+
+
+def _optional_float(name: str) -> Callable:
+    def getter(record, patient):
+        value = getattr(record, name, None)
+        return np.nan if value is None else float(value)
+    return getter
+
+
+# Etapa `registro`: valores derivados una sola vez por registro médico
+RECORD_STAGE: Tuple[Tuple[str, Callable], ...] = (
+    ('edad', _edad),
+    ('imc', _imc),
+    ('indice_paquetes', _indice_paquetes),
+    ('presion_sistolica', _attribute('presion_sistolica')),
+    ('presion_diastolica', _attribute('presion_diastolica')),
+    ('colesterol', _colesterol),
+    ('glucosa', _attribute('glucosa')),
+    ('actividad_fisica', _attribute('actividad_fisica')),
+    ('antecedentes_cardiacos', _attribute('antecedentes_cardiacos')),
+    ('sexo_encoded', lambda record, patient: 1.0 if patient.sexo == 'M' else 0.0),
+    ('colesterol_hdl', _optional_float('colesterol_hdl')),
+    ('trigliceridos', _optional_float('trigliceridos')),
+    ('diabetes_encoded', lambda record, patient: 1.0 if getattr(record, 'diabetes', False) else 0.0),
+)
+
+
+@dataclass(frozen=True)
+class FeatureProfile:
+    """
+    Cómo presenta las features un consumidor. `defaults` sustituye los
+    valores ausentes o cero (la edad solo cuando falta la fecha de
+    nacimiento); `decimals` redondea IMC e índice paquetes/año como las
+    propiedades del modelo.
+    """
+
+    name: str
+    defaults: Mapping[str, float]
+    antecedentes_codes: Mapping[str, float]
+    actividad_default: float
+    decimals: Optional[int] = None
+    actividad_codes: Mapping[str, float] = field(default_factory=lambda: ACTIVIDAD_CODES)
+
+    def encode(self, values: Dict[str, Any]) -> Dict[str, float]:
+        defaults = self.defaults
+        edad = values['edad']
+        imc = values['imc']
+        indice_paquetes = values['indice_paquetes']
+        if self.decimals is not None:
+            imc = round(imc, self.decimals) if imc is not None else None
+            indice_paquetes = round(indice_paquetes, self.decimals)
+
+        def value(name, raw):
+            if not raw and name in defaults:
+                raw = defaults[name]
+            return float(raw) if raw is not None else np.nan
+
+        return {
+            'edad': float(edad if edad is not None else defaults.get('edad', np.nan)),
+            'imc': value('imc', imc),
+            'presion_sistolica': value('presion_sistolica', values['presion_sistolica']),
+            'presion_diastolica': value('presion_diastolica', values['presion_diastolica']),
+            'colesterol': value('colesterol', values['colesterol']),
+            'glucosa': value('glucosa', values['glucosa']),
+            'indice_paquetes': float(indice_paquetes),
+            'actividad_fisica_encoded': float(
+                self.actividad_codes.get(values['actividad_fisica'], self.actividad_default)
+            ),
+            'sexo_encoded': values['sexo_encoded'],
+            'antecedentes_encoded': float(self.antecedentes_codes.get(values['antecedentes_cardiacos'], 0)),
+        }
+
+
+# Predictor en producción (reglas, modelo reentrenado y `features_used`)
+PREDICTOR_PROFILE = FeatureProfile(
+    name='predictor',
+    defaults={'edad': 30, 'imc': 25.0, 'presion_sistolica': 120, 'presion_diastolica': 80,
+              'colesterol': 200, 'glucosa': 100},
+    antecedentes_codes={'si': 1, 'no': 0, 'desconoce': 0},
+    actividad_default=1,
+    decimals=2,
+)
+
+# Codificación del entrenamiento original (CardiovascularMLService)
+ML_SERVICE_PROFILE = FeatureProfile(
+    name='ml_service',
+    defaults={'edad': 0, 'colesterol': 200, 'glucosa': 100},
+    antecedentes_codes={'si': 1, 'no': 0, 'desconoce': 0.5},
+    actividad_default=0,
+)
+
+# PredictionService: misma codificación con los valores seguros del validador
+SERVICE_PROFILE = FeatureProfile(
+    name='service',
+    defaults={'edad': 0, 'imc': 25.0, 'colesterol': 180, 'glucosa': 100},
+    antecedentes_codes={'si': 1, 'no': 0, 'desconoce': 0.5},
+    actividad_default=0,
+)
+
+# PredictionService._prepare_features (sin validación): ausentes a 0, como siempre
+RAW_SERVICE_PROFILE = FeatureProfile(
+    name='service_raw',
+    defaults={'edad': 0, 'imc': 0, 'colesterol': 0, 'glucosa': 0},
+    antecedentes_codes={'si': 1, 'no': 0, 'desconoce': 0.5},
+    actividad_default=0,
+)
+
+
+class FeaturePipeline:
+    """Etapas de features con caché por registro médico"""
+
+    def __init__(self, stage: Sequence[Tuple[str, Callable]] = RECORD_STAGE, cache_size: int = FEATURE_CACHE_SIZE):
+        self.stage = tuple(stage)
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[tuple, Any]' = OrderedDict()
+        self._keys_by_record: Dict[Any, set] = {}
+        self._records_by_patient: Dict[Any, set] = {}
+        self._patient_by_record: Dict[Any, Any] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # --- caché ---------------------------------------------------------------
+
+    def _cached(self, stage_name: str, record, compute: Callable[[], Any]) -> Any:
+        record_id = getattr(record, 'id', None)
+        if record_id is None:
+            return compute()
+
+        # El paciente ya viene cargado en los consumidores (select_related o
+        # registro construido con su paciente) y la etapa lo necesita igualmente
+        patient = getattr(record, 'patient', None)
+        key = (
+            stage_name, record_id, getattr(record, 'updated_at', None),
+            getattr(patient, 'updated_at', None), date.today().toordinal(),
+        )
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._cache[key] = value
+            self._keys_by_record.setdefault(record_id, set()).add(key)
+            patient_id = getattr(record, 'patient_id', None)
+            if patient_id is not None:
+                self._records_by_patient.setdefault(patient_id, set()).add(record_id)
+                self._patient_by_record[record_id] = patient_id
+            while len(self._cache) > self.cache_size:
+                old_key, _ = self._cache.popitem(last=False)
+                keys = self._keys_by_record.get(old_key[1])
+                if keys is not None:
+                    keys.discard(old_key)
+                    if not keys:
+                        self._forget_record(old_key[1])
+        return value
+
+    def _forget_record(self, record_id):
+        """Quita un registro de los índices (con el lock tomado)"""
+        self._keys_by_record.pop(record_id, None)
+        patient_id = self._patient_by_record.pop(record_id, None)
+        records = self._records_by_patient.get(patient_id)
+        if records is not None:
+            records.discard(record_id)
+            if not records:
+                del self._records_by_patient[patient_id]
+
+    def invalidate(self, record_id=None, patient_id=None):
+        """Descarta las etapas de un registro o de todos los registros de un paciente"""
+        with self._lock:
+            record_ids = set(self._records_by_patient.get(patient_id, ())) if patient_id is not None else set()
+            if record_id is not None:
+                record_ids.add(record_id)
+            for rid in record_ids:
+                for key in self._keys_by_record.get(rid, ()):
+                    self._cache.pop(key, None)
+                self._forget_record(rid)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._keys_by_record.clear()
+            self._records_by_patient.clear()
+            self._patient_by_record.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._cache),
+                'max_entries': self.cache_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            }
+
+    # --- etapas --------------------------------------------------------------
+
+    def record_values(self, medical_record) -> Dict[str, Any]:
+        """Etapa `registro`: valores derivados una vez por registro (no modificar)"""
+        def compute():
+            patient = medical_record.patient
+            return {name: derive(medical_record, patient) for name, derive in self.stage}
+        return self._cached('registro', medical_record, compute)
+
+    def features(self, medical_record, profile: FeatureProfile = PREDICTOR_PROFILE) -> Dict[str, float]:
+        """Features del modelo (MODEL_FEATURES) con el perfil del consumidor"""
+        features = self._cached(
+            profile.name, medical_record, lambda: profile.encode(self.record_values(medical_record))
+        )
+        # Copia: el dict acaba en `features_used` y los consumidores pueden modificarlo
+        return dict(features)
+
+    def features_many(self, medical_records: Iterable, profile: FeatureProfile = PREDICTOR_PROFILE) -> List[Dict[str, float]]:
+        return [self.features(record, profile) for record in medical_records]
+
+    def vector(self, medical_record, profile: FeatureProfile = SERVICE_PROFILE, dtype=np.float32) -> np.ndarray:
+        """Features en el orden de MODEL_FEATURES como array"""
+        return np.array(_model_getter(self.features(medical_record, profile)), dtype=dtype)
+
+    def score_rows(self, medical_records: Sequence, features_list: Sequence[Dict[str, float]]) -> List[Dict[str, float]]:
+        """Filas para los scores clínicos: features del modelo más HDL, triglicéridos y diabetes"""
+        rows = []
+        for record, features in zip(medical_records, features_list):
+            values = self.record_values(record)
+            row = dict(features)
+            row.update(zip(CLINICAL_FEATURES, _clinical_getter(values)))
+            rows.append(row)
+        return rows
+
+
+_model_getter = itemgetter(*MODEL_FEATURES)
+_clinical_getter = itemgetter(*CLINICAL_FEATURES)
+
+# Pipeline compartido por proceso
+feature_pipeline = FeaturePipeline()
+
+
+def _invalidate_record(sender, instance, **kwargs):
+    feature_pipeline.invalidate(record_id=instance.pk)
+
+
+def _invalidate_patient(sender, instance, **kwargs):
+    feature_pipeline.invalidate(patient_id=instance.pk)
+
+
+def connect_invalidation_signals():
+    """
+    Invalida el caché al guardar o borrar registros médicos y pacientes.
+    Se llama desde PredictionsConfig.ready()
+    """
+    from django.db.models.signals import post_delete, post_save
+
+    for signal in (post_save, post_delete):
+        signal.connect(_invalidate_record, sender='patients.MedicalRecord',
+                       dispatch_uid=f'feature_pipeline_record_{signal is post_save}')
+        signal.connect(_invalidate_patient, sender='patients.Patient',
+                       dispatch_uid=f'feature_pipeline_patient_{signal is post_save}')
+
@@ -0,0 +1,192 @@
+"""
+Formato de artefactos en arrays planos para el pipeline XGBoost
+
+`pipeline.joblib` se deserializa de forma privada en cada worker. Este módulo
+exporta sus arrays numéricos (vectores del scaler y tablas de nodos de los
+árboles) a un directorio de archivos `.npy` más un `manifest.json`, y los
+vuelve a abrir con `np.load(mmap_mode='r')`. Al ser mapeos de solo lectura
+del mismo archivo, todos los workers comparten las mismas páginas físicas
+(page cache) en lugar de tener una copia cada uno.
+
+Estructura del directorio:
+    manifest.json          metadatos, orden de features y lista de arrays
+    scaler_mean.npy        float64 (F,)
+    scaler_scale.npy       float64 (F,)
+    tree_offsets.npy       int32   (T,)  índice del nodo raíz de cada árbol
+    node_feature.npy       int32   (N,)  feature de la división (-1 en hojas)
+    node_threshold.npy     float32 (N,)  umbral (x < umbral -> izquierda)
+    node_left.npy          int32   (N,)  hijo izquierdo global (-1 en hojas)
+    node_right.npy         int32   (N,)  hijo derecho global (-1 en hojas)
+    node_default_left.npy  bool    (N,)  dirección para valores faltantes
+    node_value.npy         float32 (N,)  valor de la hoja (0 en nodos internos)
+"""
+
+import json
+import logging
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger('cardiovascular')
+
+FLAT_FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+ARRAY_NAMES = [
+    'scaler_mean', 'scaler_scale', 'tree_offsets',
+    'node_feature', 'node_threshold', 'node_left', 'node_right',
+    'node_default_left', 'node_value',
+]
+
+
+@dataclass
+class FlatPipelineArtifact:
+    """Pipeline XGBoost exportado a arrays planos (memory-mapped al cargarse)"""
+    manifest: Dict[str, Any]
+    arrays: Dict[str, np.ndarray]
+
+    @property
+    def feature_names(self) -> List[str]:
+        return self.manifest['feature_names']
+
+    @property
+    def base_margin(self) -> float:
+        return self.manifest['base_margin']
+
+    @property
+    def n_trees(self) -> int:
+        return self.manifest['n_trees']
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+
+def is_flat_artifact(path) -> bool:
+    """Indica si la ruta es un directorio de artefacto plano"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST_NAME))
+
+
+def export_pipeline(pipeline, output_dir, source_version: str = None) -> Dict[str, Any]:
+    """
+    Exporta un Pipeline(ColumnTransformer(StandardScaler) -> XGBClassifier)
+    a arrays planos. Devuelve el manifest escrito.
+    """
+    preprocessor, model = pipeline.steps[0][1], pipeline.steps[-1][1]
+
+    # Scaler y orden de features desde el ColumnTransformer
+    transformers = [t for t in preprocessor.transformers_ if t[0] != 'remainder']
+    if len(transformers) != 1:
+        raise ValueError("Solo se soporta un ColumnTransformer con un único StandardScaler")
+    _, scaler, feature_names = transformers[0]
+    feature_names = list(feature_names)
+
+    scaler_mean = np.asarray(scaler.mean_ if scaler.with_mean else np.zeros(len(feature_names)),
+                             dtype=np.float64)
+    scaler_scale = np.asarray(scaler.scale_ if scaler.with_std else np.ones(len(feature_names)),
+                              dtype=np.float64)
+
+    # Árboles desde el JSON exacto del booster (sin pérdida de precisión)
+    booster = model.get_booster()
+    learner = json.loads(bytes(booster.save_raw('json')))['learner']
+
+    objective = learner['objective']['name']
+    if objective != 'binary:logistic':
+        raise ValueError(f"Objetivo no soportado para exportación plana: {objective}")
+
+    base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+    base_margin = math.log(base_score / (1.0 - base_score))
+
+    trees = learner['gradient_booster']['model']['trees']
+    tree_offsets, feature, threshold, left, right, default_left, value = [], [], [], [], [], [], []
+    max_depth = 0
+
+    offset = 0
+    for tree in trees:
+        if any(tree.get('split_type', [])):
+            raise ValueError("Las divisiones categóricas no están soportadas")
+
+        left_children = np.asarray(tree['left_children'], dtype=np.int32)
+        right_children = np.asarray(tree['right_children'], dtype=np.int32)
+        is_leaf = left_children == -1
+
+        tree_offsets.append(offset)
+        feature.append(np.where(is_leaf, -1, np.asarray(tree['split_indices'], dtype=np.int32)))
+        conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+        threshold.append(np.where(is_leaf, np.float32(0.0), conditions))
+        left.append(np.where(is_leaf, -1, left_children + offset))
+        right.append(np.where(is_leaf, -1, right_children + offset))
+        default_left.append(np.asarray(tree['default_left'], dtype=bool))
+        # En hojas, XGBoost guarda el valor de la hoja en split_conditions
+        value.append(np.where(is_leaf, conditions, np.float32(0.0)))
+
+        max_depth = max(max_depth, _tree_depth(left_children, right_children))
+        offset += len(left_children)
+
+    arrays = {
+        'scaler_mean': scaler_mean,
+        'scaler_scale': scaler_scale,
+        'tree_offsets': np.asarray(tree_offsets, dtype=np.int32),
+        'node_feature': np.concatenate(feature).astype(np.int32),
+        'node_threshold': np.concatenate(threshold).astype(np.float32),
+        'node_left': np.concatenate(left).astype(np.int32),
+        'node_right': np.concatenate(right).astype(np.int32),
+        'node_default_left': np.concatenate(default_left).astype(bool),
+        'node_value': np.concatenate(value).astype(np.float32),
+    }
+
+    manifest = {
+        'format_version': FLAT_FORMAT_VERSION,
+        'source_version': source_version,
+        'objective': objective,
+        'feature_names': feature_names,
+        'base_margin': base_margin,
+        'n_trees': len(trees),
+        'n_nodes': offset,
+        'max_depth': max_depth,
+        'arrays': {name: {'dtype': str(array.dtype), 'shape': list(array.shape)}
+                   for name, array in arrays.items()},
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(output_dir, f'{name}.npy'), np.ascontiguousarray(array))
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    logger.info(f"Pipeline exportado a arrays planos: {output_dir} "
+                f"({len(trees)} árboles, {offset} nodos)")
+    return manifest
+
+
+def load_flat_artifact(path, mmap_mode: str = 'r') -> FlatPipelineArtifact:
+    """Abre un artefacto plano; con mmap_mode='r' los arrays no se copian al heap"""
+    with open(os.path.join(path, MANIFEST_NAME)) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if manifest.get('format_version') != FLAT_FORMAT_VERSION:
+        raise ValueError(f"Versión de formato plano no soportada: {manifest.get('format_version')}")
+
+    arrays = {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+        for name in ARRAY_NAMES
+    }
+    return FlatPipelineArtifact(manifest=manifest, arrays=arrays)
+
+
+def _tree_depth(left_children: np.ndarray, right_children: np.ndarray) -> int:
+    """Profundidad máxima de un árbol dado por sus arrays de hijos"""
+    depth = 0
+    level = [0]
+    while level:
+        next_level = []
+        for node in level:
+            if left_children[node] != -1:
+                next_level.extend((left_children[node], right_children[node]))
+        if next_level:
+            depth += 1
+        level = next_level
+    return depth
@@ -0,0 +1,172 @@
+"""
+Recarga en caliente de artefactos de ML coordinada entre workers
+
+Publicar un artefacto (`publish_artifact`, comando `publish_model`):
+  1. se guarda una copia inmutable en `ML_MODELS_PATH/versions/<nombre>/<hash>`
+     (historial para volver a una versión anterior)
+  2. se sustituye el archivo canónico con `os.replace`, atómico en el mismo
+     sistema de archivos: ningún worker lee un archivo a medio escribir
+  3. se registra la versión en la caché compartida (Redis), una clave por
+     artefacto (PUBLISHED_VERSION_KEY)
+
+Cada worker consulta las versiones como mucho una vez cada
+ML_MODEL_RELOAD_INTERVAL segundos: gunicorn desde ModelReloadMiddleware (en
+un hilo de fondo, `schedule()`) y Celery antes de cada tarea de predicción
+(`maybe_reload()`). Según ML_MODEL_RELOAD_MODE:
+  - 'redis': compara las versiones publicadas con las cargadas y recarga las
+    distintas (solo si el archivo en disco ya tiene esa versión)
+  - 'file':  vigila mtime/tamaño de los artefactos cargados (desarrollo)
+  - 'off':   sin recarga
+
+Los consumidores sustituyen (modelo, scaler, versión) de una vez
+(LazyModelsMixin.swap_models): las peticiones en curso terminan con el
+modelo anterior y las siguientes usan el nuevo, sin reiniciar el worker.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ml_models.registry import model_registry, reload_changed_models
+
+logger = logging.getLogger('cardiovascular')
+
+PUBLISHED_VERSION_KEY = 'ml_models:version:{name}'
+VERSIONS_DIRNAME = 'versions'
+
+RELOAD_MODES = ('off', 'file', 'redis')
+
+
+def versions_dir(name: str) -> str:
+    return os.path.join(str(settings.ML_MODELS_PATH), VERSIONS_DIRNAME, name)
+
+
+def get_published_versions(names: List[str]) -> Optional[Dict[str, str]]:
+    """Versiones publicadas de los artefactos `names` (None si la caché no responde)"""
+    keys = {PUBLISHED_VERSION_KEY.format(name=name): name for name in names}
+    try:
+        found = cache.get_many(list(keys))
+    except Exception as e:
+        logger.warning(f"No se pudieron leer las versiones publicadas de modelos: {e}")
+        return None
+    return {keys[key]: version for key, version in found.items()}
+
+
+def publish_artifact(source: str, name: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Publica `source` como el artefacto `name` (por defecto, su nombre de
+    archivo) en ML_MODELS_PATH. Devuelve (ruta canónica, versión).
+    """
+    source = os.path.abspath(source)
+    name = name or os.path.basename(source)
+    if os.path.isdir(source):
+        raise ValueError("Solo se publican artefactos de un archivo (.joblib/.pkl)")
+
+    version = model_registry.version_of(source)
+    target = os.path.join(str(settings.ML_MODELS_PATH), name)
+
+    # Copia inmutable por versión
+    archive_dir = os.path.join(versions_dir(name), version)
+    archived = os.path.join(archive_dir, name)
+    if not os.path.exists(archived):
+        os.makedirs(archive_dir, exist_ok=True)
+        shutil.copy2(source, archived)
+
+    # Sustitución atómica del archivo canónico
+    if os.path.abspath(target) != source:
+        descriptor, temporary = tempfile.mkstemp(prefix=f'.{name}.', dir=os.path.dirname(target))
+        os.close(descriptor)
+        try:
+            shutil.copy2(archived, temporary)
+            os.replace(temporary, target)
+        except Exception:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    cache.set(PUBLISHED_VERSION_KEY.format(name=name), version, timeout=None)
+
+    logger.info(f"Artefacto publicado: {name} versión {version}")
+    return target, version
+
+
+def list_versions(name: str) -> List[str]:
+    """Versiones archivadas de un artefacto, de la más reciente a la más antigua"""
+    directory = versions_dir(name)
+    if not os.path.isdir(directory):
+        return []
+    entries = [entry for entry in os.scandir(directory) if entry.is_dir()]
+    return [entry.name for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime, reverse=True)]
+
+
+class ModelReloadWatcher:
+    """Comprobación periódica y barata de versiones nuevas de los artefactos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self.reloads = 0
+        self.last_reload_at: Optional[float] = None
+
+    @property
+    def mode(self) -> str:
+        mode = getattr(settings, 'ML_MODEL_RELOAD_MODE', 'off') or 'off'
+        return mode if mode in RELOAD_MODES else 'off'
+
+    def due(self) -> bool:
+        interval = getattr(settings, 'ML_MODEL_RELOAD_INTERVAL', 5.0)
+        return self.mode != 'off' and time.monotonic() - self._last_check >= interval
+
+    def schedule(self) -> bool:
+        """
+        Lanza la comprobación en un hilo de fondo si toca: la petición que la
+        dispara no espera a la deserialización del artefacto nuevo.
+        """
+        if not self.due() or self._lock.locked():
+            return False
+        threading.Thread(target=self.maybe_reload, name='ml-model-reload', daemon=True).start()
+        return True
+
+    def maybe_reload(self, force: bool = False) -> List[str]:
+        """
+        Recarga los artefactos con versión nueva. Solo un hilo comprueba a la
+        vez; el resto sigue atendiendo peticiones con los modelos actuales.
+        """
+        mode = self.mode
+        if mode == 'off' or not (force or self.due()):
+            return []
+        if not self._lock.acquire(blocking=False):
+            return []
+
+        try:
+            self._last_check = time.monotonic()
+            published = None
+            if mode == 'redis':
+                names = [os.path.basename(handle.path) for handle in model_registry.current_handles()]
+                published = get_published_versions(names)
+                if not published:
+                    return []
+            changed = reload_changed_models(published)
+        except Exception as e:
+            logger.error(f"Error comprobando versiones de modelos: {e}")
+            return []
+        finally:
+            self._lock.release()
+
+        if changed:
+            self.reloads += 1
+            self.last_reload_at = time.time()
+            logger.info(f"Modelos recargados en caliente (pid {os.getpid()}): "
+                        f"{[os.path.basename(path) for path in changed]}")
+        return changed
+
+
+# Instancia global por proceso
+model_reload_watcher = ModelReloadWatcher()
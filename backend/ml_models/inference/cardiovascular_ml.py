@@ -1,14 +1,15 @@
 import os
-import joblib
 import numpy as np
-import pandas as pd
 import logging
 from django.conf import settings
-from sklearn.preprocessing import StandardScaler
+
+from ml_models.features import ML_SERVICE_PROFILE, feature_pipeline
+from ml_models.registry import LazyModelsMixin, model_registry
+from ml_models.rule_engine import ML_SERVICE_RULES
 
 logger = logging.getLogger('ml_models')
 
-class CardiovascularMLService:
+class CardiovascularMLService(LazyModelsMixin):
     def __init__(self):
         self.model_path = os.path.join(settings.ML_MODELS_PATH, 'cardiovascular_model.pkl')
         self.scaler_path = os.path.join(settings.ML_MODELS_PATH, 'scaler.pkl')
@@ -18,21 +19,19 @@ class CardiovascularMLService:
             'sexo_encoded', 'antecedentes_encoded'
         ]
         
-        self.model = None
-        self.scaler = None
-        self.load_models()
+        # Los modelos se cargan en la primera inferencia (ver LazyModelsMixin)
 
     def load_models(self):
         """Cargar modelos entrenados"""
         try:
             if os.path.exists(self.model_path):
-                self.model = joblib.load(self.model_path)
+                self.model = model_registry.get_object(self.model_path)
                 logger.info("Modelo cardiovascular cargado exitosamente")
             else:
                 logger.warning("Modelo no encontrado, usando predicción por reglas")
                 
             if os.path.exists(self.scaler_path):
-                self.scaler = joblib.load(self.scaler_path)
+                self.scaler = model_registry.get_object(self.scaler_path)
                 logger.info("Scaler cargado exitosamente")
             else:
                 logger.warning("Scaler no encontrado, usando normalización básica")
@@ -60,49 +59,8 @@ class CardiovascularMLService:
             return self._default_prediction(medical_record)
 
     def _prepare_features(self, medical_record):
-        """Preparar features para el modelo"""
-        patient = medical_record.patient
-        
-        # Calcular IMC
-        altura_m = patient.altura / 100
-        imc = patient.peso / (altura_m ** 2)
-        
-        # Calcular índice de paquetes/año
-        indice_paquetes = 0
-        if medical_record.cigarrillos_dia > 0 and medical_record.anos_tabaquismo > 0:
-            indice_paquetes = (medical_record.cigarrillos_dia / 20) * medical_record.anos_tabaquismo
-        
-        # Codificar variables categóricas
-        actividad_mapping = {'sedentario': 0, 'ligero': 1, 'moderado': 2, 'intenso': 3}
-        actividad_encoded = actividad_mapping.get(medical_record.actividad_fisica, 0)
-        
-        sexo_encoded = 1 if patient.sexo == 'M' else 0
-        
-        antecedentes_mapping = {'si': 1, 'no': 0, 'desconoce': 0.5}
-        antecedentes_encoded = antecedentes_mapping.get(medical_record.antecedentes_cardiacos, 0)
-        
-        # Calcular edad desde fecha de nacimiento
-        from datetime import date
-        if patient.fecha_nacimiento:
-            today = date.today()
-            age = today.year - patient.fecha_nacimiento.year - ((today.month, today.day) < (patient.fecha_nacimiento.month, patient.fecha_nacimiento.day))
-        else:
-            age = 0
-        
-        features = {
-            'edad': age,
-            'imc': imc,
-            'presion_sistolica': medical_record.presion_sistolica,
-            'presion_diastolica': medical_record.presion_diastolica,
-            'colesterol': medical_record.colesterol or 200,  # Valor por defecto
-            'glucosa': medical_record.glucosa or 100,
-            'indice_paquetes': indice_paquetes,
-            'actividad_fisica_encoded': actividad_encoded,
-            'sexo_encoded': sexo_encoded,
-            'antecedentes_encoded': antecedentes_encoded
-        }
-        
-        return features
+        """Preparar features para el modelo (codificación del entrenamiento, ver ml_models.features)"""
+        return feature_pipeline.features(medical_record, ML_SERVICE_PROFILE)
 
     def _ml_prediction(self, features, medical_record):
         """Predicción usando modelo ML"""
@@ -140,79 +98,13 @@ class CardiovascularMLService:
             return self._rule_based_prediction(features, medical_record)
 
     def _rule_based_prediction(self, features, medical_record):
-        """Sistema de predicción basado en reglas médicas"""
-        risk_score = 0
-        risk_factors = []
-        
-        # Evaluación por edad
-        if features['edad'] > 65:
-            risk_score += 25
-            risk_factors.append("Edad avanzada (>65 años)")
-        elif features['edad'] > 45:
-            risk_score += 15
-            risk_factors.append("Edad de riesgo (45-65 años)")
-        
-        # Evaluación IMC
-        if features['imc'] > 30:
-            risk_score += 20
-            risk_factors.append("Obesidad (IMC > 30)")
-        elif features['imc'] > 25:
-            risk_score += 10
-            risk_factors.append("Sobrepeso (IMC 25-30)")
-        
-        # Evaluación presión arterial
-        if features['presion_sistolica'] > 140:
-            risk_score += 25
-            risk_factors.append("Hipertensión arterial")
-        elif features['presion_sistolica'] > 120:
-            risk_score += 15
-            risk_factors.append("Presión arterial elevada")
-        
-        # Evaluación colesterol
-        if features['colesterol'] > 240:
-            risk_score += 15
-            risk_factors.append("Colesterol elevado")
-        elif features['colesterol'] > 200:
-            risk_score += 8
-            risk_factors.append("Colesterol borderline")
-        
-        # Evaluación glucosa
-        if features['glucosa'] > 126:
-            risk_score += 20
-            risk_factors.append("Diabetes mellitus")
-        elif features['glucosa'] > 100:
-            risk_score += 10
-            risk_factors.append("Glucosa elevada")
-        
-        # Evaluación tabaquismo
-        if features['indice_paquetes'] > 20:
-            risk_score += 25
-            risk_factors.append("Tabaquismo severo")
-        elif features['indice_paquetes'] > 10:
-            risk_score += 15
-            risk_factors.append("Tabaquismo moderado")
-        elif features['indice_paquetes'] > 0:
-            risk_score += 10
-            risk_factors.append("Consumo de tabaco")
-        
-        # Evaluación actividad física
-        if features['actividad_fisica_encoded'] == 0:  # sedentario
-            risk_score += 10
-            risk_factors.append("Sedentarismo")
-        
-        # Evaluación antecedentes familiares
-        if features['antecedentes_encoded'] == 1:
-            risk_score += 15
-            risk_factors.append("Antecedentes familiares cardiovasculares")
-        
-        # Evaluación por sexo y edad combinados
-        if features['sexo_encoded'] == 1 and features['edad'] > 45:  # Hombre > 45
-            risk_score += 10
-        elif features['sexo_encoded'] == 0 and features['edad'] > 55:  # Mujer > 55
-            risk_score += 10
-        
+        """Sistema de predicción basado en reglas médicas (ver ML_SERVICE_RULES)"""
+        evaluation = ML_SERVICE_RULES.evaluate_records([features])
+        risk_score = evaluation.score(0)
+        risk_factors = evaluation.factors(0, features)
+
         # Determinar nivel de riesgo
-        risk_level = self._get_risk_level(min(risk_score, 95))
+        risk_level = evaluation.level(0).name
         recommendations = self._generate_recommendations(risk_factors, risk_level)
         
         return {
@@ -0,0 +1,107 @@
+"""
+Evaluador vectorizado del pipeline XGBoost sobre arrays planos
+
+Sustituye a `Pipeline.predict_proba` (ColumnTransformer + XGBClassifier)
+usando las tablas de nodos exportadas por `ml_models.flat_artifacts`.
+Todos los árboles se recorren a la vez: en cada nivel se avanza un nodo por
+(fila, árbol) con operaciones NumPy, por lo que el coste es de
+`max_depth` pasos vectorizados en lugar de la maquinaria de sklearn/xgboost.
+
+Resultados frente al pipeline original: mismas decisiones de división
+(comparación en float32 como XGBoost) y probabilidades con diferencias del
+orden de 1e-7 por el distinto orden de suma de las hojas.
+"""
+
+import numpy as np
+
+from ml_models.flat_artifacts import FlatPipelineArtifact
+
+# Tolerancia absoluta aceptada frente al pipeline sklearn/xgboost
+PARITY_TOLERANCE = 1e-6
+
+# Filas por bloque en la evaluación de lotes grandes
+CHUNK_ROWS = 256
+
+
+def feature_matrix(X, feature_names) -> np.ndarray:
+    """Acepta DataFrame (columnas por nombre) o array en el orden del pipeline"""
+    if hasattr(X, 'columns'):
+        if list(X.columns) != feature_names:
+            X = X[feature_names]
+        X = X.to_numpy(dtype=np.float64)
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.shape[1] != len(feature_names):
+        raise ValueError(f"Se esperaban {len(feature_names)} features, se recibieron {X.shape[1]}")
+    return X
+
+
+class FlatPipelineModel:
+    """
+    Modelo con la interfaz mínima de un clasificador sklearn binario
+    (`classes_`, `predict_proba`, `predict`) respaldado por arrays planos.
+    """
+
+    backend = 'flat'
+
+    def __init__(self, artifact: FlatPipelineArtifact):
+        self.artifact = artifact
+        self.feature_names = list(artifact.feature_names)
+        self.classes_ = np.array([0, 1])
+
+        arrays = artifact.arrays
+        self._mean = arrays['scaler_mean']
+        self._scale = arrays['scaler_scale']
+        self._roots = arrays['tree_offsets']
+        self._threshold = arrays['node_threshold']
+        self._default_left = arrays['node_default_left']
+        self._value = arrays['node_value']
+        self._max_depth = artifact.manifest['max_depth']
+        self._base_margin = artifact.base_margin
+
+        # Las hojas apuntan a sí mismas: así todas las filas pueden avanzar
+        # max_depth niveles sin comprobar en cada paso si ya llegaron a hoja
+        is_leaf = arrays['node_feature'] < 0
+        node_ids = np.arange(is_leaf.shape[0], dtype=np.int32)
+        self._feature = np.where(is_leaf, 0, arrays['node_feature']).astype(np.intp)
+        self._left = np.where(is_leaf, node_ids, arrays['node_left'])
+        self._right = np.where(is_leaf, node_ids, arrays['node_right'])
+
+    def _as_matrix(self, X) -> np.ndarray:
+        return feature_matrix(X, self.feature_names)
+
+    def decision_function(self, X) -> np.ndarray:
+        """Margen (log-odds) por fila"""
+        X = self._as_matrix(X)
+        if X.shape[0] <= CHUNK_ROWS:
+            return self._margin(X)
+        # Por bloques para que las tablas intermedias (filas × árboles) quepan en caché
+        return np.concatenate([self._margin(X[start:start + CHUNK_ROWS])
+                               for start in range(0, X.shape[0], CHUNK_ROWS)])
+
+    def _margin(self, X: np.ndarray) -> np.ndarray:
+        # StandardScaler en float64 y umbrales en float32, igual que el pipeline
+        Z = ((X - self._mean) / self._scale).astype(np.float32)
+
+        n_rows, n_features = Z.shape
+        has_missing = bool(np.isnan(Z).any())
+        Z_flat = Z.ravel()
+        row_offsets = (np.arange(n_rows) * n_features)[:, None]
+        nodes = np.broadcast_to(self._roots, (n_rows, self._roots.shape[0]))
+
+        for _ in range(self._max_depth):
+            x = Z_flat[row_offsets + self._feature[nodes]]
+            go_left = x < self._threshold[nodes]
+            if has_missing:
+                go_left = np.where(np.isnan(x), self._default_left[nodes], go_left)
+            nodes = np.where(go_left, self._left[nodes], self._right[nodes])
+
+        return self._value[nodes].sum(axis=1, dtype=np.float64) + self._base_margin
+
+    def predict_proba(self, X) -> np.ndarray:
+        positive = 1.0 / (1.0 + np.exp(-self.decision_function(X)))
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
@@ -0,0 +1,55 @@
+"""
+Inferencia del pipeline XGBoost con ONNX Runtime (CPU)
+
+Sustituye a `Pipeline.predict_proba` ejecutando el grafo exportado por
+`ml_models.onnx_artifacts` (scaler + clasificador) en una sesión de
+onnxruntime. La sesión se crea una vez por modelo cargado, con
+ML_MODEL_THREADS hilos intra-op si está definido, y es segura para llamadas
+concurrentes a `run`.
+"""
+
+import numpy as np
+
+from ml_models.inference.flat_evaluator import feature_matrix
+from ml_models.onnx_artifacts import OnnxPipelineArtifact
+from ml_models.thread_budget import ThreadBudget
+
+# Tolerancia absoluta aceptada frente al pipeline sklearn/xgboost
+PARITY_TOLERANCE = 1e-6
+
+
+class OnnxPipelineModel:
+    """
+    Modelo con la interfaz mínima de un clasificador sklearn binario
+    (`classes_`, `predict_proba`, `predict`) respaldado por ONNX Runtime.
+    """
+
+    backend = 'onnx'
+
+    def __init__(self, artifact: OnnxPipelineArtifact):
+        import onnxruntime
+
+        self.artifact = artifact
+        self.feature_names = list(artifact.feature_names)
+        self.classes_ = np.array([0, 1])
+
+        options = onnxruntime.SessionOptions()
+        model_threads = ThreadBudget.from_settings().model_threads
+        if model_threads:
+            options.intra_op_num_threads = model_threads
+            options.inter_op_num_threads = 1
+        self._session = onnxruntime.InferenceSession(
+            artifact.model_bytes, sess_options=options, providers=['CPUExecutionProvider'],
+        )
+        self._input_name = artifact.manifest['input_name']
+        self._output_names = [artifact.manifest['output_name']]
+
+    def predict_proba(self, X) -> np.ndarray:
+        X = np.ascontiguousarray(feature_matrix(X, self.feature_names))
+        probabilities = self._session.run(self._output_names, {self._input_name: X})[0]
+        # Las probabilidades salen en float32 del TreeEnsembleClassifier
+        positive = probabilities[:, 1].astype(np.float64)
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
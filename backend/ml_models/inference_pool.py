@@ -0,0 +1,306 @@
+"""
+Pool dedicado de procesos de inferencia con memoria compartida
+
+En este modo el worker web no carga el modelo: envía la matriz de features
+a uno de varios procesos de larga duración que tienen el modelo (y el
+scaler) cargado una sola vez. Entrada y salida viajan por bloques de
+`multiprocessing.shared_memory` propios de cada proceso; por el Pipe solo
+pasan mensajes de control (número de filas, estado).
+
+Solo usa la biblioteca estándar (multiprocessing) más NumPy, y los procesos
+se crean con 'spawn' para no heredar el estado de Django ni sus hilos.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger('cardiovascular')
+
+# Segundos máximos de espera por la carga del modelo y por cada lote
+STARTUP_TIMEOUT = 120.0
+REQUEST_TIMEOUT = 30.0
+
+
+def _inference_worker_main(conn, model_path: str, scaler_path: Optional[str], max_rows: int):
+    """Bucle del proceso de inferencia"""
+    import warnings
+
+    from ml_models.registry import model_registry
+    from ml_models.thread_budget import apply_process_budget
+
+    try:
+        apply_process_budget()
+        model = model_registry.get_object(model_path)
+        scaler = model_registry.get_object(scaler_path) if scaler_path else None
+        if model is None:
+            raise FileNotFoundError(model_path)
+
+        n_features = int(getattr(scaler, 'n_features_in_', None) or model.n_features_in_)
+        classes = np.asarray(model.classes_).tolist()
+        conn.send(('ready', n_features, classes))
+    except Exception as e:
+        conn.send(('error', f"{e.__class__.__name__}: {e}"))
+        return
+
+    # Los bloques los crea (y los libera) el proceso padre; los hijos creados
+    # con spawn comparten su resource_tracker, así que solo se conectan
+    input_name, output_name = conn.recv()
+    input_block = shared_memory.SharedMemory(name=input_name)
+    output_block = shared_memory.SharedMemory(name=output_name)
+    inputs = np.ndarray((max_rows, n_features), dtype=np.float64, buffer=input_block.buf)
+    outputs = np.ndarray((max_rows, len(classes)), dtype=np.float64, buffer=output_block.buf)
+
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+
+            n_rows = message
+            try:
+                X = inputs[:n_rows]
+                with warnings.catch_warnings():
+                    # El scaler se ajustó con nombres de columnas; aquí llega un array
+                    warnings.simplefilter('ignore', UserWarning)
+                    if scaler is not None:
+                        X = scaler.transform(X)
+                    outputs[:n_rows] = model.predict_proba(X)
+                conn.send(('ok', n_rows))
+            except Exception as e:
+                conn.send(('error', f"{e.__class__.__name__}: {e}"))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del inputs, outputs
+        input_block.close()
+        output_block.close()
+
+
+class _InferenceWorker:
+    """Proceso de inferencia junto con sus bloques de memoria compartida"""
+
+    def __init__(self, context, model_path: str, scaler_path: Optional[str], max_rows: int):
+        self.max_rows = max_rows
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_inference_worker_main,
+            args=(child_conn, model_path, scaler_path, max_rows),
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+        if not self.conn.poll(STARTUP_TIMEOUT):
+            self.close()
+            raise TimeoutError("El proceso de inferencia no terminó de cargar el modelo")
+        message = self.conn.recv()
+        if message[0] != 'ready':
+            self.close()
+            raise RuntimeError(f"El proceso de inferencia no pudo cargar el modelo: {message[1]}")
+
+        _, self.n_features, self.classes = message
+        self.input_block = shared_memory.SharedMemory(create=True, size=max_rows * self.n_features * 8)
+        self.output_block = shared_memory.SharedMemory(create=True, size=max_rows * len(self.classes) * 8)
+        self.inputs = np.ndarray((max_rows, self.n_features), dtype=np.float64, buffer=self.input_block.buf)
+        self.outputs = np.ndarray((max_rows, len(self.classes)), dtype=np.float64, buffer=self.output_block.buf)
+        self.conn.send((self.input_block.name, self.output_block.name))
+
+    def submit(self, X: np.ndarray):
+        self.inputs[:X.shape[0]] = X
+        self.conn.send(X.shape[0])
+
+    def collect(self) -> np.ndarray:
+        if not self.conn.poll(REQUEST_TIMEOUT):
+            raise TimeoutError("El proceso de inferencia no respondió a tiempo")
+        message = self.conn.recv()
+        if message[0] != 'ok':
+            raise RuntimeError(f"Error en el proceso de inferencia: {message[1]}")
+        return self.outputs[:message[1]].copy()
+
+    def close(self):
+        try:
+            if self.process.is_alive():
+                self.conn.send(None)
+                self.process.join(timeout=5)
+        except Exception:
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+
+        for attribute in ('inputs', 'outputs'):
+            self.__dict__.pop(attribute, None)
+        for attribute in ('input_block', 'output_block'):
+            block = self.__dict__.pop(attribute, None)
+            if block is not None:
+                block.close()
+                block.unlink()
+
+
+class InferencePool:
+    """
+    Pool de procesos de inferencia. `predict_proba` reparte la matriz en
+    bloques de hasta `max_rows` filas entre los procesos libres y
+    reensambla el resultado en orden.
+    """
+
+    version: Optional[str] = None
+
+    def __init__(self, model_path: str, scaler_path: Optional[str] = None,
+                 processes: int = 2, max_rows: int = 1024):
+        self.model_path = model_path
+        self.scaler_path = scaler_path
+        self.max_rows = max(1, int(max_rows))
+        self._context = multiprocessing.get_context('spawn')
+        self._workers: List[_InferenceWorker] = []
+        self._free: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+        for _ in range(max(1, int(processes))):
+            self._add_worker()
+
+        first = self._workers[0]
+        self.n_features = first.n_features
+        self.classes_ = np.asarray(first.classes)
+        logger.info(f"Pool de inferencia iniciado: {len(self._workers)} procesos, "
+                    f"modelo {os.path.basename(model_path)}")
+
+    def _add_worker(self):
+        worker = _InferenceWorker(self._context, self.model_path, self.scaler_path, self.max_rows)
+        self._workers.append(worker)
+        self._free.put(worker)
+
+    def _replace_worker(self, worker: _InferenceWorker):
+        """Sustituye un proceso que falló o dejó de responder"""
+        with self._lock:
+            worker.close()
+            self._workers.remove(worker)
+            try:
+                self._add_worker()
+            except Exception as e:
+                logger.error(f"No se pudo reemplazar el proceso de inferencia: {e}")
+
+    def predict_proba(self, X) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Se esperaban {self.n_features} features, se recibieron {X.shape[1]}")
+
+        probabilities = np.empty((X.shape[0], len(self.classes_)), dtype=np.float64)
+        in_flight = deque()
+        error = None
+
+        for start in range(0, X.shape[0], self.max_rows):
+            chunk = X[start:start + self.max_rows]
+            # Si no hay procesos libres, terminar primero el lote más antiguo
+            worker = self._acquire(block=not in_flight)
+            while worker is None:
+                error = self._finish(in_flight.popleft(), probabilities) or error
+                worker = self._acquire(block=not in_flight)
+            try:
+                worker.submit(chunk)
+            except Exception as e:
+                # Pipe roto: el proceso murió estando libre. Se sustituye y,
+                # tras recoger los lotes ya enviados, se informa del error
+                logger.error(f"Proceso de inferencia {worker.process.pid} fuera de servicio: {e}")
+                self._replace_worker(worker)
+                error = e
+                break
+            in_flight.append((worker, start))
+
+        while in_flight:
+            error = self._finish(in_flight.popleft(), probabilities) or error
+
+        if error is not None:
+            raise error
+        return probabilities
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def _acquire(self, block: bool) -> Optional[_InferenceWorker]:
+        try:
+            return self._free.get(timeout=REQUEST_TIMEOUT) if block else self._free.get_nowait()
+        except queue.Empty:
+            if block:
+                raise TimeoutError("No hay procesos de inferencia disponibles")
+            return None
+
+    def _finish(self, in_flight_item, probabilities: np.ndarray) -> Optional[Exception]:
+        worker, start = in_flight_item
+        try:
+            result = worker.collect()
+        except RuntimeError as e:
+            # Error del modelo: el proceso sigue sano
+            self._free.put(worker)
+            return e
+        except Exception as e:
+            logger.error(f"Proceso de inferencia {worker.process.pid} fuera de servicio: {e}")
+            self._replace_worker(worker)
+            return e
+
+        probabilities[start:start + result.shape[0]] = result
+        self._free.put(worker)
+        return None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'processes': len(self._workers),
+            'alive': sum(1 for worker in self._workers if worker.process.is_alive()),
+            'idle': self._free.qsize(),
+            'max_rows': self.max_rows,
+            'pids': [worker.process.pid for worker in self._workers],
+        }
+
+    def shutdown(self):
+        # Solo el proceso que creó el pool puede cerrarlo
+        if os.getpid() != self._pid:
+            return
+        with self._lock:
+            for worker in self._workers:
+                worker.close()
+            self._workers = []
+
+
+_pools: Dict[tuple, InferencePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_inference_pool(model_path: str, scaler_path: Optional[str] = None,
+                       processes: int = 2, max_rows: int = 1024, version: Optional[str] = None) -> InferencePool:
+    """
+    Pool compartido por proceso para un par (modelo, scaler). Si `version`
+    (hash del artefacto) cambia, se arranca un pool nuevo y el anterior se
+    cierra cuando sus lotes en curso han tenido tiempo de terminar.
+    """
+    key = (os.getpid(), model_path, scaler_path)
+    pool = _pools.get(key)
+    if pool is not None and pool.version == version:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.version != version:
+            previous = pool
+            pool = InferencePool(model_path, scaler_path, processes=processes, max_rows=max_rows)
+            pool.version = version
+            _pools[key] = pool
+            if previous is not None:
+                threading.Timer(REQUEST_TIMEOUT, previous.shutdown).start()
+    return pool
+
+
+@atexit.register
+def _shutdown_pools():
+    for pool in list(_pools.values()):
+        pool.shutdown()
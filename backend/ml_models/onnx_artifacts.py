@@ -0,0 +1,175 @@
+"""
+Exportación del pipeline XGBoost a ONNX para ONNX Runtime
+
+El grafo reproduce `pipeline.joblib` completo (StandardScaler + XGBClassifier):
+
+    input (double, N×F) -> Sub(mean) -> Div(scale) -> Cast(float) -> TreeEnsembleClassifier
+
+El scaler se construye a mano en float64 en lugar de usar el convertidor
+Scaler de skl2onnx: este trabaja en float32 y, como los umbrales de los
+árboles sobre features discretas (colesterol, glucosa...) coinciden con los
+valores escalados, el redondeo cambia ramas (Δ de hasta 0.4 en la
+probabilidad). Escalando en float64 y convirtiendo a float32 después, igual
+que XGBoost, las decisiones de división son las mismas.
+
+Estructura del directorio:
+    manifest.json   metadatos, orden de features y hash del grafo
+    model.onnx      grafo ONNX serializado
+
+Dependencias opcionales: skl2onnx y onnxmltools para exportar, onnxruntime
+para servir (ver requirements.txt).
+"""
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger('cardiovascular')
+
+ONNX_FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+MODEL_NAME = 'model.onnx'
+
+# Opsets del grafo exportado (ai.onnx.ml 3 es el último soportado por onnxmltools)
+TARGET_OPSET = {'': 17, 'ai.onnx.ml': 3}
+
+INPUT_NAME = 'input'
+PROBABILITIES_NAME = 'probabilities'
+
+
+@dataclass
+class OnnxPipelineArtifact:
+    """Pipeline exportado a ONNX (bytes del grafo más su manifest)"""
+    manifest: Dict[str, Any]
+    model_bytes: bytes
+
+    @property
+    def feature_names(self) -> List[str]:
+        return self.manifest['feature_names']
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.model_bytes)
+
+
+def is_onnx_artifact(path) -> bool:
+    """Indica si la ruta es un directorio de artefacto ONNX"""
+    return (os.path.isdir(path)
+            and os.path.exists(os.path.join(path, MANIFEST_NAME))
+            and os.path.exists(os.path.join(path, MODEL_NAME)))
+
+
+def _register_xgboost_converter():
+    """Registra en skl2onnx el convertidor de XGBClassifier de onnxmltools"""
+    from onnxmltools.convert.xgboost.operator_converters.XGBoost import convert_xgboost
+    from skl2onnx import update_registered_converter
+    from skl2onnx.common.shape_calculator import calculate_linear_classifier_output_shapes
+    from xgboost import XGBClassifier
+
+    update_registered_converter(
+        XGBClassifier, 'XGBoostXGBClassifier',
+        calculate_linear_classifier_output_shapes, convert_xgboost,
+        options={'nocl': [True, False], 'zipmap': [True, False, 'columns']},
+    )
+
+
+def build_onnx_model(pipeline):
+    """
+    Construye el grafo ONNX de un Pipeline(ColumnTransformer(StandardScaler)
+    -> XGBClassifier). Devuelve (modelo ONNX, nombres de features).
+    """
+    import onnx
+    from onnx import TensorProto, compose, helper, numpy_helper
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+
+    preprocessor, model = pipeline.steps[0][1], pipeline.steps[-1][1]
+
+    transformers = [t for t in preprocessor.transformers_ if t[0] != 'remainder']
+    if len(transformers) != 1:
+        raise ValueError("Solo se soporta un ColumnTransformer con un único StandardScaler")
+    _, scaler, feature_names = transformers[0]
+    feature_names = list(feature_names)
+    n_features = len(feature_names)
+
+    scaler_mean = np.asarray(scaler.mean_ if scaler.with_mean else np.zeros(n_features), dtype=np.float64)
+    scaler_scale = np.asarray(scaler.scale_ if scaler.with_std else np.ones(n_features), dtype=np.float64)
+
+    # Clasificador: entrada float32 ya escalada, probabilidades sin ZipMap
+    _register_xgboost_converter()
+    classifier = convert_sklearn(
+        model,
+        initial_types=[('scaled', FloatTensorType([None, n_features]))],
+        options={id(model): {'zipmap': False}},
+        target_opset=TARGET_OPSET,
+    )
+
+    # Preprocesado: StandardScaler en float64 y conversión a float32
+    preprocessing = helper.make_graph(
+        [
+            helper.make_node('Sub', [INPUT_NAME, 'scaler_mean'], ['centered']),
+            helper.make_node('Div', ['centered', 'scaler_scale'], ['scaled_double']),
+            helper.make_node('Cast', ['scaled_double'], ['scaled_float'], to=TensorProto.FLOAT),
+        ],
+        'preprocessing',
+        [helper.make_tensor_value_info(INPUT_NAME, TensorProto.DOUBLE, [None, n_features])],
+        [helper.make_tensor_value_info('scaled_float', TensorProto.FLOAT, [None, n_features])],
+        initializer=[
+            numpy_helper.from_array(scaler_mean, 'scaler_mean'),
+            numpy_helper.from_array(scaler_scale, 'scaler_scale'),
+        ],
+    )
+    preprocessing_model = helper.make_model(preprocessing, opset_imports=list(classifier.opset_import))
+    preprocessing_model.ir_version = classifier.ir_version
+
+    onnx_model = compose.merge_models(preprocessing_model, classifier, io_map=[('scaled_float', 'scaled')])
+    onnx.checker.check_model(onnx_model)
+    return onnx_model, feature_names
+
+
+def export_pipeline_onnx(pipeline, output_dir, source_version: str = None) -> Dict[str, Any]:
+    """Exporta el pipeline a `model.onnx` + manifest. Devuelve el manifest escrito"""
+    onnx_model, feature_names = build_onnx_model(pipeline)
+    model_bytes = onnx_model.SerializeToString()
+
+    manifest = {
+        'format_version': ONNX_FORMAT_VERSION,
+        'source_version': source_version,
+        'feature_names': feature_names,
+        'input_name': INPUT_NAME,
+        'output_name': PROBABILITIES_NAME,
+        'opset': TARGET_OPSET,
+        'model_sha256': hashlib.sha256(model_bytes).hexdigest(),
+        'model_bytes': len(model_bytes),
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, MODEL_NAME), 'wb') as model_file:
+        model_file.write(model_bytes)
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+    logger.info(f"Pipeline exportado a ONNX: {output_dir} ({len(model_bytes) / 1024:.1f} KiB)")
+    return manifest
+
+
+def load_onnx_artifact(path) -> OnnxPipelineArtifact:
+    """Lee el artefacto ONNX y comprueba que el grafo corresponde al manifest"""
+    with open(os.path.join(path, MANIFEST_NAME)) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if manifest.get('format_version') != ONNX_FORMAT_VERSION:
+        raise ValueError(f"Versión de formato ONNX no soportada: {manifest.get('format_version')}")
+
+    with open(os.path.join(path, MODEL_NAME), 'rb') as model_file:
+        model_bytes = model_file.read()
+
+    if hashlib.sha256(model_bytes).hexdigest() != manifest.get('model_sha256'):
+        raise ValueError(f"model.onnx no coincide con el hash del manifest en {path}")
+
+    return OnnxPipelineArtifact(manifest=manifest, model_bytes=model_bytes)
@@ -0,0 +1,404 @@
+"""
+Registro de modelos compartido por proceso
+
+Todos los consumidores (PredictionService, CardiovascularPredictor,
+CardiovascularMLService) piden sus artefactos al registro en lugar de
+deserializarlos por su cuenta, de modo que cada proceso carga cada
+artefacto exactamente una vez.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import logging
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from ml_models.thread_budget import apply_process_budget, configure_model_threads
+
+logger = logging.getLogger('cardiovascular')
+
+
+@dataclass
+class ModelHandle:
+    """Artefacto cargado junto con sus metadatos de carga"""
+    path: str
+    version: str
+    obj: Any
+    size_bytes: int
+    load_time_ms: float
+    memory_bytes: Optional[int]
+    stat_signature: Optional[tuple] = None
+    loaded_at: float = field(default_factory=time.time)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'version': self.version,
+            'object_class': self.obj.__class__.__name__,
+            'size_bytes': self.size_bytes,
+            'load_time_ms': round(self.load_time_ms, 2),
+            'memory_bytes': self.memory_bytes,
+            'loaded_at': self.loaded_at,
+        }
+
+
+class ModelRegistry:
+    """
+    Registro de artefactos de ML indexado por ruta y versión.
+    La versión es el hash del contenido del archivo.
+    """
+
+    def __init__(self):
+        self._handles: Dict[tuple, ModelHandle] = {}
+        self._current: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    def get(self, path) -> Optional[ModelHandle]:
+        """
+        Devuelve el handle del artefacto, cargándolo la primera vez.
+        Retorna None si el archivo no existe.
+        """
+        path = os.path.abspath(str(path))
+
+        # Lectura sin lock: una recarga en otro hilo puede retirar la versión
+        # leída antes de buscar su handle; entonces se resuelve bajo el lock
+        version = self._current.get(path)
+        if version is not None:
+            handle = self._handles.get((path, version))
+            if handle is not None:
+                return handle
+
+        with self._lock:
+            # Otro hilo pudo haberlo cargado (o recargado) mientras esperábamos el lock
+            version = self._current.get(path)
+            if version is not None:
+                return self._handles[(path, version)]
+
+            if not os.path.exists(path):
+                return None
+
+            handle = self._load(path)
+            self._handles[(path, handle.version)] = handle
+            self._current[path] = handle.version
+            return handle
+
+    def get_object(self, path) -> Optional[Any]:
+        """Atajo que devuelve directamente el objeto deserializado"""
+        handle = self.get(path)
+        return handle.obj if handle is not None else None
+
+    def version_of(self, path) -> Optional[str]:
+        """Versión actual en disco del artefacto, sin deserializarlo"""
+        path = os.path.abspath(str(path))
+        if not os.path.exists(path):
+            return None
+        return self._file_version(path)
+
+    def _load(self, path: str) -> ModelHandle:
+        """Deserializa el artefacto midiendo tiempo y memoria"""
+        version = self._file_version(path)
+        rss_before = self._current_rss()
+
+        start_time = time.perf_counter()
+        obj = configure_model_threads(self._deserialize(path))
+        load_time_ms = (time.perf_counter() - start_time) * 1000
+
+        rss_after = self._current_rss()
+        memory_bytes = None
+        if rss_before is not None and rss_after is not None:
+            memory_bytes = max(rss_after - rss_before, 0)
+
+        logger.info(f"Artefacto cargado en registro: {os.path.basename(path)} "
+                    f"(versión {version}, {load_time_ms:.1f}ms)")
+
+        return ModelHandle(
+            path=path,
+            version=version,
+            obj=obj,
+            size_bytes=self._artifact_size(path),
+            load_time_ms=load_time_ms,
+            memory_bytes=memory_bytes,
+            stat_signature=self._stat_signature(path),
+        )
+
+    def refresh_changed(self) -> List[str]:
+        """
+        Recarga los artefactos cuyo contenido cambió en disco y devuelve sus
+        rutas. Solo se calcula el hash cuando cambia la firma (mtime, tamaño)
+        del archivo, por lo que la comprobación es barata en cada tarea.
+        """
+        changed = []
+        with self._lock:
+            for path, version in list(self._current.items()):
+                handle = self._handles[(path, version)]
+                signature = self._stat_signature(path)
+                if signature is None or signature == handle.stat_signature:
+                    continue
+
+                if self._file_version(path) == version:
+                    handle.stat_signature = signature
+                    continue
+
+                new_handle = self._load(path)
+                self._handles[(path, new_handle.version)] = new_handle
+                self._current[path] = new_handle.version
+                del self._handles[(path, version)]
+                changed.append(path)
+                logger.info(f"Artefacto actualizado en disco: {os.path.basename(path)} "
+                            f"({version} -> {new_handle.version})")
+        return changed
+
+    def refresh_to_versions(self, published: Dict[str, str]) -> List[str]:
+        """
+        Recarga los artefactos cargados cuya versión publicada (por nombre de
+        archivo, ver ml_models.hot_reload) difiere de la actual. Si el archivo
+        en disco todavía no tiene esa versión (almacenamiento compartido con
+        retraso) se mantiene la actual y se reintenta en la siguiente
+        comprobación.
+        """
+        changed = []
+        with self._lock:
+            for path, version in list(self._current.items()):
+                target = published.get(os.path.basename(path))
+                if target is None or target == version:
+                    continue
+
+                disk_version = self._file_version(path)
+                if disk_version != target:
+                    logger.warning(f"Versión publicada {target} de {os.path.basename(path)} aún no "
+                                   f"disponible en disco ({disk_version}); se reintentará")
+                    continue
+
+                new_handle = self._load(path)
+                self._handles[(path, new_handle.version)] = new_handle
+                self._current[path] = new_handle.version
+                del self._handles[(path, version)]
+                changed.append(path)
+                logger.info(f"Artefacto actualizado a la versión publicada: {os.path.basename(path)} "
+                            f"({version} -> {new_handle.version})")
+        return changed
+
+    @staticmethod
+    def _deserialize(path: str) -> Any:
+        """
+        Abre el artefacto. Los directorios ONNX se leen con su manifest, los
+        de arrays planos se mapean en memoria; los .joblib/.pkl se cargan con
+        joblib, opcionalmente con ML_ARTIFACT_MMAP_MODE para mapear los arrays
+        NumPy que contengan.
+        """
+        from ml_models.flat_artifacts import is_flat_artifact, load_flat_artifact
+        from ml_models.onnx_artifacts import is_onnx_artifact, load_onnx_artifact
+
+        # Ambos formatos son directorios con manifest.json: ONNX se distingue por model.onnx
+        if is_onnx_artifact(path):
+            return load_onnx_artifact(path)
+        if is_flat_artifact(path):
+            return load_flat_artifact(path)
+
+        # Import diferido: joblib arrastra scikit-learn/numpy y solo se
+        # necesita cuando realmente se deserializa un artefacto
+        import joblib
+        from django.conf import settings
+
+        # Los procesos auxiliares (p. ej. el pool de inferencia) pueden usar el
+        # registro sin haber configurado Django
+        mmap_mode = getattr(settings, 'ML_ARTIFACT_MMAP_MODE', None) if settings.configured else None
+        return joblib.load(path, mmap_mode=mmap_mode)
+
+    @staticmethod
+    def _stat_signature(path: str) -> Optional[tuple]:
+        """Firma barata (mtime, tamaño) para detectar cambios sin leer el archivo"""
+        if os.path.isdir(path):
+            path = os.path.join(path, 'manifest.json')
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _artifact_size(path: str) -> int:
+        if os.path.isdir(path):
+            return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+        return os.path.getsize(path)
+
+    @staticmethod
+    def _file_version(path: str) -> str:
+        """
+        Hash SHA-256 (abreviado) del contenido del artefacto. Para los
+        directorios (arrays planos, ONNX) se usa el manifest, que identifica
+        la exportación.
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, 'manifest.json')
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as artifact:
+            for chunk in iter(lambda: artifact.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:12]
+
+    @staticmethod
+    def _current_rss() -> Optional[int]:
+        try:
+            import psutil
+            return psutil.Process(os.getpid()).memory_info().rss
+        except Exception:
+            return None
+
+    def current_handles(self) -> List[ModelHandle]:
+        """Handles de la versión actual de cada artefacto cargado"""
+        with self._lock:
+            return [self._handles[(path, version)] for path, version in self._current.items()]
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas de los artefactos cargados en este proceso"""
+        handles = self.current_handles()
+
+        return {
+            'pid': os.getpid(),
+            'loaded_artifacts': len(handles),
+            'total_load_time_ms': round(sum(h.load_time_ms for h in handles), 2),
+            'total_memory_bytes': sum(h.memory_bytes or 0 for h in handles),
+            'artifacts': [h.as_dict() for h in handles],
+        }
+
+
+class LazyModelsMixin:
+    """
+    Difiere la carga de `model` y `scaler` hasta su primer acceso.
+
+    Las clases que lo usan implementan `load_models()` asignando
+    `self.model` / `self.scaler` (y opcionalmente `self.model_version`, el
+    hash del artefacto); instanciarlas (por ejemplo a nivel de módulo) ya no
+    deserializa ningún artefacto, de modo que `manage.py check` y los
+    workers que no predicen arrancan sin pagar el coste del ML.
+
+    `active_models()` devuelve (modelo, scaler, versión) como una única
+    tupla que solo se sustituye cuando la carga termina: una inferencia que
+    la toma al empezar no mezcla artefactos aunque `swap_models()` los
+    cambie a mitad de la petición.
+    """
+
+    _model = None
+    _scaler = None
+    _active = (None, None, None)
+    model_version = None
+    _models_loaded = False
+    _models_loading = False
+    _models_lock = threading.RLock()
+
+    def load_models(self):
+        raise NotImplementedError
+
+    def reset_models(self):
+        """Descarta los modelos para que el próximo acceso los vuelva a pedir al registro"""
+        with self._models_lock:
+            self._model = None
+            self._scaler = None
+            self.model_version = None
+            self._active = (None, None, None)
+            self._models_loaded = False
+
+    def swap_models(self):
+        """
+        Vuelve a pedir los modelos al registro y publica el nuevo trío de una
+        vez. Las peticiones en curso terminan con los artefactos que tomaron.
+        """
+        with self._models_lock:
+            self._models_loading = True
+            try:
+                self.load_models()
+            finally:
+                self._models_loading = False
+                self._models_loaded = True
+                self._publish_active()
+                _lazy_consumers.add(self)
+
+    def active_models(self) -> tuple:
+        """(modelo, scaler, versión del modelo) coherentes entre sí"""
+        self.ensure_models_loaded()
+        return self._active
+
+    def _publish_active(self):
+        self._active = (self._model, self._scaler, self.model_version)
+
+    def ensure_models_loaded(self):
+        """Carga los modelos una sola vez, de forma segura entre hilos"""
+        if self._models_loaded:
+            return
+
+        with self._models_lock:
+            # Si este mismo hilo ya está dentro de load_models, devolver el
+            # estado parcial en lugar de recargar recursivamente
+            if self._models_loaded or self._models_loading:
+                return
+
+            self._models_loading = True
+            try:
+                # Límites de hilos OpenMP/BLAS antes de que los modelos arranquen sus pools
+                apply_process_budget()
+                self.load_models()
+            finally:
+                self._models_loading = False
+                self._models_loaded = True
+                self._publish_active()
+                _lazy_consumers.add(self)
+
+    @property
+    def models_loaded(self) -> bool:
+        return self._models_loaded
+
+    @property
+    def model(self):
+        self.ensure_models_loaded()
+        return self._model
+
+    @model.setter
+    def model(self, value):
+        self._model = value
+        if not self._models_loading:
+            # Una asignación explícita sustituye a la carga diferida
+            self._models_loaded = True
+            self._publish_active()
+
+    @property
+    def scaler(self):
+        self.ensure_models_loaded()
+        return self._scaler
+
+    @scaler.setter
+    def scaler(self, value):
+        self._scaler = value
+        if not self._models_loading:
+            self._models_loaded = True
+            self._publish_active()
+
+
+# Instancia global del registro
+model_registry = ModelRegistry()
+
+# Consumidores con modelos cargados, para invalidarlos cuando cambia un artefacto
+_lazy_consumers = weakref.WeakSet()
+
+
+def reload_changed_models(published: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    Recarga los artefactos que cambiaron (en disco, o respecto a las
+    versiones publicadas si se indican) y sustituye de forma atómica los
+    modelos de los consumidores que ya los tenían cargados.
+    """
+    if published is None:
+        changed = model_registry.refresh_changed()
+    else:
+        changed = model_registry.refresh_to_versions(published)
+    if changed:
+        for consumer in list(_lazy_consumers):
+            try:
+                consumer.swap_models()
+            except Exception as e:
+                logger.error(f"Error sustituyendo modelos de {consumer.__class__.__name__}: {e}")
+    return changed
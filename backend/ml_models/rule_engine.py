@@ -0,0 +1,479 @@
+"""
+Motor de reglas médicas vectorizado
+
+Las reglas de respaldo (cuando el modelo ML no está disponible) se describen
+como una tabla de umbrales y puntos en lugar de cadenas de `if`. La tabla se
+evalúa con comparaciones NumPy sobre la matriz N×F de features y produce en
+una sola pasada, para todo el lote:
+  - el puntaje total de cada registro
+  - el nivel de riesgo (índice en la tabla de niveles)
+  - una máscara de bits con los factores de riesgo activados
+
+Los textos legibles de los factores se generan después, solo para los
+registros que realmente se devuelven. La lista de plantillas de cada máscara
+(y la de recomendaciones de cada par máscara/nivel) se memoiza con tamaño
+acotado; por registro solo se formatean los textos que incluyen valores.
+"""
+
+import operator
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Una condición es una conjunción de comparaciones (feature, operador, umbral);
+# una regla se activa si se cumple cualquiera de sus condiciones
+Comparison = Tuple[str, str, float]
+
+_OPERATORS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+    '==': np.equal,
+}
+
+# Entradas máximas de las cachés de textos por máscara
+TEXT_CACHE_SIZE = 1024
+
+_SCALAR_OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Regla con sus puntos y la plantilla del factor de riesgo (None si no genera texto)"""
+    any_of: Tuple[Tuple[Comparison, ...], ...]
+    points: float
+    template: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class RuleGroup:
+    """Reglas excluyentes evaluadas en orden (equivalente a una cadena if/elif)"""
+    name: str
+    rules: Tuple[Rule, ...]
+
+
+@dataclass(frozen=True)
+class RiskLevel:
+    """Nivel asignado cuando el puntaje alcanza `min_score`"""
+    min_score: float
+    name: str
+    probability: Optional[float] = None
+
+
+class RuleEvaluation:
+    """
+    Resultado de evaluar una tabla de reglas: puntajes, índices de nivel y
+    máscaras de factores por registro. El acceso por registro trabaja sobre
+    listas de Python (indexar arrays NumPy elemento a elemento es más lento
+    que el propio cálculo); los arrays se construyen solo si se piden.
+    """
+
+    def __init__(self, table: 'RuleTable', scores: Sequence[float], level_indices: Sequence[int],
+                 factor_masks: Sequence[int]):
+        self.table = table
+        self._scores = scores
+        self._level_indices = level_indices
+        self._factor_masks = factor_masks
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    @property
+    def scores(self) -> np.ndarray:
+        return np.asarray(self._scores, dtype=np.float64)
+
+    @property
+    def level_indices(self) -> np.ndarray:
+        return np.asarray(self._level_indices, dtype=np.int64)
+
+    @property
+    def factor_masks(self) -> np.ndarray:
+        return np.asarray(self._factor_masks, dtype=np.int64)
+
+    def score(self, index: int) -> float:
+        return self._scores[index]
+
+    def level(self, index: int) -> RiskLevel:
+        return self.table.levels[self._level_indices[index]]
+
+    def factor_mask(self, index: int) -> int:
+        return self._factor_masks[index]
+
+    def factors(self, index: int, features: Dict[str, float]) -> List[str]:
+        """Textos de los factores activados del registro `index` (generación diferida)"""
+        return self.table.render_factors(self._factor_masks[index], features)
+
+
+class RuleTable:
+    """
+    Tabla de reglas. Cada regla ocupa un bit de la máscara de factores en el
+    orden de declaración, que es también el orden de los textos generados.
+
+    Al construirse, la tabla se compila a arrays (feature, operador, umbral
+    por comparación y límites de cláusulas, reglas y grupos) para evaluarla
+    con un número fijo de operaciones NumPy, independiente del número de
+    reglas. Los lotes muy pequeños se evalúan con la misma tabla en Python
+    puro, donde el coste fijo de NumPy no compensa.
+    """
+
+    # Por debajo de este tamaño de lote se usa la evaluación escalar
+    VECTORIZE_MIN_ROWS = 8
+
+    def __init__(self, groups: Sequence[RuleGroup], levels: Sequence[RiskLevel] = (),
+                 score_cap: Optional[float] = None):
+        self.groups = list(groups)
+        self.score_cap = score_cap
+        # Niveles ordenados de mayor a menor umbral: gana el primero alcanzado.
+        # Una tabla sin niveles solo produce máscaras (índice de nivel 0)
+        self.levels = sorted(levels, key=lambda level: level.min_score, reverse=True)
+        self._level_thresholds = np.array([level.min_score for level in self.levels], dtype=np.float64)
+
+        rules = [rule for group in self.groups for rule in group.rules]
+        if len(rules) > 63:
+            raise ValueError("La máscara de factores admite como máximo 63 reglas")
+        self._templates = [rule.template for rule in rules]
+        self._points = np.array([rule.points for rule in rules], dtype=np.float64)
+        self._bits = np.left_shift(np.int64(1), np.arange(len(rules), dtype=np.int64))
+
+        self.feature_names = []
+        for rule in rules:
+            for condition in rule.any_of:
+                for feature_name, _, _ in condition:
+                    if feature_name not in self.feature_names:
+                        self.feature_names.append(feature_name)
+        self._feature_getter = operator.itemgetter(*self.feature_names)
+
+        # Plantillas por máscara como (texto, lleva valores): los textos fijos
+        # se reutilizan tal cual y solo se formatean los que incluyen valores
+        self._factor_entries = lru_cache(maxsize=TEXT_CACHE_SIZE)(self._compile_factor_entries)
+
+        # Compilación: comparaciones -> cláusulas (AND) -> reglas (OR) -> grupos (if/elif)
+        comparison_features, comparison_thresholds, comparison_operators = [], [], []
+        clause_starts, rule_starts, rule_groups = [], [], []
+        for group_index, group in enumerate(self.groups):
+            for rule in group.rules:
+                rule_starts.append(len(clause_starts))
+                rule_groups.append(group_index)
+                for condition in rule.any_of:
+                    clause_starts.append(len(comparison_features))
+                    for feature_name, op, threshold in condition:
+                        comparison_features.append(self.feature_names.index(feature_name))
+                        comparison_thresholds.append(threshold)
+                        comparison_operators.append(op)
+
+        self._comparison_features = np.array(comparison_features, dtype=np.intp)
+        self._comparison_thresholds = np.array(comparison_thresholds, dtype=np.float64)
+        self._operator_columns = {
+            op: np.array([i for i, name in enumerate(comparison_operators) if name == op], dtype=np.intp)
+            for op in set(comparison_operators)
+        }
+        self._clause_starts = np.array(clause_starts, dtype=np.intp)
+        self._rule_starts = np.array(rule_starts, dtype=np.intp)
+        self._rule_groups = np.array(rule_groups, dtype=np.intp)
+        self._group_first_rule = np.searchsorted(self._rule_groups, np.arange(len(self.groups)))
+
+        # Versión escalar de la misma tabla: por grupo, (bit, condiciones, puntos) por regla
+        self._scalar_groups = []
+        bit = 0
+        for group in self.groups:
+            scalar_rules = []
+            for rule in group.rules:
+                conditions = [[(feature_name, _SCALAR_OPERATORS[op], threshold)
+                               for feature_name, op, threshold in condition]
+                              for condition in rule.any_of]
+                scalar_rules.append((bit, conditions, rule.points))
+                bit += 1
+            self._scalar_groups.append(scalar_rules)
+
+    def evaluate(self, X: np.ndarray) -> RuleEvaluation:
+        """Evalúa la tabla sobre una matriz N×F con columnas en el orden de `feature_names`"""
+        X = np.asarray(X, dtype=np.float64)
+        values = X[:, self._comparison_features]
+
+        comparisons = np.empty(values.shape, dtype=bool)
+        for op, columns in self._operator_columns.items():
+            comparisons[:, columns] = _OPERATORS[op](values[:, columns], self._comparison_thresholds[columns])
+
+        clauses = np.logical_and.reduceat(comparisons, self._clause_starts, axis=1)
+        matches = np.logical_or.reduceat(clauses, self._rule_starts, axis=1)
+
+        # Dentro de cada grupo solo cuenta la primera regla cumplida (if/elif):
+        # número acumulado de aciertos desde el inicio del grupo igual a 1
+        cumulative = np.cumsum(matches, axis=1)
+        before_group = np.where(
+            self._group_first_rule > 0, cumulative[:, self._group_first_rule - 1], 0
+        )
+        hits = matches & ((cumulative - before_group[:, self._rule_groups]) == 1)
+
+        scores = hits @ self._points
+        masks = hits.astype(np.int64) @ self._bits
+        return RuleEvaluation(self, scores.tolist(), self._level_indices(scores).tolist(), masks.tolist())
+
+    def _level_indices(self, scores: np.ndarray) -> np.ndarray:
+        if not self.levels:
+            return np.zeros(len(scores), dtype=np.int64)
+        level_scores = np.minimum(scores, self.score_cap) if self.score_cap is not None else scores
+        return np.argmax(level_scores[:, None] >= self._level_thresholds[None, :], axis=1)
+
+    def evaluate_one(self, features: Dict[str, float]) -> Tuple[float, int, int]:
+        """Evaluación escalar de un registro: (puntaje, índice de nivel, máscara)"""
+        score = 0
+        mask = 0
+        for group in self._scalar_groups:
+            for bit, conditions, points in group:
+                for condition in conditions:
+                    for feature_name, compare, threshold in condition:
+                        if not compare(features[feature_name], threshold):
+                            break
+                    else:
+                        break
+                else:
+                    continue
+                # Primera regla cumplida del grupo (if/elif)
+                score += points
+                mask |= 1 << bit
+                break
+
+        level_score = score if self.score_cap is None else min(score, self.score_cap)
+        level_index = 0
+        for level_index, level in enumerate(self.levels):
+            if level_score >= level.min_score:
+                break
+        return score, level_index, mask
+
+    def evaluate_records(self, features_list: List[Dict[str, float]]) -> RuleEvaluation:
+        """Evalúa una lista de diccionarios de features (vectorizado salvo lotes pequeños)"""
+        if len(features_list) < self.VECTORIZE_MIN_ROWS:
+            scores, level_indices, masks = [], [], []
+            for features in features_list:
+                score, level_index, mask = self.evaluate_one(features)
+                scores.append(score)
+                level_indices.append(level_index)
+                masks.append(mask)
+            return RuleEvaluation(self, scores, level_indices, masks)
+
+        X = np.array([self._feature_getter(features) for features in features_list], dtype=np.float64)
+        return self.evaluate(X.reshape(len(features_list), len(self.feature_names)))
+
+    def render_factors(self, mask: int, features: Dict[str, float]) -> List[str]:
+        """Genera los textos de los factores presentes en la máscara"""
+        return [
+            template.format_map(features) if has_values else template
+            for template, has_values in self._factor_entries(mask)
+        ]
+
+    def _compile_factor_entries(self, mask: int) -> Tuple[Tuple[str, bool], ...]:
+        return tuple(
+            (template, '{' in template)
+            for bit, template in enumerate(self._templates)
+            if template is not None and mask >> bit & 1
+        )
+
+
+class RecommendationCatalog:
+    """
+    Recomendaciones fijas por nivel de riesgo más las activadas por una tabla
+    de reglas sin niveles (una regla por recomendación). La lista de cada par
+    (máscara, nivel) se construye una sola vez.
+    """
+
+    def __init__(self, by_level: Dict[str, Tuple[str, ...]], default_level: str, flags: RuleTable):
+        self.by_level = by_level
+        self.default_level = default_level
+        self.flags = flags
+        self._render = lru_cache(maxsize=TEXT_CACHE_SIZE)(self._compile)
+
+    def recommendations(self, level_name: str, features: Dict[str, float]) -> List[str]:
+        """Recomendaciones de un registro"""
+        return self.render(level_name, self.flags.evaluate_one(features)[2])
+
+    def render(self, level_name: str, mask: int) -> List[str]:
+        """Recomendaciones para una máscara ya evaluada (p. ej. en lote con `flags.evaluate_records`)"""
+        return list(self._render(level_name, mask))
+
+    def _compile(self, level_name: str, mask: int) -> Tuple[str, ...]:
+        level_texts = self.by_level.get(level_name, self.by_level[self.default_level])
+        # Las plantillas de `flags` no llevan valores: la máscara determina el texto
+        return tuple(level_texts) + tuple(self.flags.render_factors(mask, {}))
+
+
+def _rule(points, template, *any_of):
+    return Rule(any_of=tuple(tuple(condition) for condition in any_of), points=points, template=template)
+
+
+# Reglas de respaldo de CardiovascularPredictor (predictor limpio y completo)
+FALLBACK_RULES = RuleTable(
+    groups=[
+        RuleGroup('edad', (
+            _rule(25, "Edad avanzada ({edad:.0f} años)", [('edad', '>', 65)]),
+            _rule(15, "Edad media ({edad:.0f} años)", [('edad', '>', 45)]),
+        )),
+        RuleGroup('imc', (
+            _rule(20, "Obesidad (IMC: {imc:.1f})", [('imc', '>', 30)]),
+            _rule(10, "Sobrepeso (IMC: {imc:.1f})", [('imc', '>', 25)]),
+        )),
+        RuleGroup('presion_arterial', (
+            _rule(25, "Hipertensión ({presion_sistolica:.0f}/{presion_diastolica:.0f})",
+                  [('presion_sistolica', '>', 140)], [('presion_diastolica', '>', 90)]),
+            _rule(15, "Presión elevada ({presion_sistolica:.0f}/{presion_diastolica:.0f})",
+                  [('presion_sistolica', '>', 130)], [('presion_diastolica', '>', 80)]),
+        )),
+        RuleGroup('colesterol', (
+            _rule(20, "Colesterol alto ({colesterol:.0f})", [('colesterol', '>', 240)]),
+            _rule(10, "Colesterol borderline ({colesterol:.0f})", [('colesterol', '>', 200)]),
+        )),
+        RuleGroup('glucosa', (
+            _rule(20, "Glucosa elevada ({glucosa:.0f})", [('glucosa', '>', 126)]),
+            _rule(10, "Glucosa alterada ({glucosa:.0f})", [('glucosa', '>', 100)]),
+        )),
+        RuleGroup('tabaquismo', (
+            _rule(20, "Tabaquismo intenso ({indice_paquetes:.1f} paquetes/año)", [('indice_paquetes', '>', 10)]),
+            _rule(10, "Tabaquismo ({indice_paquetes:.1f} paquetes/año)", [('indice_paquetes', '>', 0)]),
+        )),
+        RuleGroup('antecedentes', (
+            _rule(15, "Antecedentes cardíacos familiares", [('antecedentes_encoded', '>', 0)]),
+        )),
+    ],
+    levels=[
+        RiskLevel(40, 'ALTO', 85.0),
+        RiskLevel(20, 'MEDIO', 60.0),
+        RiskLevel(float('-inf'), 'BAJO', 25.0),
+    ],
+)
+
+# Reglas de CardiovascularMLService: la probabilidad es el puntaje limitado a 95
+ML_SERVICE_RULES = RuleTable(
+    groups=[
+        RuleGroup('edad', (
+            _rule(25, "Edad avanzada (>65 años)", [('edad', '>', 65)]),
+            _rule(15, "Edad de riesgo (45-65 años)", [('edad', '>', 45)]),
+        )),
+        RuleGroup('imc', (
+            _rule(20, "Obesidad (IMC > 30)", [('imc', '>', 30)]),
+            _rule(10, "Sobrepeso (IMC 25-30)", [('imc', '>', 25)]),
+        )),
+        RuleGroup('presion_arterial', (
+            _rule(25, "Hipertensión arterial", [('presion_sistolica', '>', 140)]),
+            _rule(15, "Presión arterial elevada", [('presion_sistolica', '>', 120)]),
+        )),
+        RuleGroup('colesterol', (
+            _rule(15, "Colesterol elevado", [('colesterol', '>', 240)]),
+            _rule(8, "Colesterol borderline", [('colesterol', '>', 200)]),
+        )),
+        RuleGroup('glucosa', (
+            _rule(20, "Diabetes mellitus", [('glucosa', '>', 126)]),
+            _rule(10, "Glucosa elevada", [('glucosa', '>', 100)]),
+        )),
+        RuleGroup('tabaquismo', (
+            _rule(25, "Tabaquismo severo", [('indice_paquetes', '>', 20)]),
+            _rule(15, "Tabaquismo moderado", [('indice_paquetes', '>', 10)]),
+            _rule(10, "Consumo de tabaco", [('indice_paquetes', '>', 0)]),
+        )),
+        RuleGroup('actividad_fisica', (
+            _rule(10, "Sedentarismo", [('actividad_fisica_encoded', '==', 0)]),
+        )),
+        RuleGroup('antecedentes', (
+            _rule(15, "Antecedentes familiares cardiovasculares", [('antecedentes_encoded', '==', 1)]),
+        )),
+        # Sexo y edad combinados: suma puntos sin generar factor
+        RuleGroup('sexo_edad', (
+            _rule(10, None,
+                  [('sexo_encoded', '==', 1), ('edad', '>', 45)],
+                  [('sexo_encoded', '==', 0), ('edad', '>', 55)]),
+        )),
+    ],
+    levels=[
+        RiskLevel(60, 'Alto'),
+        RiskLevel(30, 'Medio'),
+        RiskLevel(float('-inf'), 'Bajo'),
+    ],
+    score_cap=95,
+)
+
+# Factores de riesgo de la predicción ML (CardiovascularPredictor._analyze_risk_factors_ml)
+ML_FACTOR_RULES = RuleTable(
+    groups=[
+        RuleGroup('edad', (
+            _rule(0, "Edad avanzada ({edad:.0f} años)", [('edad', '>', 65)]),
+            _rule(0, "Edad media ({edad:.0f} años)", [('edad', '>', 45)]),
+        )),
+        RuleGroup('imc', (
+            _rule(0, "Obesidad (IMC: {imc:.1f})", [('imc', '>', 30)]),
+            _rule(0, "Sobrepeso (IMC: {imc:.1f})", [('imc', '>', 25)]),
+        )),
+        RuleGroup('presion_arterial', (
+            _rule(0, "Hipertensión ({presion_sistolica:.0f}/{presion_diastolica:.0f} mmHg)",
+                  [('presion_sistolica', '>', 140)], [('presion_diastolica', '>', 90)]),
+            _rule(0, "Presión elevada ({presion_sistolica:.0f}/{presion_diastolica:.0f} mmHg)",
+                  [('presion_sistolica', '>', 130)], [('presion_diastolica', '>', 80)]),
+        )),
+        RuleGroup('colesterol', (
+            _rule(0, "Colesterol alto ({colesterol:.0f} mg/dL)", [('colesterol', '>', 240)]),
+            _rule(0, "Colesterol borderline ({colesterol:.0f} mg/dL)", [('colesterol', '>', 200)]),
+        )),
+        RuleGroup('glucosa', (
+            _rule(0, "Glucosa elevada ({glucosa:.0f} mg/dL)", [('glucosa', '>', 126)]),
+            _rule(0, "Glucosa alterada ({glucosa:.0f} mg/dL)", [('glucosa', '>', 100)]),
+        )),
+        RuleGroup('tabaquismo', (
+            _rule(0, "Tabaquismo intenso ({indice_paquetes:.1f} paquetes/año)", [('indice_paquetes', '>', 10)]),
+            _rule(0, "Tabaquismo ({indice_paquetes:.1f} paquetes/año)", [('indice_paquetes', '>', 0)]),
+        )),
+        RuleGroup('actividad_fisica', (
+            _rule(0, "Sedentarismo", [('actividad_fisica_encoded', '<', 1)]),
+        )),
+        RuleGroup('antecedentes', (
+            _rule(0, "Antecedentes cardíacos familiares", [('antecedentes_encoded', '>', 0)]),
+        )),
+    ],
+)
+
+# Recomendaciones de CardiovascularPredictor._generate_recommendations
+PREDICTOR_RECOMMENDATIONS = RecommendationCatalog(
+    by_level={
+        'ALTO': (
+            "Consulta cardiológica inmediata",
+            "Exámenes cardíacos completos (ECG, ecocardiograma, pruebas de esfuerzo)",
+            "Control estricto de factores de riesgo",
+            "Posible inicio de tratamiento farmacológico",
+        ),
+        'MEDIO': (
+            "Consulta cardiológica en las próximas 4-6 semanas",
+            "Exámenes de laboratorio básicos",
+            "Modificación de estilo de vida",
+            "Seguimiento regular de presión arterial y colesterol",
+        ),
+        'BAJO': (
+            "Mantener controles médicos regulares",
+            "Estilo de vida saludable",
+            "Prevención primaria",
+            "Chequeos anuales",
+        ),
+    },
+    default_level='BAJO',
+    flags=RuleTable(
+        groups=[
+            RuleGroup('imc', (_rule(0, "Control de peso y dieta saludable", [('imc', '>', 25)]),)),
+            RuleGroup('presion_arterial', (
+                _rule(0, "Control de presión arterial", [('presion_sistolica', '>', 130)]),
+            )),
+            RuleGroup('colesterol', (_rule(0, "Control de colesterol", [('colesterol', '>', 200)]),)),
+            RuleGroup('tabaquismo', (
+                _rule(0, "Dejar de fumar - programa de cesación tabáquica", [('indice_paquetes', '>', 0)]),
+            )),
+            RuleGroup('actividad_fisica', (
+                _rule(0, "Aumentar actividad física (150 min/semana de ejercicio moderado)",
+                      [('actividad_fisica_encoded', '<', 2)]),
+            )),
+        ],
+    ),
+)
@@ -0,0 +1,167 @@
+"""
+Caché de resultados de scoring por huella del vector de features
+
+Dos registros médicos con las mismas 10 features del modelo producen el
+mismo nivel de riesgo, probabilidad, factores y recomendaciones, aunque
+difieran en campos que el modelo no usa (teléfono, observaciones, frecuencia
+cardiaca...) o sean registros nuevos del mismo paciente con los mismos
+signos vitales. La huella se calcula sobre las features redondeadas a la
+precisión clínica con la que se informan (FINGERPRINT_DECIMALS: edad,
+presiones, colesterol y glucosa enteros; IMC y paquetes/año a un decimal)
+más la versión del modelo activo, de modo que publicar un modelo nuevo deja
+de reutilizar los resultados del anterior.
+
+Con la caché activa el predictor puntúa las features ya redondeadas
+(`canonical_features`): el resultado depende solo de la huella y es el mismo
+tanto si sale de la caché como si se calcula. `features_used` y los scores
+detallados/clínicos (que usan HDL, triglicéridos y diabetes) se calculan
+siempre con los valores del registro.
+
+Las entradas viven en la caché `predictions` (Redis, compartida entre
+workers); si no responde, cada consulta cuenta como error y se puntúa sin
+caché.
+"""
+
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from ml_models.features import MODEL_FEATURES
+
+logger = logging.getLogger('cardiovascular')
+
+# Decimales de cada feature en la huella (los mismos con que se muestran en los factores de riesgo)
+FINGERPRINT_DECIMALS = {
+    'edad': 0,
+    'imc': 1,
+    'presion_sistolica': 0,
+    'presion_diastolica': 0,
+    'colesterol': 0,
+    'glucosa': 0,
+    'indice_paquetes': 1,
+    'actividad_fisica_encoded': 0,
+    'sexo_encoded': 0,
+    'antecedentes_encoded': 1,
+}
+
+SCORING_PREFIX = 'scoring'
+
+# Campos del resultado que dependen del registro y no de la huella
+RECORD_FIELDS = ('features_used', 'scores_detallados')
+
+# Desactiva la caché en el contexto actual (calentamiento de modelos)
+_bypassed: ContextVar[bool] = ContextVar('scoring_cache_bypassed', default=False)
+
+
+def canonical_features(features: Mapping[str, float]) -> Dict[str, float]:
+    """Features del modelo redondeadas a FINGERPRINT_DECIMALS"""
+    return {
+        name: float(round(features[name], FINGERPRINT_DECIMALS[name]))
+        for name in MODEL_FEATURES
+    }
+
+
+def feature_fingerprint(canonical: Mapping[str, float], model_version: Optional[str]) -> str:
+    """Clave de caché de un vector canónico para una versión de modelo"""
+    vector = ','.join(repr(canonical[name]) for name in MODEL_FEATURES)
+    digest = hashlib.sha1(vector.encode()).hexdigest()[:20]
+    return f"{SCORING_PREFIX}:{model_version or 'unversioned'}:{digest}"
+
+
+class ScoringCache:
+    """Resultados de scoring por huella, con contadores de aciertos del proceso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(settings, 'ML_SCORING_CACHE_ENABLED', False)
+
+    @property
+    def active(self) -> bool:
+        """Habilitada en settings y no desactivada en este contexto"""
+        return self.enabled and not _bypassed.get()
+
+    @contextmanager
+    def bypass(self):
+        """Puntúa sin consultar ni poblar la caché dentro del bloque"""
+        token = _bypassed.set(True)
+        try:
+            yield
+        finally:
+            _bypassed.reset(token)
+
+    @property
+    def timeout(self) -> int:
+        return getattr(settings, 'ML_SCORING_CACHE_TIMEOUT', 1800)
+
+    def _backend(self):
+        try:
+            return caches['predictions']
+        except Exception:
+            return cache
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Resultados cacheados de `keys`; {} si la caché no responde"""
+        keys = list(keys)
+        try:
+            found = self._backend().get_many(keys)
+        except Exception as e:
+            logger.warning(f"Caché de scoring no disponible: {e}")
+            with self._lock:
+                self.errors += 1
+                self.misses += len(keys)
+            return {}
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, entries: Mapping[str, Dict[str, Any]]):
+        """Guarda resultados de scoring (sin los campos propios del registro)"""
+        if not entries:
+            return
+        stored = {
+            key: {field: value for field, value in result.items() if field not in RECORD_FIELDS}
+            for key, result in entries.items()
+        }
+        try:
+            self._backend().set_many(stored, timeout=self.timeout)
+        except Exception as e:
+            logger.warning(f"No se pudieron guardar resultados de scoring en caché: {e}")
+            with self._lock:
+                self.errors += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.errors = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+                'timeout': self.timeout,
+            }
+
+
+# Instancia compartida por proceso
+scoring_cache = ScoringCache()
+
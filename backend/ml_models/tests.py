@@ -0,0 +1,579 @@
+import datetime
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import warnings
+from unittest import mock
+
+import joblib
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from apps.patients.models import MedicalRecord, Patient
+from apps.predictions.management.commands.validate_flat_pipeline import synthetic_pipeline_inputs
+from ml_models.batching import MicroBatcher
+from ml_models.cardiovascular_predictor_clean import CardiovascularPredictor
+from ml_models.flat_artifacts import load_flat_artifact
+from ml_models.inference.flat_evaluator import PARITY_TOLERANCE, FlatPipelineModel
+from ml_models.inference_pool import InferencePool
+from ml_models.registry import ModelRegistry
+from ml_models.rule_engine import FALLBACK_RULES, ML_SERVICE_RULES
+from ml_models.scoring_cache import RECORD_FIELDS, canonical_features, feature_fingerprint, scoring_cache
+
+
+def _medical_records(size, seed=0):
+    """Registros sin guardar (sin acceso a la base de datos) con valores clínicos variados"""
+    rng = random.Random(seed)
+    records = []
+    for index in range(size):
+        patient = Patient(
+            dni=f'7{index:07d}', nombre='Paciente', apellidos='Sintético', sexo=rng.choice('MF'),
+            fecha_nacimiento=datetime.date(rng.randint(1935, 1995), 1, 1),
+            peso=rng.uniform(50, 120), altura=rng.uniform(150, 195),
+        )
+        records.append(MedicalRecord(
+            patient=patient, edad=rng.randint(30, 85),
+            presion_sistolica=rng.randint(100, 190), presion_diastolica=rng.randint(60, 110),
+            colesterol=rng.uniform(150, 300), glucosa=rng.uniform(70, 200),
+            cigarrillos_dia=rng.choice([0, 10, 20]), anos_tabaquismo=rng.choice([0, 10, 30]),
+            actividad_fisica=rng.choice(['sedentario', 'ligero', 'moderado', 'intenso']),
+            antecedentes_cardiacos=rng.choice(['si', 'no', 'desconoce']),
+        ))
+    return records
+
+
+@override_settings(ML_SCORING_CACHE_ENABLED=False, ML_MICROBATCH_ENABLED=False)
+class PredictManyParityTests(SimpleTestCase):
+    """predict_many da, registro a registro, lo mismo que predict_cardiovascular_risk"""
+
+    def _assert_parity(self, predictor, records):
+        expected = [predictor.predict_cardiovascular_risk(record) for record in records]
+        self.assertEqual(predictor.predict_many(records), expected)
+
+    def test_model(self):
+        predictor = CardiovascularPredictor()
+        self.assertIsNotNone(predictor.model)
+        self._assert_parity(predictor, _medical_records(20, seed=3))
+
+    def test_rules(self):
+        predictor = CardiovascularPredictor()
+        predictor.model = None
+        records = _medical_records(20, seed=4)
+        self._assert_parity(predictor, records)
+        self.assertGreater(len({result['riesgo_nivel'] for result in predictor.predict_many(records)}), 1)
+
+    def test_invalid_record_is_isolated(self):
+        predictor = CardiovascularPredictor()
+        predictor.model = None
+        records = _medical_records(3, seed=5)
+        records.insert(1, MedicalRecord(presion_sistolica=120))  # Sin paciente: falla la extracción
+        results = predictor.predict_many(records)
+        self.assertEqual(results[1], predictor._default_prediction())
+        self.assertEqual(results[1], predictor.predict_cardiovascular_risk(records[1]))
+        self.assertEqual(results[:1] + results[2:], [predictor.predict_cardiovascular_risk(record)
+                                                     for record in records[:1] + records[2:]])
+
+
+class ModelRegistryHotReloadTests(SimpleTestCase):
+    """get() concurrente mientras otro hilo recarga versiones nuevas del artefacto"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'modelo.joblib')
+        self._publish(0)
+
+    def _publish(self, version):
+        joblib.dump({'version': version, 'padding': 'x' * (version % 7)}, self.path)
+        # Firma (mtime, tamaño) distinta aunque el tamaño coincida
+        os.utime(self.path, ns=(version + 1, version + 1))
+
+    def test_get_during_refresh_never_fails(self):
+        registry = ModelRegistry()
+        registry.get(self.path)
+        errors = []
+        seen = set()
+        stop = threading.Event()
+
+        def reader():
+            while not stop.is_set():
+                try:
+                    handle = registry.get(self.path)
+                    seen.add(handle.obj['version'])
+                except Exception as e:  # KeyError si se retira la versión leída
+                    errors.append(e)
+                    return
+
+        readers = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in readers:
+            thread.start()
+        try:
+            for version in range(1, 40):
+                self._publish(version)
+                self.assertEqual(registry.refresh_changed(), [os.path.abspath(self.path)])
+        finally:
+            stop.set()
+            for thread in readers:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(registry.get(self.path).obj['version'], 39)
+        self.assertGreater(len(seen), 1)
+        # La versión retirada no se conserva
+        self.assertEqual(len(registry.current_handles()), 1)
+
+
+class FlatPipelineParityTests(SimpleTestCase):
+    """pipeline_flat/ reproduce pipeline.joblib dentro de PARITY_TOLERANCE"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pipeline_path = os.path.join(settings.ML_MODELS_PATH, 'pipeline.joblib')
+        cls.pipeline = joblib.load(cls.pipeline_path)
+        cls.artifact = load_flat_artifact(settings.ML_FLAT_PIPELINE_PATH)
+        cls.model = FlatPipelineModel(cls.artifact)
+
+    def test_artifact_matches_pipeline_version(self):
+        self.assertEqual(self.artifact.manifest['source_version'], ModelRegistry().version_of(self.pipeline_path))
+
+    def test_smoke_sample(self):
+        with open(os.path.join(settings.ML_MODELS_PATH, 'smoke_test_output.json')) as smoke_file:
+            smoke = json.load(smoke_file)
+        sample = pd.DataFrame([smoke['input_sample']])[self.model.feature_names]
+        self.assertAlmostEqual(self.model.predict_proba(sample)[0, 1], smoke['proba_positive'], delta=PARITY_TOLERANCE)
+
+    def test_synthetic_inputs(self):
+        # Mismas entradas que validate_flat_pipeline (semilla 42)
+        X = pd.DataFrame(synthetic_pipeline_inputs(2000), columns=self.model.feature_names)
+        expected = self.pipeline.predict_proba(X)
+        obtained = self.model.predict_proba(X)
+        self.assertEqual(obtained.shape, expected.shape)
+        self.assertLessEqual(float(np.max(np.abs(expected - obtained))), PARITY_TOLERANCE)
+        # Un registro suelto (camino de /predict/) igual que dentro del lote
+        np.testing.assert_allclose(self.model.predict_proba(X.iloc[[0]]), obtained[:1], rtol=0, atol=1e-12)
+
+
+@override_settings(ML_SCORING_CACHE_ENABLED=False)
+class PredictorConcurrencyTests(SimpleTestCase):
+    """Llamadas concurrentes al predictor compartido dan lo mismo que en serie"""
+
+    THREADS = 8
+
+    def setUp(self):
+        self.records = _medical_records(12)
+        with override_settings(ML_MICROBATCH_ENABLED=False):
+            predictor = CardiovascularPredictor()
+            self.expected_single = [predictor.predict_cardiovascular_risk(record) for record in self.records]
+            self.expected_many = predictor.predict_many(self.records)
+
+    def _run_concurrently(self, predictor):
+        barrier = threading.Barrier(self.THREADS)
+        results = [None] * self.THREADS
+        errors = []
+
+        def worker(slot):
+            try:
+                barrier.wait()
+                single = [predictor.predict_cardiovascular_risk(record) for record in self.records]
+                results[slot] = (single, predictor.predict_many(self.records))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for single, many in results:
+            self.assertEqual(single, self.expected_single)
+            self.assertEqual(many, self.expected_many)
+
+    @override_settings(ML_MICROBATCH_ENABLED=False)
+    def test_without_micro_batcher(self):
+        predictor = CardiovascularPredictor()
+        self._run_concurrently(predictor)
+        self.assertIsNone(predictor._micro_batcher)
+
+    @override_settings(ML_MICROBATCH_ENABLED=True, ML_MICROBATCH_MAX_WAIT_MS=5.0)
+    def test_with_micro_batcher(self):
+        predictor = CardiovascularPredictor()
+        self._run_concurrently(predictor)
+        stats = predictor.micro_batcher.stats()
+        self.assertEqual(stats['total_items'], self.THREADS * len(self.records))
+
+
+class MicroBatcherTests(SimpleTestCase):
+    """Agrupación de llamadas concurrentes en MicroBatcher"""
+
+    def setUp(self):
+        self.first_batch_started = threading.Event()
+        self.release_first_batch = threading.Event()
+        self.calls = []
+
+    def _submit_concurrently(self, batcher, items):
+        # Los envíos llegan mientras batch_fn procesa el primer elemento: se agrupan en el siguiente lote
+        futures = [(items[0], batcher.submit(items[0]))]
+        self.first_batch_started.wait(timeout=5)
+        barrier = threading.Barrier(len(items) - 1)
+
+        def submit(item):
+            barrier.wait()
+            futures.append((item, batcher.submit(item)))
+
+        threads = [threading.Thread(target=submit, args=(item,)) for item in items[1:]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.release_first_batch.set()
+        return futures
+
+    def _batch_fn(self, items):
+        self.calls.append(list(items))
+        if len(self.calls) == 1:
+            self.first_batch_started.set()
+            self.release_first_batch.wait(timeout=5)
+        return [item * 10 for item in items]
+
+    def test_concurrent_submits_share_one_call(self):
+        batcher = MicroBatcher(self._batch_fn, max_batch_size=32, max_wait_ms=50, name='test')
+        futures = self._submit_concurrently(batcher, list(range(9)))
+        for _, future in futures:
+            future.result(timeout=5)
+        self.assertEqual([len(items) for items in self.calls], [1, 8])
+
+    def test_each_future_gets_its_own_result(self):
+        batcher = MicroBatcher(self._batch_fn, max_batch_size=32, max_wait_ms=50, name='test')
+        futures = self._submit_concurrently(batcher, list(range(9)))
+        for item, future in futures:
+            self.assertEqual(future.result(timeout=5), item * 10)
+        # El segundo lote reúne los 8 envíos concurrentes, en el orden en que llegaron
+        self.assertEqual(sorted(self.calls[1]), list(range(1, 9)))
+
+    def test_batch_fn_error_reaches_every_future(self):
+        def failing(items):
+            self.calls.append(list(items))
+            if len(self.calls) == 1:
+                self.first_batch_started.set()
+                self.release_first_batch.wait(timeout=5)
+            raise RuntimeError('modelo caído')
+
+        batcher = MicroBatcher(failing, max_batch_size=32, max_wait_ms=50, name='test')
+        futures = self._submit_concurrently(batcher, list(range(5)))
+        for _, future in futures:
+            with self.assertRaisesMessage(RuntimeError, 'modelo caído'):
+                future.result(timeout=5)
+        self.assertEqual(batcher.stats()['errors'], 2)
+
+    def test_stats_report_batch_size_distribution(self):
+        batcher = MicroBatcher(self._batch_fn, max_batch_size=4, max_wait_ms=50, name='test')
+        futures = self._submit_concurrently(batcher, list(range(9)))
+        for _, future in futures:
+            future.result(timeout=5)
+        stats = batcher.stats()
+        # 1 + 8 pendientes en lotes de como máximo 4
+        self.assertEqual(stats['batch_size_distribution'], {1: 1, 4: 2})
+        self.assertEqual((stats['total_batches'], stats['total_items'], stats['max_batch_size']), (3, 9, 4))
+        self.assertEqual(stats['avg_batch_size'], 3.0)
+
+
+@override_settings(
+    CACHES={'predictions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'scoring-tests'},
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'scoring-default'}},
+    ML_SCORING_CACHE_ENABLED=True,
+)
+class ScoringCacheTests(SimpleTestCase):
+    """Resultados de scoring por huella: redondeo, versión y campos propios del registro"""
+
+    def setUp(self):
+        caches['predictions'].clear()
+        scoring_cache.reset()
+        self.predictor = CardiovascularPredictor()
+        self.predictor.model = None  # Reglas: resultado determinista por features
+        self.records = _medical_records(10, seed=7)
+
+    def _predict_with_features(self, features_list, records=None):
+        records = records or self.records[:len(features_list)]
+        features_by_record = {id(record): features for record, features in zip(records, features_list)}
+        with mock.patch.object(self.predictor, '_extract_features',
+                               side_effect=lambda record: dict(features_by_record[id(record)])):
+            return self.predictor.predict_many(records)
+
+    def _features(self, index=0, **overrides):
+        features = self.predictor._extract_features(self.records[index])
+        features.update(overrides)
+        return features
+
+    def test_fingerprint_rounding(self):
+        canonical = canonical_features(self._features(imc=30.04, edad=61.4))
+        self.assertEqual((canonical['imc'], canonical['edad']), (30.0, 61.0))
+        self.assertEqual(feature_fingerprint(canonical, 'v1'),
+                         feature_fingerprint(canonical_features(self._features(imc=29.96, edad=60.6)), 'v1'))
+        self.assertNotEqual(feature_fingerprint(canonical, 'v1'),
+                            feature_fingerprint(canonical_features(self._features(imc=30.06, edad=61.4)), 'v1'))
+
+        # Se puntúa la huella: IMC 30.04 cuenta como 30.0, sobrepeso y no obesidad
+        result = self._predict_with_features([self._features(imc=30.04)])[0]
+        self.assertTrue(any(factor.startswith('Sobrepeso') for factor in result['factores_riesgo']))
+        self.assertFalse(any(factor.startswith('Obesidad') for factor in result['factores_riesgo']))
+        self.assertEqual(result['features_used']['imc'], 30.04)
+
+    def test_model_version_in_key(self):
+        canonical = canonical_features(self._features())
+        self.assertTrue(feature_fingerprint(canonical, 'v1').startswith('scoring:v1:'))
+        self.assertNotEqual(feature_fingerprint(canonical, 'v1'), feature_fingerprint(canonical, 'v2'))
+        self.assertEqual(self.predictor._scoring_version(), 'rules')
+
+        features = [self._features()]
+        for version, hits in (('v1', 0), ('v1', 1), ('v2', 1)):
+            with mock.patch.object(self.predictor, '_scoring_version', return_value=version):
+                self._predict_with_features(features)
+            self.assertEqual(scoring_cache.stats()['hits'], hits)
+
+    def test_record_fields_never_served_from_cache(self):
+        first = self._predict_with_features([self._features(imc=27.01)], self.records[:1])[0]
+        # Otro registro con la misma huella: sale de la caché con sus propias features y scores
+        second = self._predict_with_features([self._features(imc=27.04)], self.records[1:2])[0]
+        self.assertEqual(scoring_cache.stats()['hits'], 1)
+        self.assertEqual((first['features_used']['imc'], second['features_used']['imc']), (27.01, 27.04))
+        expected_scores = self.predictor._calculate_detailed_scores(second['features_used'], self.records[1])
+        expected_scores.update(self.predictor._clinical_scores([second['features_used']], [self.records[1]])[0])
+        self.assertEqual(second['scores_detallados'], expected_scores)
+
+        key = feature_fingerprint(canonical_features(self._features(imc=27.01)), 'rules')
+        stored = caches['predictions'].get(key)
+        self.assertIsNotNone(stored)
+        self.assertFalse(set(RECORD_FIELDS) & set(stored))
+
+    def test_cached_and_uncached_results_are_identical(self):
+        uncached = self.predictor.predict_many(self.records)
+        self.assertEqual(scoring_cache.stats()['hits'], 0)
+        cached = self.predictor.predict_many(self.records)
+        self.assertEqual(scoring_cache.stats()['hits'], len(self.records))
+        self.assertEqual(cached, uncached)
+        self.assertEqual(self.predictor.predict_cardiovascular_risk(self.records[0]), uncached[0])
+
+
+def _legacy_fallback(features):
+    """Cadena if/elif de CardiovascularPredictor._rule_based_prediction antes de FALLBACK_RULES"""
+    risk_score = 0
+    risk_factors = []
+    if features['edad'] > 65:
+        risk_score += 25
+        risk_factors.append(f"Edad avanzada ({features['edad']:.0f} años)")
+    elif features['edad'] > 45:
+        risk_score += 15
+        risk_factors.append(f"Edad media ({features['edad']:.0f} años)")
+    if features['imc'] > 30:
+        risk_score += 20
+        risk_factors.append(f"Obesidad (IMC: {features['imc']:.1f})")
+    elif features['imc'] > 25:
+        risk_score += 10
+        risk_factors.append(f"Sobrepeso (IMC: {features['imc']:.1f})")
+    if features['presion_sistolica'] > 140 or features['presion_diastolica'] > 90:
+        risk_score += 25
+        risk_factors.append(f"Hipertensión ({features['presion_sistolica']:.0f}/{features['presion_diastolica']:.0f})")
+    elif features['presion_sistolica'] > 130 or features['presion_diastolica'] > 80:
+        risk_score += 15
+        risk_factors.append(f"Presión elevada ({features['presion_sistolica']:.0f}/{features['presion_diastolica']:.0f})")
+    if features['colesterol'] > 240:
+        risk_score += 20
+        risk_factors.append(f"Colesterol alto ({features['colesterol']:.0f})")
+    elif features['colesterol'] > 200:
+        risk_score += 10
+        risk_factors.append(f"Colesterol borderline ({features['colesterol']:.0f})")
+    if features['glucosa'] > 126:
+        risk_score += 20
+        risk_factors.append(f"Glucosa elevada ({features['glucosa']:.0f})")
+    elif features['glucosa'] > 100:
+        risk_score += 10
+        risk_factors.append(f"Glucosa alterada ({features['glucosa']:.0f})")
+    if features['indice_paquetes'] > 10:
+        risk_score += 20
+        risk_factors.append(f"Tabaquismo intenso ({features['indice_paquetes']:.1f} paquetes/año)")
+    elif features['indice_paquetes'] > 0:
+        risk_score += 10
+        risk_factors.append(f"Tabaquismo ({features['indice_paquetes']:.1f} paquetes/año)")
+    if features['antecedentes_encoded'] > 0:
+        risk_score += 15
+        risk_factors.append("Antecedentes cardíacos familiares")
+
+    if risk_score >= 40:
+        risk_level, probability = 'ALTO', 85.0
+    elif risk_score >= 20:
+        risk_level, probability = 'MEDIO', 60.0
+    else:
+        risk_level, probability = 'BAJO', 25.0
+    return risk_score, risk_level, probability, risk_factors
+
+
+def _legacy_ml_service(features):
+    """Cadena if/elif de CardiovascularMLService antes de ML_SERVICE_RULES"""
+    risk_score = 0
+    risk_factors = []
+    if features['edad'] > 65:
+        risk_score += 25
+        risk_factors.append("Edad avanzada (>65 años)")
+    elif features['edad'] > 45:
+        risk_score += 15
+        risk_factors.append("Edad de riesgo (45-65 años)")
+    if features['imc'] > 30:
+        risk_score += 20
+        risk_factors.append("Obesidad (IMC > 30)")
+    elif features['imc'] > 25:
+        risk_score += 10
+        risk_factors.append("Sobrepeso (IMC 25-30)")
+    if features['presion_sistolica'] > 140:
+        risk_score += 25
+        risk_factors.append("Hipertensión arterial")
+    elif features['presion_sistolica'] > 120:
+        risk_score += 15
+        risk_factors.append("Presión arterial elevada")
+    if features['colesterol'] > 240:
+        risk_score += 15
+        risk_factors.append("Colesterol elevado")
+    elif features['colesterol'] > 200:
+        risk_score += 8
+        risk_factors.append("Colesterol borderline")
+    if features['glucosa'] > 126:
+        risk_score += 20
+        risk_factors.append("Diabetes mellitus")
+    elif features['glucosa'] > 100:
+        risk_score += 10
+        risk_factors.append("Glucosa elevada")
+    if features['indice_paquetes'] > 20:
+        risk_score += 25
+        risk_factors.append("Tabaquismo severo")
+    elif features['indice_paquetes'] > 10:
+        risk_score += 15
+        risk_factors.append("Tabaquismo moderado")
+    elif features['indice_paquetes'] > 0:
+        risk_score += 10
+        risk_factors.append("Consumo de tabaco")
+    if features['actividad_fisica_encoded'] == 0:
+        risk_score += 10
+        risk_factors.append("Sedentarismo")
+    if features['antecedentes_encoded'] == 1:
+        risk_score += 15
+        risk_factors.append("Antecedentes familiares cardiovasculares")
+    if features['sexo_encoded'] == 1 and features['edad'] > 45:
+        risk_score += 10
+    elif features['sexo_encoded'] == 0 and features['edad'] > 55:
+        risk_score += 10
+
+    probability = min(risk_score, 95)
+    if probability < 30:
+        risk_level = 'Bajo'
+    elif probability < 60:
+        risk_level = 'Medio'
+    else:
+        risk_level = 'Alto'
+    return risk_score, risk_level, probability, risk_factors
+
+
+class RuleTableParityTests(SimpleTestCase):
+    """FALLBACK_RULES y ML_SERVICE_RULES reproducen las cadenas if/elif a las que sustituyen"""
+
+    # Valores a ambos lados de cada umbral de las dos tablas
+    EDGE_VALUES = {
+        'edad': [30, 45, 45.5, 55, 55.5, 65, 65.5, 80],
+        'imc': [22.0, 25.0, 25.04, 30.0, 30.04, 38.0],
+        'presion_sistolica': [110, 120, 121, 130, 131, 140, 141, 180],
+        'presion_diastolica': [70, 80, 81, 90, 91, 110],
+        'colesterol': [180, 200, 200.5, 240, 240.5, 300],
+        'glucosa': [90, 100, 100.5, 126, 126.5, 200],
+        'indice_paquetes': [0.0, 0.5, 10.0, 10.5, 20.0, 20.5, 40.0],
+        'actividad_fisica_encoded': [0, 1, 2, 3],
+        'sexo_encoded': [0, 1],
+        'antecedentes_encoded': [0, 0.5, 1],
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = random.Random(11)
+        cls.rows = [{name: rng.choice(values) for name, values in cls.EDGE_VALUES.items()} for _ in range(4000)]
+
+    def _evaluations(self, table):
+        """Evaluación vectorizada (lote completo) y escalar (lotes de menos de VECTORIZE_MIN_ROWS)"""
+        vectorized = table.evaluate_records(self.rows)
+        size = table.VECTORIZE_MIN_ROWS - 1
+        chunks = [table.evaluate_records(self.rows[start:start + size]) for start in range(0, len(self.rows), size)]
+        scalar = [(chunk, index) for chunk in chunks for index in range(len(chunk))]
+        return [(vectorized, index) for index in range(len(self.rows))], scalar
+
+    def test_fallback_rules(self):
+        for path in self._evaluations(FALLBACK_RULES):
+            for features, (evaluation, index) in zip(self.rows, path):
+                level = evaluation.level(index)
+                self.assertEqual(
+                    (evaluation.score(index), level.name, level.probability, evaluation.factors(index, features)),
+                    _legacy_fallback(features), features,
+                )
+
+    def test_ml_service_rules(self):
+        for path in self._evaluations(ML_SERVICE_RULES):
+            for features, (evaluation, index) in zip(self.rows, path):
+                score = evaluation.score(index)
+                self.assertEqual(
+                    (score, evaluation.level(index).name, min(score, 95), evaluation.factors(index, features)),
+                    _legacy_ml_service(features), features,
+                )
+
+
+class InferencePoolTests(SimpleTestCase):
+    """Pool de procesos de inferencia frente al modelo cargado en proceso"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        model_path = os.path.join(settings.ML_MODELS_PATH, 'cardiovascular_model.joblib')
+        scaler_path = os.path.join(settings.ML_MODELS_PATH, 'scaler.pkl')
+        # Lotes de 16 filas: una matriz de 50 se reparte entre los dos procesos
+        cls.pool = InferencePool(model_path, scaler_path, processes=2, max_rows=16)
+        cls.addClassCleanup(cls.pool.shutdown)
+        cls.model = joblib.load(model_path)
+        cls.scaler = joblib.load(scaler_path)
+        cls.X = np.random.default_rng(0).uniform(0, 200, (50, cls.pool.n_features))
+
+    def _expected(self, X):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            return self.model.predict_proba(self.scaler.transform(X))
+
+    def _assert_healthy(self):
+        stats = self.pool.stats()
+        self.assertEqual((stats['processes'], stats['alive'], stats['idle']), (2, 2, 2))
+        np.testing.assert_array_equal(self.pool.predict_proba(self.X), self._expected(self.X))
+
+    def test_matches_in_process_model(self):
+        np.testing.assert_array_equal(self.pool.predict_proba(self.X), self._expected(self.X))
+        np.testing.assert_array_equal(self.pool.predict_proba(self.X[0]), self._expected(self.X[:1]))
+        np.testing.assert_array_equal(self.pool.predict(self.X), self.model.classes_[self._expected(self.X).argmax(axis=1)])
+
+    def test_wrong_feature_count(self):
+        with self.assertRaises(ValueError):
+            self.pool.predict_proba(self.X[:, :-1])
+
+    def test_model_error_keeps_workers(self):
+        with self.assertRaises(RuntimeError):
+            self.pool.predict_proba(np.full((40, self.pool.n_features), np.nan))
+        self._assert_healthy()
+
+    def test_dead_worker_is_replaced(self):
+        worker = self.pool._workers[0]
+        worker.process.kill()
+        worker.process.join()
+        with self.assertRaises((OSError, EOFError)):
+            self.pool.predict_proba(self.X)
+        self.assertNotIn(worker, self.pool._workers)
+        self._assert_healthy()
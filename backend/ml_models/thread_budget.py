@@ -0,0 +1,150 @@
+"""
+Presupuesto de hilos de cómputo por proceso
+
+xgboost, los kernels OpenMP de scikit-learn y la BLAS de NumPy crean cada uno
+su propio pool de hilos, por defecto uno por núcleo. Con workers gunicorn
+gthread o Celery con concurrencia > 1, cada petición concurrente usa todos
+los pools a la vez y los núcleos quedan sobresuscritos.
+
+El presupuesto se define en settings (ML_MODEL_THREADS, ML_OPENMP_THREADS,
+ML_BLAS_THREADS; sin valor se respetan los de cada biblioteca) y se aplica:
+  - una vez por proceso, antes de la primera carga de modelos
+    (`apply_process_budget`, desde LazyModelsMixin y el pool de inferencia)
+  - a cada artefacto que deserializa el registro (`configure_model_threads`:
+    `nthread` de xgboost, `n_jobs` de sklearn)
+  - a las sesiones de onnxruntime (`intra_op_num_threads`)
+
+Regla práctica: hilos de petición del worker × ML_MODEL_THREADS ≤ núcleos
+asignados al proceso. `bench_concurrency` mide el throughput según ambos.
+"""
+
+import logging
+import os
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger('cardiovascular')
+
+# Variables de entorno que leen las bibliotecas nativas al inicializarse
+OPENMP_ENV_VARS = ('OMP_NUM_THREADS',)
+BLAS_ENV_VARS = ('OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS')
+
+_applied_pid = None
+_apply_lock = threading.Lock()
+
+
+def _env_threads(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+@dataclass(frozen=True)
+class ThreadBudget:
+    """Hilos por proceso de cada biblioteca (None = valor por defecto de la biblioteca)"""
+    model_threads: Optional[int] = None    # xgboost nthread / sklearn n_jobs / onnxruntime intra-op
+    openmp_threads: Optional[int] = None
+    blas_threads: Optional[int] = None
+
+    @classmethod
+    def from_settings(cls) -> 'ThreadBudget':
+        """
+        Presupuesto configurado. Los procesos sin Django configurado (pool de
+        inferencia con spawn) leen las mismas variables de entorno que settings.
+        """
+        from django.conf import settings
+
+        if settings.configured:
+            return cls(
+                model_threads=getattr(settings, 'ML_MODEL_THREADS', None),
+                openmp_threads=getattr(settings, 'ML_OPENMP_THREADS', None),
+                blas_threads=getattr(settings, 'ML_BLAS_THREADS', None),
+            )
+        return cls(
+            model_threads=_env_threads('ML_MODEL_THREADS'),
+            openmp_threads=_env_threads('ML_OPENMP_THREADS'),
+            blas_threads=_env_threads('ML_BLAS_THREADS'),
+        )
+
+    def as_dict(self) -> Dict[str, Optional[int]]:
+        return asdict(self)
+
+
+def _limit_threadpools(budget: ThreadBudget):
+    """Limita los pools OpenMP/BLAS ya cargados en el proceso (threadpoolctl)"""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        logger.warning("threadpoolctl no disponible: el presupuesto de hilos solo se aplica vía entorno")
+        return
+
+    if budget.openmp_threads:
+        threadpool_limits(limits=budget.openmp_threads, user_api='openmp')
+    if budget.blas_threads:
+        threadpool_limits(limits=budget.blas_threads, user_api='blas')
+
+
+def apply_process_budget(budget: Optional[ThreadBudget] = None, force: bool = False) -> ThreadBudget:
+    """
+    Aplica el presupuesto de OpenMP/BLAS al proceso actual (una vez por PID).
+
+    Las variables de entorno cubren las bibliotecas que aún no se han
+    inicializado y los procesos hijos; threadpoolctl, los pools ya cargados.
+    """
+    global _applied_pid
+
+    budget = budget or ThreadBudget.from_settings()
+    with _apply_lock:
+        if _applied_pid == os.getpid() and not force:
+            return budget
+
+        for names, threads in ((OPENMP_ENV_VARS, budget.openmp_threads), (BLAS_ENV_VARS, budget.blas_threads)):
+            if threads:
+                for name in names:
+                    os.environ[name] = str(threads)
+        _limit_threadpools(budget)
+
+        _applied_pid = os.getpid()
+
+    if any(budget.as_dict().values()):
+        logger.info(f"Presupuesto de hilos aplicado (pid {os.getpid()}): {budget.as_dict()}")
+    return budget
+
+
+def configure_model_threads(obj: Any, model_threads: Optional[int] = None) -> Any:
+    """
+    Fija los hilos de inferencia de un artefacto deserializado: `n_jobs`
+    (que xgboost traslada al `nthread` del booster) en el propio estimador o
+    en cada paso de un Pipeline. Los objetos sin esos parámetros no cambian.
+    """
+    if model_threads is None:
+        model_threads = ThreadBudget.from_settings().model_threads
+    if not model_threads:
+        return obj
+
+    steps = getattr(obj, 'steps', None)
+    estimators = [step for _, step in steps] if steps is not None else [obj]
+    for estimator in estimators:
+        try:
+            if hasattr(estimator, 'get_booster'):
+                estimator.set_params(n_jobs=model_threads)
+                estimator.get_booster().set_param('nthread', model_threads)
+            elif hasattr(estimator, 'n_jobs'):
+                estimator.n_jobs = model_threads
+        except Exception as e:
+            logger.warning(f"No se pudo fijar el número de hilos de {estimator.__class__.__name__}: {e}")
+    return obj
+
+
+def threadpool_summary() -> Dict[str, Any]:
+    """Pools de hilos nativos cargados y su tamaño actual"""
+    try:
+        from threadpoolctl import threadpool_info
+    except ImportError:
+        return {}
+
+    summary = {}
+    for pool in threadpool_info():
+        key = f"{pool['user_api']}:{pool['internal_api']}"
+        summary[key] = max(summary.get(key, 0), pool['num_threads'])
+    return summary
@@ -0,0 +1,122 @@
+"""
+Spans de latencia por etapa del pipeline de predicción
+
+`span('predictor.predict_proba')` mide un bloque y acumula su duración en
+el histograma de esa etapa (compartido por el proceso). Si además hay una
+traza activa en el contexto (`trace()`, una por petición), el span queda
+registrado en ella para construir la cabecera `Server-Timing`.
+
+Los hilos de fondo (p. ej. el micro-batcher) no heredan la traza de la
+petición: sus spans solo alimentan los histogramas.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from ml_models.batching import latency_percentiles
+
+# Límites superiores (ms) de los intervalos del histograma; el último es +inf
+BUCKET_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Muestras recientes por etapa para los percentiles
+MAX_SAMPLES = 1000
+
+
+class StageHistogram:
+    """Histograma de duraciones de una etapa con muestras recientes para percentiles"""
+
+    def __init__(self, max_samples: int = MAX_SAMPLES):
+        self.bucket_counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.samples = deque(maxlen=max_samples)
+
+    def record(self, duration_ms: float):
+        self.bucket_counts[bisect_left(BUCKET_BOUNDS_MS, duration_ms)] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.samples.append(duration_ms)
+
+    def as_dict(self) -> Dict[str, Any]:
+        buckets = [
+            {'le': bound, 'count': count}
+            for bound, count in zip(BUCKET_BOUNDS_MS + ('+inf',), self.bucket_counts)
+        ]
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'total_ms': round(self.total_ms, 3),
+            **latency_percentiles(list(self.samples)),
+            'buckets': buckets,
+        }
+
+
+class StageMetrics:
+    """Histogramas por nombre de etapa"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, StageHistogram] = {}
+
+    def record(self, stage: str, duration_ms: float):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = StageHistogram()
+            histogram.record(duration_ms)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {stage: histogram.as_dict() for stage, histogram in sorted(self._stages.items())}
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+
+class Trace:
+    """Spans de una petición, en el orden en que terminaron"""
+
+    def __init__(self):
+        self.spans: List[Tuple[str, float]] = []
+
+    def server_timing(self) -> str:
+        """Valor de la cabecera Server-Timing (duraciones en ms)"""
+        return ', '.join(
+            f"{stage.replace('.', '-')};dur={duration_ms:.2f}" for stage, duration_ms in self.spans
+        )
+
+
+stage_metrics = StageMetrics()
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('prediction_trace', default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """Mide el bloque y lo registra en el histograma de `stage` (y en la traza activa)"""
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - started_at) * 1000
+        stage_metrics.record(stage, duration_ms)
+        current = _current_trace.get()
+        if current is not None:
+            current.spans.append((stage, duration_ms))
+
+
+@contextmanager
+def trace():
+    """Abre una traza para los spans del contexto actual (una por petición)"""
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
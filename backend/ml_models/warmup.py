@@ -0,0 +1,197 @@
+"""
+Calentamiento de modelos de ML y estado de readiness
+
+La carga de modelos es diferida (ver LazyModelsMixin); sin calentamiento, la
+primera predicción de cada worker nuevo paga la deserialización de los
+artefactos y la inicialización de los pools nativos de xgboost/sklearn, lo
+que en un despliegue gradual se nota como un pico de latencia.
+
+`warm_up_models()` carga los modelos de los consumidores y ejecuta unas
+predicciones de prueba por cada camino (ML, reglas, scores detallados y
+clínicos) con registros sin guardar. `warmup_state` guarda el resultado:
+`ready_check_view` responde 503 hasta que el calentamiento termina e informa
+su duración en el payload.
+"""
+
+import logging
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger('cardiovascular')
+
+# Perfiles de los registros de prueba: riesgo bajo, medio y alto
+WARMUP_SAMPLES = (
+    {'sexo': 'F', 'edad': 32, 'peso': 60.0, 'altura': 165.0, 'presion_sistolica': 115,
+     'presion_diastolica': 75, 'colesterol': 170.0, 'glucosa': 85.0, 'cigarrillos_dia': 0,
+     'anos_tabaquismo': 0, 'actividad_fisica': 'intenso', 'antecedentes_cardiacos': 'no', 'diabetes': False},
+    {'sexo': 'M', 'edad': 54, 'peso': 84.0, 'altura': 172.0, 'presion_sistolica': 138,
+     'presion_diastolica': 88, 'colesterol': 225.0, 'colesterol_hdl': 42.0, 'glucosa': 108.0,
+     'cigarrillos_dia': 5, 'anos_tabaquismo': 10, 'actividad_fisica': 'ligero',
+     'antecedentes_cardiacos': 'desconoce', 'diabetes': False},
+    {'sexo': 'M', 'edad': 71, 'peso': 98.0, 'altura': 168.0, 'presion_sistolica': 172,
+     'presion_diastolica': 101, 'colesterol': 285.0, 'colesterol_hdl': 33.0, 'trigliceridos': 240.0,
+     'glucosa': 160.0, 'cigarrillos_dia': 20, 'anos_tabaquismo': 35, 'actividad_fisica': 'sedentario',
+     'antecedentes_cardiacos': 'si', 'diabetes': True},
+)
+
+PATIENT_FIELDS = ('sexo', 'peso', 'altura')
+
+
+class WarmupState:
+    """Estado del calentamiento del proceso (pending -> running -> done/failed)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = 'pending'
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+        self.steps: Dict[str, float] = {}
+        self.error: Optional[str] = None
+
+    def start(self) -> bool:
+        """Marca el inicio; False si otro hilo ya lo está ejecutando o terminó"""
+        with self._lock:
+            if self.status != 'pending':
+                return False
+            self.status = 'running'
+            self.started_at = time.time()
+            return True
+
+    def finish(self, duration_ms: float, steps: Dict[str, float], error: Optional[str] = None):
+        with self._lock:
+            self.status = 'failed' if error else 'done'
+            self.finished_at = time.time()
+            self.duration_ms = round(duration_ms, 2)
+            self.steps = steps
+            self.error = error
+
+    @property
+    def completed(self) -> bool:
+        """
+        El calentamiento terminó. Un fallo también cuenta: el predictor sigue
+        respondiendo con el sistema de reglas y el error queda en el payload.
+        """
+        return self.status in ('done', 'failed')
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'status': self.status,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'duration_ms': self.duration_ms,
+                'steps_ms': dict(self.steps),
+                'error': self.error,
+            }
+
+
+warmup_state = WarmupState()
+
+
+def warmup_records() -> List[Any]:
+    """Registros médicos sin guardar a partir de WARMUP_SAMPLES"""
+    from apps.patients.models import MedicalRecord, Patient
+
+    today = date.today()
+    records = []
+    for sample in WARMUP_SAMPLES:
+        patient = Patient(
+            fecha_nacimiento=date(today.year - sample['edad'], today.month, min(today.day, 28)),
+            **{field: sample[field] for field in PATIENT_FIELDS},
+        )
+        records.append(MedicalRecord(
+            patient=patient,
+            **{field: value for field, value in sample.items() if field not in PATIENT_FIELDS},
+        ))
+    return records
+
+
+def _run_step(steps: Dict[str, float], name: str, function):
+    start_time = time.perf_counter()
+    try:
+        return function()
+    finally:
+        steps[name] = round((time.perf_counter() - start_time) * 1000, 2)
+
+
+def warm_up_models() -> Dict[str, Any]:
+    """
+    Carga los modelos y ejecuta predicciones de prueba por cada camino.
+    Se ejecuta una vez por proceso; las llamadas siguientes devuelven el
+    estado existente.
+    """
+    if not warmup_state.start():
+        return warmup_state.as_dict()
+
+    from apps.predictions.services import PredictionService
+    from ml_models.cardiovascular_predictor_clean import cardiovascular_predictor
+    from ml_models.features import feature_pipeline
+    from ml_models.registry import model_registry
+    from ml_models.scoring_cache import scoring_cache
+    from ml_models.timing import stage_metrics
+
+    steps: Dict[str, float] = {}
+    error = None
+    start_time = time.perf_counter()
+    records = []
+    try:
+        def load_models():
+            cardiovascular_predictor.ensure_models_loaded()
+            PredictionService().ensure_models_loaded()
+
+        _run_step(steps, 'load_models', load_models)
+        records = warmup_records()
+        features_list = _run_step(
+            steps, 'features', lambda: [cardiovascular_predictor._extract_features(record) for record in records],
+        )
+
+        # Camino ML (individual y por lotes); sin modelo el predictor usa reglas.
+        # Sin caché de scoring: un acierto dejaría el modelo sin ejecutar
+        if cardiovascular_predictor.model is not None:
+            def ml_step():
+                with scoring_cache.bypass():
+                    cardiovascular_predictor.predict_cardiovascular_risk(records[0])
+                    cardiovascular_predictor.predict_many(records)
+
+            _run_step(steps, 'ml', ml_step)
+
+        _run_step(steps, 'rules', lambda: (
+            cardiovascular_predictor._rule_based_prediction(features_list[0], records[0]),
+            cardiovascular_predictor._rule_based_predictions_batch(features_list, records),
+        ))
+        _run_step(steps, 'scores', lambda: (
+            [cardiovascular_predictor._calculate_detailed_scores(features, record)
+             for features, record in zip(features_list, records)],
+            cardiovascular_predictor._clinical_scores(features_list, records),
+        ))
+    except Exception as e:
+        error = f"{e.__class__.__name__}: {e}"
+        logger.error(f"Error en el calentamiento de modelos: {e}")
+    finally:
+        # Los registros de prueba no deben ocupar la caché de features ni
+        # sesgar los histogramas de latencia de las peticiones reales
+        for record in records:
+            feature_pipeline.invalidate(record.id, record.patient.id)
+        stage_metrics.reset()
+
+    duration_ms = (time.perf_counter() - start_time) * 1000
+    warmup_state.finish(duration_ms, steps, error)
+    stats = model_registry.stats()
+    logger.info(f"Calentamiento de modelos completado en {duration_ms:.1f}ms "
+                f"({stats['loaded_artifacts']} artefactos, pasos {steps})")
+
+    return {**warmup_state.as_dict(), 'loaded_artifacts': stats['loaded_artifacts']}
+
+
+def start_warm_up() -> bool:
+    """
+    Lanza el calentamiento en un hilo de fondo para que el worker responda a
+    los health checks mientras tanto. Devuelve False si ya se había lanzado.
+    """
+    if warmup_state.status != 'pending':
+        return False
+    threading.Thread(target=warm_up_models, name='ml-warmup', daemon=True).start()
+    return True